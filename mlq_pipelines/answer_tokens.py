@@ -0,0 +1,34 @@
+"""
+Token ids used to score short VLM answers ("Yes"/"No", "first"/"second") from first-token logits.
+
+Kept free of torch so the tokenizer handling can be tested without a model.
+"""
+from collections import Counter
+from typing import Any, List, Sequence
+
+def first_word_token(tokenizer: Any, text: str) -> Any:
+    """First token of `text` that isn't only whitespace, e.g. "Yes" rather than a bare "▁" piece."""
+    for token in tokenizer(text, add_special_tokens=False).input_ids:
+        if tokenizer.decode([token]).strip():
+            return token
+    return None
+
+def candidate_token_ids(tokenizer: Any, candidates: Sequence[str]) -> List[List[int]]:
+    """
+    For each candidate, the first-token ids whose probabilities are summed to score it.
+
+    SentencePiece encodes a candidate at the start of an answer either with or without a
+    leading space, so both spellings are tried. Ids produced by more than one candidate are
+    dropped: a shared id would add the same mass to every candidate and pull the scores toward
+    uniform.
+    """
+    ids = [
+        {token for token in (first_word_token(tokenizer, text) for text in (candidate, " " + candidate)) if token is not None}
+        for candidate in candidates
+    ]
+    counts = Counter(token for candidate_ids in ids for token in candidate_ids)
+    unique = [sorted(token for token in candidate_ids if counts[token] == 1) for candidate_ids in ids]
+    for candidate, candidate_ids in zip(candidates, unique):
+        if not candidate_ids:
+            raise ValueError(f"Candidate {candidate!r} has no first token that the other candidates don't share")
+    return unique
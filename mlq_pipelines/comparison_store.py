@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from pipelines.cache import file_digest
+
+class ComparisonStore:
+    """
+    Persistent store of pairwise judgments keyed by (content hash a, content hash b, question, model).
+
+    Each pair is stored once, in hash order, as the probability that the first image ranks ahead
+    together with how many judgments were averaged into it. Confident results also form a
+    "ranks ahead of" graph per (question, model), so an unasked pair whose order follows
+    transitively (a > c > b) can be answered without calling the VLM.
+    """
+    def __init__(self, path: str, threshold: float = 0.75):
+        self.path = path
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS comparisons ("
+                "a TEXT NOT NULL, b TEXT NOT NULL, question TEXT NOT NULL, model TEXT NOT NULL, "
+                "probability REAL NOT NULL, count INTEGER NOT NULL, updated REAL NOT NULL, "
+                "PRIMARY KEY (a, b, question, model))"
+            )
+        self.graphs: Dict[Tuple[str, str], Dict[str, Set[str]]] = {}
+        self.hits = 0
+        self.implied = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_key(item: Any) -> str:
+        path = os.fspath(item) if isinstance(item, os.PathLike) else item
+        if isinstance(path, str) and os.path.isfile(path):
+            return file_digest(path)
+        return str(item)
+
+    def lookup(self, a: str, b: str, question: str, model: str) -> Optional[Tuple[float, int]]:
+        first, second = (a, b) if a <= b else (b, a)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT probability, count FROM comparisons WHERE a = ? AND b = ? AND question = ? AND model = ?",
+                (first, second, question, model),
+            ).fetchone()
+        if row is None:
+            return None
+        probability, count = row
+        return (probability if first == a else 1 - probability), count
+
+    def get(self, a: Any, b: Any, question: str, model: str) -> Optional[float]:
+        """Stored probability that a ranks ahead of b, or None if the pair was never judged."""
+        found = self.lookup(self.content_key(a), self.content_key(b), question, model)
+        return None if found is None else found[0]
+
+    def put(self, a: Any, b: Any, question: str, model: str, probability: float):
+        """Record a judgment; repeated judgments of a pair are averaged."""
+        a, b = self.content_key(a), self.content_key(b)
+        if a > b:
+            a, b, probability = b, a, 1 - probability
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT probability, count FROM comparisons WHERE a = ? AND b = ? AND question = ? AND model = ?",
+                (a, b, question, model),
+            ).fetchone()
+            count = 1
+            if row is not None:
+                count = row[1] + 1
+                probability = (row[0] * row[1] + probability) / count
+            self.connection.execute(
+                "INSERT OR REPLACE INTO comparisons (a, b, question, model, probability, count, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (a, b, question, model, probability, count, time.time()),
+            )
+        graph = self.graphs.get((question, model))
+        if graph is not None:
+            self.add_edge(graph, a, b, probability)
+
+    def add_edge(self, graph: Dict[str, Set[str]], a: str, b: str, probability: float):
+        graph.get(a, set()).discard(b)
+        graph.get(b, set()).discard(a)
+        if probability >= self.threshold:
+            graph.setdefault(a, set()).add(b)
+        elif probability <= 1 - self.threshold:
+            graph.setdefault(b, set()).add(a)
+
+    def graph(self, question: str, model: str) -> Dict[str, Set[str]]:
+        graph = self.graphs.get((question, model))
+        if graph is None:
+            graph = {}
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT a, b, probability FROM comparisons WHERE question = ? AND model = ?", (question, model)
+                ).fetchall()
+            for a, b, probability in rows:
+                self.add_edge(graph, a, b, probability)
+            self.graphs[(question, model)] = graph
+        return graph
+
+    def reaches(self, graph: Dict[str, Set[str]], start: str, goal: str) -> bool:
+        seen, queue = {start}, deque([start])
+        while queue:
+            node = queue.popleft()
+            for successor in graph.get(node, ()):
+                if successor == goal:
+                    return True
+                if successor not in seen:
+                    seen.add(successor)
+                    queue.append(successor)
+        return False
+
+    def infer(self, a: Any, b: Any, question: str, model: str) -> Optional[float]:
+        """
+        1.0 or 0.0 if stored confident judgments imply the order of a and b, else None
+        (including when contradictory judgments imply both orders).
+        """
+        a, b = self.content_key(a), self.content_key(b)
+        graph = self.graph(question, model)
+        ahead, behind = self.reaches(graph, a, b), self.reaches(graph, b, a)
+        if ahead == behind:
+            return None
+        return 1.0 if ahead else 0.0
+
+    async def get_or_compare(self, a: Any, b: Any, question: str, model: str, compare: Callable[[], Awaitable[float]],
+                             infer: bool = True) -> float:
+        """Probability that a ranks ahead of b: stored, else implied (if `infer`), else from `compare` and stored."""
+        probability = self.get(a, b, question, model)
+        if probability is not None:
+            self.hits += 1
+            return probability
+        if infer:
+            probability = self.infer(a, b, question, model)
+            if probability is not None:
+                self.implied += 1
+                return probability
+        self.misses += 1
+        probability = await compare()
+        self.put(a, b, question, model, probability)
+        return probability
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM comparisons").fetchone()[0]
+        lookups = self.hits + self.implied + self.misses
+        return {
+            "hits": self.hits,
+            "implied": self.implied,
+            "misses": self.misses,
+            "saved_rate": (self.hits + self.implied) / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+_stores: Dict[str, ComparisonStore] = {}
+
+def open_comparison_store(path: str) -> ComparisonStore:
+    """One shared store per database file."""
+    path = os.path.abspath(path)
+    if path not in _stores:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _stores[path] = ComparisonStore(path)
+    return _stores[path]
@@ -0,0 +1,121 @@
+"""
+Cached loading of config and prompt files.
+
+Scripts read `txt2img/sdwebui_config.json`, question and prompt files in their hot loops. A
+`ConfigFiles` instance parses each file once and keeps the result until the file's mtime or
+size changes, so edits are still picked up on the next call (hot reload) for the cost of a
+stat. With `check_interval` set, even the stat is skipped for that many seconds.
+
+The t2i, vlm and sort modules read through the module-level helpers below, which use the shared
+`config_files` instance; swap it with `set_config_files` (e.g. to read from another directory or
+to recheck files less often).
+"""
+import glob as globlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SDWEBUI_CONFIG = "txt2img/sdwebui_config.json"
+SORT_QUESTION = "txt2img/q.txt"
+
+def read_text(path: str) -> str:
+    with open(path, 'r') as file:
+        return file.read()
+
+def read_json(path: str) -> Any:
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def read_lines(path: str) -> List[str]:
+    return read_text(path).split('\n')
+
+class ConfigFiles:
+    def __init__(self, root: Optional[str] = None, check_interval: float = 0.0):
+        self.root = root
+        self.check_interval = check_interval
+        self.entries: Dict[Tuple[str, Callable], Tuple[Tuple[int, int], float, Any]] = {}
+        self.globbers: Dict[str, Callable[[str], List[str]]] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def resolve(self, path: str) -> str:
+        return path if self.root is None or os.path.isabs(path) else os.path.join(self.root, path)
+
+    def load(self, path: str, parse: Callable[[str], Any] = read_text) -> Any:
+        """Parsed contents of `path`, re-parsed only when the file has changed."""
+        return self.load_resolved(self.resolve(path), parse)
+
+    def load_resolved(self, path: str, parse: Callable[[str], Any]) -> Any:
+        key = (path, parse)
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and now - entry[1] < self.check_interval:
+            self.hits += 1
+            return entry[2]
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        if entry is not None and entry[0] == version:
+            self.entries[key] = (version, now, entry[2])
+            self.hits += 1
+            return entry[2]
+        value = parse(path)
+        with self.lock:
+            self.entries[key] = (version, now, value)
+            self.loads += 1
+        return value
+
+    def text(self, path: str) -> str:
+        return self.load(path, read_text)
+
+    def json(self, path: str) -> Any:
+        """Parsed JSON. The object is shared between callers: copy it before modifying it."""
+        return self.load(path, read_json)
+
+    def lines(self, path: str) -> List[str]:
+        return self.load(path, read_lines)
+
+    def glob(self, pattern: str) -> List[str]:
+        """glob.glob, cached until the directory containing the matches changes."""
+        pattern = self.resolve(pattern)
+        parse = self.globbers.get(pattern)
+        if parse is None:
+            # One parse function per pattern, so each pattern has its own cache entry
+            parse = self.globbers.setdefault(pattern, lambda _: sorted(globlib.glob(pattern)))
+        return self.load_resolved(os.path.dirname(pattern) or ".", parse)
+
+    def invalidate(self, path: Optional[str] = None):
+        """Forget cached contents (of one file, or of everything) so the next read re-parses."""
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+            else:
+                path = self.resolve(path)
+                for key in [key for key in self.entries if key[0] == path]:
+                    del self.entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "loads": self.loads, "entries": len(self.entries)}
+
+config_files = ConfigFiles()
+
+def set_config_files(files: ConfigFiles):
+    global config_files
+    config_files = files
+
+def sdwebui_config(path: str = SDWEBUI_CONFIG) -> Dict[str, Any]:
+    return config_files.json(path)
+
+def sort_question(path: str = SORT_QUESTION) -> str:
+    return config_files.text(path).strip()
+
+def config_text(path: str) -> str:
+    return config_files.text(path)
+
+def config_lines(path: str) -> List[str]:
+    return config_files.lines(path)
+
+def config_glob(pattern: str) -> List[str]:
+    return config_files.glob(pattern)
@@ -0,0 +1,121 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from PIL import Image
+
+MISS = object()
+
+def file_key(path: Any) -> Optional[Tuple[str, int, int]]:
+    """(absolute path, mtime, size) of a local file, or None for URLs, missing files and in-memory images."""
+    if not isinstance(path, str) or path.startswith(("http://", "https://")):
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+def nbytes(value: Any) -> int:
+    """Approximate memory held by a decoded image or tensor."""
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    if hasattr(value, "element_size") and hasattr(value, "nelement"):
+        return value.element_size() * value.nelement()
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(v) for v in value)
+    return 0
+
+class ImageCache:
+    """
+    In-process LRU cache of decoded images and preprocessed tensors, bounded by `max_bytes`.
+
+    Entries are keyed by the file's (path, mtime, size) plus whatever identifies the
+    transformation (e.g. the image processor config), so an edited file is decoded again.
+    """
+    def __init__(self, max_bytes: int = 1 << 30):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISS
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        size = nbytes(value)
+        with self.lock:
+            if size > self.max_bytes:
+                return
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_create(self, key: Optional[Hashable], create: Callable[[], Any]) -> Any:
+        # A None key (an uncacheable source such as a URL) always calls `create`
+        if key is None:
+            return create()
+        value = self.get(key)
+        if value is MISS:
+            value = create()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+        }
+
+# Shared by every llava_util entry point, so compare/filter_vlm/sort reuse each other's work
+image_cache = ImageCache(int(float(os.environ.get("VLM_IMAGE_CACHE_MB", 1024)) * (1 << 20)))
+
+def load_image_cached(path: Any, load: Callable[[str], Any], cache: ImageCache = None) -> Any:
+    """Decode `path` with `load`, reusing the decoded image while the file is unchanged."""
+    cache = cache or image_cache
+    key = file_key(path)
+    return cache.get_or_create(None if key is None else ("image",) + key, lambda: load(path))
+
+def process_image_cached(path: Any, processor_key: Hashable, load: Callable[[str], Any],
+                         process: Callable[[Any], Any], cache: ImageCache = None) -> Any:
+    """Preprocessed tensor for `path` under the processor identified by `processor_key`."""
+    cache = cache or image_cache
+    key = file_key(path)
+    if key is None:
+        # In-memory images (e.g. a GeneratedImage) carry their own preprocessed tensors
+        processed = getattr(path, "processed", None)
+        if processed is None:
+            return process(load(path))
+        if processor_key not in processed:
+            processed[processor_key] = process(load(path))
+        return processed[processor_key]
+    return cache.get_or_create(("tensor", processor_key) + key, lambda: process(load_image_cached(path, load, cache)))
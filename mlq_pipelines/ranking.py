@@ -0,0 +1,290 @@
+"""
+Round-based ranking with an expensive pairwise comparator.
+
+`rank` is a merge sort whose comparisons are issued concurrently wherever they are independent,
+so a batching comparator (e.g. a VLM behind a batched task or the VLM worker) sees whole rounds
+of comparisons at once. Both halves of every split are ranked concurrently and each merge splits
+itself into independent sub-merges: ~sqrt(m) pivots of the longer list are binary-searched into
+the other list concurrently, then the segments between pivots are merged concurrently. This
+keeps O(n log n) comparisons while the critical path is about log^2 n comparisons instead of the
+n log n of sequential binary insertion.
+"""
+import asyncio
+import math
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# `before(a, b)` resolves to True when a ranks ahead of b
+Before = Callable[[Any, Any], Awaitable[bool]]
+
+async def insertion_point(item: Any, ranked: List[Any], before: Before) -> int:
+    """Index in `ranked` at which `item` belongs (binary search)."""
+    low, high = 0, len(ranked)
+    while low < high:
+        mid = (low + high) // 2
+        if await before(item, ranked[mid]):
+            high = mid
+        else:
+            low = mid + 1
+    return low
+
+async def unranked(items: List[Any]) -> List[Any]:
+    return items
+
+async def merge(x: List[Any], y: List[Any], before: Before, top_k: int = -1) -> List[Any]:
+    """Merge two ranked lists, running independent comparisons concurrently."""
+    if not x or not y:
+        return x + y
+    if len(x) < len(y):
+        x, y = y, x
+    # Pivots from the longer list; with one or two elements every element is a pivot
+    step = max(1, math.isqrt(len(x))) if len(x) > 2 else 1
+    pivots = list(range(0, len(x), step))
+    positions = await asyncio.gather(*[insertion_point(x[i], y, before) for i in pivots])
+    # An inconsistent comparator could place later pivots earlier; keep the split points ordered
+    for j in range(1, len(positions)):
+        positions[j] = max(positions[j], positions[j - 1])
+    ends = pivots[1:] + [len(x)]
+    y_ends = positions[1:] + [len(y)]
+    segments = []
+    for j, i in enumerate(pivots):
+        seg_x, seg_y = x[i + 1:ends[j]], y[positions[j]:y_ends[j]]
+        # Output index at which this segment starts: the pivot's position plus one
+        start = positions[j] + i + 1
+        if top_k > 0 and start >= top_k:
+            # Past the top k; its order doesn't matter, so don't spend comparisons on it
+            segments.append(unranked(seg_x + seg_y))
+        else:
+            segments.append(merge(seg_x, seg_y, before, top_k - start if top_k > 0 else -1))
+    merged_segments = await asyncio.gather(*segments)
+    merged = y[:positions[0]]
+    for i, segment in zip(pivots, merged_segments):
+        merged.append(x[i])
+        merged.extend(segment)
+    return merged
+
+async def rank(items: List[Any], before: Before, top_k: int = -1) -> List[Any]:
+    """
+    Rank `items` best first. With `top_k > 0` only the first top_k positions are guaranteed
+    to be ranked; the remaining items follow in unspecified order.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return items
+    middle = len(items) // 2
+    left, right = await asyncio.gather(rank(items[:middle], before, top_k), rank(items[middle:], before, top_k))
+    if top_k > 0:
+        # Only the top k of each half can end up in the top k of the whole
+        head = await merge(left[:top_k], right[:top_k], before, top_k)
+        return head + left[top_k:] + right[top_k:]
+    return await merge(left, right, before)
+
+# `prefer(a, b)` resolves to the probability that a ranks ahead of b (1.0/0.0 for a hard judge)
+Prefer = Callable[[Any, Any], Awaitable[float]]
+
+class BradleyTerry:
+    """
+    Bradley-Terry model fitted to (soft) pairwise outcomes.
+
+    Each item has a log-strength score; P(a ahead of b) = sigmoid(score_a - score_b). Every item
+    also plays `prior` virtual wins and losses against a fixed reference, which keeps scores finite
+    for unbeaten items and pulls items with little evidence towards the middle.
+    """
+    def __init__(self, items: List[Any], prior: float = 0.5):
+        self.items = list(items)
+        self.prior = prior
+        self.index = {item: i for i, item in enumerate(self.items)}
+        self.wins = [0.0] * len(self.items)
+        self.games: List[Dict[int, float]] = [{} for _ in self.items]
+        self.strengths = [1.0] * len(self.items)
+        self.asked = set()
+        self.comparisons = 0
+
+    def add(self, a: Any, b: Any, p: float = 1.0, weight: float = 1.0, asked: bool = True):
+        """
+        Record that a ranked ahead of b with probability p (p=1.0: a won outright). Evidence that
+        didn't come from asking the judge (e.g. a prior order) is added with asked=False.
+        """
+        i, j = self.index[a], self.index[b]
+        self.wins[i] += weight * p
+        self.wins[j] += weight * (1 - p)
+        self.games[i][j] = self.games[i].get(j, 0.0) + weight
+        self.games[j][i] = self.games[j].get(i, 0.0) + weight
+        if asked:
+            self.asked.add(frozenset((i, j)))
+            self.comparisons += 1
+
+    def fit(self, iterations: int = 200, tolerance: float = 1e-7) -> List[float]:
+        """Minorization-maximization updates (Hunter 2004); returns the log-strength scores."""
+        strengths = self.strengths
+        for _ in range(iterations):
+            change = 0.0
+            for i in range(len(self.items)):
+                denominator = 2 * self.prior / (strengths[i] + 1.0)
+                for j, games in self.games[i].items():
+                    denominator += games / (strengths[i] + strengths[j])
+                updated = (self.wins[i] + self.prior) / denominator
+                change = max(change, abs(math.log(updated / strengths[i])))
+                strengths[i] = updated
+            if change < tolerance:
+                break
+        return self.scores()
+
+    def scores(self) -> List[float]:
+        return [math.log(s) for s in self.strengths]
+
+    def variance(self, i: int) -> float:
+        # Inverse Fisher information of the log-strength, ignoring covariances
+        information = 2 * self.prior * self.probability_index(i, None) * (1 - self.probability_index(i, None))
+        for j, games in self.games[i].items():
+            p = self.probability_index(i, j)
+            information += games * p * (1 - p)
+        return 1 / information
+
+    def probability_index(self, i: int, j: Optional[int]) -> float:
+        other = 1.0 if j is None else self.strengths[j]
+        return self.strengths[i] / (self.strengths[i] + other)
+
+    def probability(self, a: Any, b: Any) -> float:
+        return self.probability_index(self.index[a], self.index[b])
+
+    def confidence(self, a: Any, b: Any) -> float:
+        """z-score of the ordering of a and b: |score difference| over its standard error."""
+        i, j = self.index[a], self.index[b]
+        difference = abs(math.log(self.strengths[i] / self.strengths[j]))
+        return difference / math.sqrt(self.variance(i) + self.variance(j))
+
+    def ranking(self) -> List[Any]:
+        order = sorted(range(len(self.items)), key=lambda i: -self.strengths[i])
+        return [self.items[i] for i in order]
+
+    def compared(self, a: Any, b: Any) -> bool:
+        return frozenset((self.index[a], self.index[b])) in self.asked
+
+    def uncertain_pairs(self, z: float, top_k: int = -1, distance: int = 3, repeat: bool = False) -> List[Tuple[Any, Any]]:
+        """
+        Pairs close together in the current ranking whose order is not yet confident, least
+        confident first. Only pairs touching the top k are considered when top_k > 0; pairs
+        already compared are skipped unless `repeat` (a deterministic judge would answer the same).
+        """
+        ranking = self.ranking()
+        limit = min(len(ranking), top_k + 1) if top_k > 0 else len(ranking)
+        pairs = []
+        for i in range(limit):
+            for d in range(1, distance + 1):
+                if i + d >= len(ranking):
+                    break
+                a, b = ranking[i], ranking[i + d]
+                if not repeat and self.compared(a, b):
+                    continue
+                confidence = self.confidence(a, b)
+                if confidence < z:
+                    pairs.append((confidence, d, a, b))
+        pairs.sort(key=lambda pair: (pair[0], pair[1]))
+        return [(a, b) for _, _, a, b in pairs]
+
+def select_round(pairs: List[Tuple[Any, Any]], size: int) -> List[Tuple[Any, Any]]:
+    """Greedily take up to `size` pairs with no item in two of them, so a round spreads its information."""
+    chosen, used = [], set()
+    for a, b in pairs:
+        if a in used or b in used:
+            continue
+        chosen.append((a, b))
+        used.update((a, b))
+        if len(chosen) >= size:
+            break
+    return chosen
+
+async def refine(model: BradleyTerry, prefer: Prefer, budget: int, z: float = 2.0, round_size: int = None,
+                 top_k: int = -1, repeat: bool = False) -> List[Any]:
+    """
+    Actively compare the least certain neighbouring pairs in rounds until every neighbouring pair
+    is ordered with confidence `z` or `budget` comparisons have been spent.
+    """
+    round_size = round_size or max(1, len(model.items) // 2)
+    spent = 0
+    model.fit()
+    while spent < budget:
+        pairs = select_round(model.uncertain_pairs(z, top_k, repeat=repeat), min(round_size, budget - spent))
+        if not pairs:
+            break
+        outcomes = await asyncio.gather(*[prefer(a, b) for a, b in pairs])
+        for (a, b), p in zip(pairs, outcomes):
+            model.add(a, b, p)
+        spent += len(pairs)
+        model.fit()
+    return model.ranking()
+
+async def rank_bradley_terry(items: List[Any], prefer: Prefer, budget: int = None, z: float = 2.0, round_size: int = None,
+                             top_k: int = -1, repeat: bool = False) -> List[Any]:
+    """
+    Rank with a merge sort whose outcomes seed a Bradley-Terry model, then spend up to `budget`
+    more comparisons (default: one per item) on the pairs the model is least sure about. A single
+    wrong comparison in the sort is outweighed by the direct and transitive evidence around it.
+    """
+    model = BradleyTerry(items)
+
+    async def before(a, b):
+        p = await prefer(a, b)
+        model.add(a, b, p)
+        return p >= 0.5
+    await rank(items, before, top_k)
+    budget = len(model.items) if budget is None else budget
+    return await refine(model, prefer, budget, z, round_size, top_k, repeat)
+
+async def correction_pass(ranked: List[Any], prefer: Prefer, budget: int = None, z: float = 2.0, order_weight: float = 0.5,
+                          top_k: int = -1, repeat: bool = False) -> List[Any]:
+    """
+    Re-check an existing ranking. Neighbouring items start with a weak (order_weight) win for the
+    current order, then uncertain neighbourhoods are compared directly and reordered as needed.
+    """
+    model = BradleyTerry(ranked)
+    for a, b in zip(ranked, ranked[1:]):
+        model.add(a, b, 1.0, weight=order_weight, asked=False)
+    budget = len(ranked) if budget is None else budget
+    return await refine(model, prefer, budget, z, None, top_k, repeat)
+
+async def select_top_k(items: List[Any], before: Before, k: int) -> List[Any]:
+    """
+    The best `k` items, best first, without ranking the rest.
+
+    A knockout tournament finds the winner in log2 n rounds of concurrent matches (n - 1
+    comparisons). Each further pick removes the previous winner and replays only the matches on
+    its path to the root, so the total is about n + k log2 n comparisons. Results of earlier
+    matches are reused when the same two items meet again.
+    """
+    items = list(items)
+    k = min(k, len(items))
+    if k <= 0:
+        return []
+    results: Dict[Tuple[int, int], bool] = {}
+
+    async def play(i: Optional[int], j: Optional[int]) -> Optional[int]:
+        if i is None or j is None:
+            return j if i is None else i
+        if (i, j) not in results:
+            ahead = await before(items[i], items[j])
+            results[(i, j)], results[(j, i)] = ahead, not ahead
+        return i if results[(i, j)] else j
+
+    # levels[0] holds the leaves (item indices); each level above holds the winners of pairs below
+    levels = [list(range(len(items)))]
+    while len(levels[-1]) > 1:
+        below = levels[-1]
+        pairs = [(below[i], below[i + 1] if i + 1 < len(below) else None) for i in range(0, len(below), 2)]
+        levels.append(list(await asyncio.gather(*[play(i, j) for i, j in pairs])))
+
+    selected = []
+    while True:
+        winner = levels[-1][0]
+        selected.append(items[winner])
+        if len(selected) == k:
+            return selected
+        # Replay the winner's path with its leaf removed
+        position = winner
+        levels[0][position] = None
+        for level in range(1, len(levels)):
+            below = levels[level - 1]
+            left = position - position % 2
+            right = below[left + 1] if left + 1 < len(below) else None
+            position //= 2
+            levels[level][position] = await play(below[left], right)
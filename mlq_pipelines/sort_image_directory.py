@@ -4,6 +4,11 @@ import shutil
 import asyncio
 from PIL import Image
 from .vlm import *
+from .image_cache import image_cache
+from .ranking import rank, rank_bradley_terry, select_top_k
+from . import ranking
+from .comparison_store import open_comparison_store
+from .config import sort_question
 import random
 import string
 import glob
@@ -38,13 +43,17 @@ async def sort_with_correction(buffer, question=None, top_k=-1):
     for item in buffer:
         sorted_list = await correct_insert_element(item, sorted_list, question, top_k)
     # Correction mechanism here
-    sorted_list = await correction_pass(sorted_list)
+    sorted_list = await correction_pass(sorted_list, question, top_k=top_k)
     return sorted_list
 
-async def correction_pass(sorted_list):
-    # Implement a correction pass, potentially re-comparing elements
-    # This could involve heuristic-based swaps or reinsertions
-    return sorted_list
+async def correction_pass(sorted_list, question=None, budget=None, top_k=-1):
+    """
+    Re-compare neighbouring images the ranking is least sure about (Bradley-Terry fit seeded
+    with the current order) and reorder, spending at most `budget` comparisons (default: one per image).
+    """
+    if question is None:
+        question = sort_question()
+    return await ranking.correction_pass(sorted_list, lambda a, b: compare_probability(a, b, question), budget, top_k=top_k)
 
 def choose_first_occurrence(s, opta, optb):
     # Find the index of A and B
@@ -67,9 +76,42 @@ def choose_first_occurrence(s, opta, optb):
         # Neither A nor B is found
         return None
 
-async def compare(a, b, question=None):
+# Set by sort_images (or use_comparison_store) to reuse judgments across sorts and runs
+comparison_store = None
+
+def use_comparison_store(path):
+    global comparison_store
+    comparison_store = open_comparison_store(path) if path else None
+    return comparison_store
+
+async def compare_probability(a, b, question, infer=True):
+    """
+    Probability that `a` is preferred over `b`, from the "first"/"second" answer logits.
+
+    Both presentation orders are scored (in the same batch) and averaged, which cancels the
+    model's bias towards whichever image comes first. With a comparison store, stored or
+    transitively implied judgments are returned without calling the VLM.
+    """
+    vlmquestion = f"Q: <image> <image>\n{question}\nA: "
+    candidates = ("first", "second")
+
+    async def score():
+        ab, ba = await asyncio.gather(
+            vlm_score_async(vlmquestion, f"{a},{b}", candidates),
+            vlm_score_async(vlmquestion, f"{b},{a}", candidates),
+        )
+        return (ab["first"] + ba["second"]) / 2
+    if comparison_store is None:
+        return await score()
+    return await comparison_store.get_or_compare(a, b, question, VLM_MODEL_PATH, score, infer)
+
+async def compare(a, b, question=None, scored=True):
     if question is None:
-        question = open("txt2img/q.txt", "r").read().strip()
+        question = sort_question()
+    if scored:
+        p = await compare_probability(a, b, question)
+        print("compare", a, b, f"P(first)={p:.3f}")
+        return 1 if p >= 0.5 else -1
     vlmquestion = f"Q: <image> <image>\n{question}\nA: "
     rag = [a, b]
     random.shuffle(rag)
@@ -92,7 +134,41 @@ async def compare(a, b, question=None):
         print("Retrying ...")
 
 
-async def sort_images(indir, outdir, question=None, top_k=-1):
+async def rank_images(filepaths, question=None, top_k=-1):
+    """Rank images best first with round-based merge sort, so each round's comparisons run together."""
+    if question is None:
+        question = sort_question()
+
+    async def before(a, b):
+        return await compare(a, b, question) == 1
+    return await rank(filepaths, before, top_k)
+
+async def rank_images_bradley_terry(filepaths, question=None, top_k=-1, budget=None, z=2.0):
+    """
+    Rank images by a Bradley-Terry fit: a merge sort seeds the model, then the least certain
+    neighbouring pairs are compared in rounds until confident or `budget` extra comparisons are spent.
+    """
+    if question is None:
+        question = sort_question()
+    return await rank_bradley_terry(filepaths, lambda a, b: compare_probability(a, b, question), budget, z, top_k=top_k)
+
+async def select_images(filepaths, k, question=None):
+    """The best `k` images, best first, by tournament selection (about n + k log2 n comparisons)."""
+    if question is None:
+        question = sort_question()
+
+    async def before(a, b):
+        return await compare(a, b, question) == 1
+    return await select_top_k(filepaths, before, k)
+
+async def sort_images(indir, outdir, question=None, top_k=-1, method="merge", comparisons="txt2img/comparisons.sqlite"):
+    """
+    Sort the images of `indir` into `outdir`. method: "merge", "bradley_terry", "insertion" or
+    "select"; "select" needs top_k and only ranks and moves the best top_k images.
+    Judgments are kept in the `comparisons` database (None disables it), so re-sorting or
+    resuming reuses them.
+    """
+    use_comparison_store(comparisons)
     # Execute the pipeline
     os.makedirs(outdir, exist_ok=True)
     all_elements = []
@@ -102,8 +178,22 @@ async def sort_images(indir, outdir, question=None, top_k=-1):
             filepath = os.path.join(indir, filename)
             all_elements.append(filepath)
     #unload_checkpoint()
-    sorted_list = await sort_with_correction(all_elements, question=question, top_k=top_k)
+    if method == "merge":
+        sorted_list = await rank_images(all_elements, question=question, top_k=top_k)
+    elif method == "bradley_terry":
+        sorted_list = await rank_images_bradley_terry(all_elements, question=question, top_k=top_k)
+    elif method == "select":
+        if top_k <= 0:
+            raise ValueError("method='select' needs top_k > 0")
+        sorted_list = await select_images(all_elements, top_k, question=question)
+    elif method == "insertion":
+        sorted_list = await sort_with_correction(all_elements, question=question, top_k=top_k)
+    else:
+        raise ValueError(f"Unknown sort method {method!r}")
     print("Found files", indir, len(all_elements))
+    print("Image cache", image_cache.stats())
+    if comparison_store is not None:
+        print("Comparison store", comparison_store.stats())
     num_digits = len(str(len(sorted_list) - 1))
     for j, img in enumerate(sorted_list):
         filename = img.split("/")[-1].split(".")[0]
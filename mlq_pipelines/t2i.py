@@ -1,15 +1,30 @@
+import asyncio
+import hashlib
 import random
+import string
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import aiohttp
 import requests
 import json
 from PIL import Image, PngImagePlugin
 import io
 import base64
+from pipelines import task, BatchedTask, resolve
+from .config import sdwebui_config
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+class SDWebUIError(Exception):
+    def __init__(self, status: int, body: str):
+        self.status = status
+        self.body = body
+        super().__init__(f"SD WebUI request failed with status code {status}: {body}")
 
 def load_model(name, url=None):
     if url is None:
-        with open("txt2img/sdwebui_config.json", 'r') as file:
-            data = json.load(file)
-        url = data["sd_webui_url"]
+        url = sdwebui_config()["sd_webui_url"]
     url = url.replace("txt2img", "unload-checkpoint")
     opt = requests.get(url)
     opt_json = opt.json()
@@ -20,9 +35,7 @@ def load_model(name, url=None):
 
 def unload_checkpoint(url=None):
     if url is None:
-        with open("txt2img/sdwebui_config.json", 'r') as file:
-            data = json.load(file)
-        url = data["sd_webui_url"]
+        url = sdwebui_config()["sd_webui_url"]
     url = url.replace("txt2img", "unload-checkpoint")
     headers = {"Content-Type": "application/json"}
     response = requests.post(url, headers=headers, data={})
@@ -30,27 +43,105 @@ def unload_checkpoint(url=None):
 
 def reload_checkpoint(url=None):
     if url is None:
-        with open("txt2img/sdwebui_config.json", 'r') as file:
-            data = json.load(file)
-        url = data["sd_webui_url"]
+        url = sdwebui_config()["sd_webui_url"]
     url = url.replace("txt2img", "reload-checkpoint")
     headers = {"Content-Type": "application/json"}
     response = requests.post(url, headers=headers, data={})
     print("checkpoint loaded", response.json())
 
 
-def text_to_image(p: str, np=""):
-    @task
+def random_fname():
+    random_string = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    return f"images/{random_string}_{timestamp}.png"
+
+class GeneratedImage:
+    """
+    A generated image kept in memory, so filters can use it without a PNG round trip through disk.
+
+    It is decoded at most once, carries the preprocessed tensors the VLM computed for it
+    (`processed`), and is only written out by `save`, typically once it has passed every filter.
+    """
+    def __init__(self, b64_image: str, parameters: Optional[str] = None):
+        self.b64_image = b64_image
+        self.parameters = parameters
+        self.decoded = None
+        self.processed = {}
+        self.fname = None
+
+    @property
+    def image(self) -> Image.Image:
+        if self.decoded is None:
+            self.decoded = Image.open(io.BytesIO(base64.b64decode(self.b64_image.split(",", 1)[-1]))).convert("RGB")
+        return self.decoded
+
+    def cache_key(self) -> str:
+        return hashlib.sha256(self.b64_image.encode()).hexdigest()
+
+    def save(self, fname: Optional[str] = None) -> str:
+        """Write the PNG (with its generation parameters) once; later calls return the same path."""
+        if self.fname is None:
+            self.fname = fname or random_fname()
+            pnginfo = PngImagePlugin.PngInfo()
+            if self.parameters is not None:
+                pnginfo.add_text("parameters", self.parameters)
+            self.image.save(self.fname, pnginfo=pnginfo)
+        return self.fname
+
+    def __repr__(self):
+        return f"GeneratedImage({self.fname or self.cache_key()[:12]})"
+
+def text_to_image(p: str, np="", max_batch=1, max_wait_ms=50, save=True):
+    """
+    Task generating an image for prompt `p`. With save=False it yields a GeneratedImage that
+    stays in memory; call `.save()` on the ones worth keeping.
+    """
+    if max_batch > 1:
+        # Concurrent pipeline runs share txt2img requests with batch_size set
+        return TextToImageBatch(p, np, save, max_batch, max_wait_ms)
+
+    @task(resource="sdwebui")
     async def generate_image_() -> str:
-        return generate_image(p, np)
+        # p and np may be Param placeholders bound per invocation with Pipeline.bind
+        return (await get_sdwebui_client().generate(resolve(p), resolve(np), save=save))[0]
     return generate_image_
 
-def generate_image(prompt, negative_prompt, config_file=None, fname=None):
+class TextToImageBatch(BatchedTask):
+    """
+    Batched txt2img task. `p` and `np` are resolved when each call is queued, in that call's
+    context, so pipelines bound to different prompts can share a batch; the batch then sends
+    one request per distinct (prompt, negative prompt) pair.
+    """
+    def __init__(self, p, np, save: bool, max_batch: int, max_wait_ms: float):
+        super().__init__(self.generate_batch, "generate_images_", max_batch, max_wait_ms, resource="sdwebui")
+        self.p = p
+        self.np = np
+        self.save = save
+
+    async def schedule(self, context, *args, **kwargs):
+        # The batch runs in the context of whichever call flushed it, so resolve here
+        return await super().schedule(context, (resolve(self.p), resolve(self.np)))
+
+    async def generate_batch(self, prompts) -> list:
+        positions = {}
+        for i, prompt in enumerate(prompts):
+            positions.setdefault(prompt, []).append(i)
+        client = get_sdwebui_client()
+        generated = await asyncio.gather(*[
+            client.generate(prompt, negative_prompt, batch_size=len(indices), save=self.save)
+            for (prompt, negative_prompt), indices in positions.items()
+        ])
+        results = [None] * len(prompts)
+        for indices, images in zip(positions.values(), generated):
+            for i, image in zip(indices, images):
+                results[i] = image
+        return results
+
+def build_txt2img_request(prompt, negative_prompt, config_file=None):
     seed = random.SystemRandom().randint(0, 2**32-1)
     if config_file is None:
-        with open("txt2img/sdwebui_config.json", 'r') as file:
-            config_file = json.load(file)
-    headers = {"Content-Type": "application/json"}
+        config_file = sdwebui_config()
+    # Copy: the cached config is shared
     data = dict(config_file)
 
     data["prompt"]=prompt
@@ -59,29 +150,182 @@ def generate_image(prompt, negative_prompt, config_file=None, fname=None):
     data["seed"]=seed
     url = data["sd_webui_url"]
     del data["sd_webui_url"]
-    #print(" calling: ", prompt_)
-    #print(url)
+    return url, data
+
+def infotexts_from_info(info) -> List[str]:
+    """Per-image generation parameters ("infotexts") from a txt2img response's `info` field."""
+    if isinstance(info, str):
+        try:
+            info = json.loads(info)
+        except ValueError:
+            return []
+    if not isinstance(info, dict):
+        return []
+    return list(info.get("infotexts") or [])
 
-    response = requests.post(url, headers=headers, data=json.dumps(data))
+def save_png(b64_image, parameters=None, fname=None):
+    image = Image.open(io.BytesIO(base64.b64decode(b64_image.split(",", 1)[-1])))
+    pnginfo = PngImagePlugin.PngInfo()
+    if parameters is not None:
+        pnginfo.add_text("parameters", parameters)
+    if fname is None:
+        fname = random_fname()
+    image.save(fname, pnginfo=pnginfo)
+    return fname
 
-    if response.status_code == 200:
-        r = response.json()
-        image = Image.open(io.BytesIO(base64.b64decode(r['images'][0].split(",",1)[0])))
-        jsoninfo = json.loads(r['info'])
-        #print(jsoninfo["infotexts"][0])
+def save_txt2img_image(url, b64_image, fname=None, parameters=None):
+    if parameters is None:
+        # No local infotext: ask the WebUI to read the parameters back out of the image
         png_payload = {
-            "image": "data:image/png;base64," + r['images'][0]
+            "image": "data:image/png;base64," + b64_image
         }
         response2 = requests.post(url=url.replace("txt2img", "png-info"), json=png_payload)
+        parameters = response2.json().get("info")
+    return save_png(b64_image, parameters, fname)
 
-        pnginfo = PngImagePlugin.PngInfo()
-        pnginfo.add_text("parameters", response2.json().get("info"))
+class SDWebUIClient:
+    """
+    Long-lived Stable Diffusion WebUI client.
 
-        if fname is None:
-            fname= random_fname()
-        image.save(fname, pnginfo=pnginfo)
-        return fname
+    Keeps one pooled keep-alive aiohttp session, retries failed requests a bounded number of
+    times with exponential backoff, and generates `batch_size * n_iter` images per request.
+    With `local_pnginfo` (the default) PNG metadata is written from the `infotexts` returned by
+    txt2img instead of a `png-info` round trip per image.
+    """
+    def __init__(self, config: Optional[Dict[str, Any]] = None, max_connections: int = 4, max_retries: int = 3,
+                 base_delay: float = 1.0, max_delay: float = 30.0, timeout: float = 600, local_pnginfo: bool = True):
+        self.config = config
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.local_pnginfo = local_pnginfo
+        self.session = None
+        self.session_loop = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # A session is bound to the loop it was created on, so asyncio.run() callers get a fresh one
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.session_loop = loop
+        return self.session
+
+    def retry_delay(self, attempt: int) -> float:
+        delay = min(self.base_delay * 2 ** attempt, self.max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def post(self, url: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            try:
+                async with self.get_session().post(url, json=data) as response:
+                    if response.status == 200:
+                        return await response.json()
+                    body = await response.text()
+                    if response.status not in RETRYABLE_STATUSES or attempt >= self.max_retries:
+                        raise SDWebUIError(response.status, body)
+                    print(f"Request failed with status code {response.status}, retrying")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                print(f"Request failed: {e!r}, retrying")
+            await asyncio.sleep(self.retry_delay(attempt))
+            attempt += 1
+
+    def build_request(self, prompt: str, negative_prompt: str, batch_size: int, n_iter: int, overrides: Dict[str, Any]):
+        url, data = build_txt2img_request(prompt, negative_prompt, self.config)
+        data.update(overrides)
+        data["batch_size"] = batch_size
+        data["n_iter"] = n_iter
+        return url, data
+
+    async def txt2img(self, prompt: str, negative_prompt: str = "", batch_size: int = 1, n_iter: int = 1,
+                      **overrides) -> Dict[str, Any]:
+        """The raw txt2img response: base64 `images` and the `info` JSON string."""
+        url, data = self.build_request(prompt, negative_prompt, batch_size, n_iter, overrides)
+        return await self.post(url, data)
+
+    async def png_info(self, url: str, b64_image: str) -> Optional[str]:
+        response = await self.post(url.replace("txt2img", "png-info"), {"image": "data:image/png;base64," + b64_image})
+        return response.get("info")
+
+    async def generate(self, prompt: str, negative_prompt: str = "", batch_size: int = 1, n_iter: int = 1,
+                       fnames: Optional[List[str]] = None, save: bool = True, **overrides) -> List[Any]:
+        """
+        Generate `batch_size * n_iter` images with one request and save them; returns the filenames,
+        or with save=False the in-memory GeneratedImages.
+        """
+        url, data = self.build_request(prompt, negative_prompt, batch_size, n_iter, overrides)
+        response = await self.post(url, data)
+        count = batch_size * n_iter
+        # The WebUI may append extra images (e.g. grids); keep one per requested sample
+        images = response["images"][:count]
+        infotexts = infotexts_from_info(response.get("info")) if self.local_pnginfo else []
+        parameters = []
+        for i, b64_image in enumerate(images):
+            if i < len(infotexts):
+                parameters.append(infotexts[i])
+            else:
+                parameters.append(await self.png_info(url, b64_image))
+        if not save:
+            return [GeneratedImage(b64_image, info) for b64_image, info in zip(images, parameters)]
+        fnames = fnames or [None] * len(images)
+        loop = asyncio.get_running_loop()
+        # Decoding and PNG encoding are CPU work; keep them off the event loop
+        return list(await asyncio.gather(*[
+            loop.run_in_executor(None, save_png, b64_image, info, fname)
+            for b64_image, info, fname in zip(images, parameters, fnames)
+        ]))
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+default_client = None
+
+def get_sdwebui_client() -> SDWebUIClient:
+    global default_client
+    if default_client is None:
+        default_client = SDWebUIClient()
+    return default_client
+
+def set_sdwebui_client(client: SDWebUIClient):
+    global default_client
+    default_client = client
+
+def post_txt2img(url, data, max_retries=3, base_delay=1.0):
+    """Blocking txt2img request with bounded retries, for callers outside an event loop."""
+    headers = {"Content-Type": "application/json"}
+    for attempt in range(max_retries + 1):
+        try:
+            response = requests.post(url, headers=headers, data=json.dumps(data))
+            if response.status_code == 200:
+                return response.json()
+            print(f"Request failed with status code {response.status_code}")
+            if response.status_code not in RETRYABLE_STATUSES or attempt == max_retries:
+                raise SDWebUIError(response.status_code, response.text)
+        except requests.ConnectionError:
+            if attempt == max_retries:
+                raise
+        time.sleep(base_delay * 2 ** attempt)
+
+def generate_image(prompt, negative_prompt, config_file=None, fname=None):
+    return generate_images(prompt, negative_prompt, 1, config_file, [fname])[0]
 
-    else:
-        print(f"Request failed with status code {response.status_code}")
-        return generate_image(prompt, negative_prompt, config_file, fname)
+def generate_images(prompt, negative_prompt, batch_size, config_file=None, fnames=None):
+    """Generate `batch_size` images with a single txt2img request and return their filenames."""
+    url, data = build_txt2img_request(prompt, negative_prompt, config_file)
+    data["batch_size"] = batch_size
+    r = post_txt2img(url, data)
+    # The WebUI may append extra images (e.g. grids); keep one per requested sample
+    images = r['images'][:batch_size]
+    infotexts = infotexts_from_info(r.get('info'))
+    fnames = fnames or [None] * len(images)
+    return [
+        save_txt2img_image(url, b64_image, fname, infotexts[i] if i < len(infotexts) else None)
+        for i, (b64_image, fname) in enumerate(zip(images, fnames))
+    ]
@@ -1,31 +1,32 @@
-from scripts.llava_util import run_llava
+from scripts.llava_util import run_llava, run_llava_batch, run_llava_multi, score_llava
+from .vlm_worker import VLMClient, answer_stop
+from .config import config_lines
+from .t2i import random_fname
+import os
 import re
-from datetime import datetime
-from pipelines import task, Pipeline, set_output, get_output
+from pipelines import task, batched_task, Pipeline, PipelineContext, Reject, Scheduler, THREAD, set_output, get_output
+from pipelines.cache import MISS, stable_hash
+from pipelines.executor import run_sync
 import random
 import requests
 import json
 import io
 import base64
-import string
 from PIL import Image
 
-file_cache = {}
+VLM_MODEL_PATH = "/ml2/trained/vllm/VILA/VILA-13b"
+VLM_CONV_MODE = "vicuna_v1"
 
 def load_file_and_return_random_line(file_path):
-    global file_cache
-
-    # If the file content is not in cache, load it
-    if file_path not in file_cache:
-        with open(file_path, 'r') as file:
-            file_cache[file_path] = file.read().split('\n')
+    # Wildcard files are cached until they change, so edits apply without a restart
+    lines = config_lines(file_path)
 
     # If the file content is empty or only contains '', return None
-    if not file_cache[file_path] or file_cache[file_path] == ['']:
+    if not lines or lines == ['']:
         return None
 
     # Return a random line
-    line = random.choice(file_cache[file_path])
+    line = random.choice(lines)
 
     return line
 
@@ -48,53 +49,205 @@ def wildcard_replace(s, directory):
     return s
 
 
-def random_fname():
-    # Generate a random string of letters and digits
-    random_string = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+def vlm_call(question, img):
+    return run_llava(VLM_MODEL_PATH, VLM_CONV_MODE, question, img)
 
-    # Current timestamp for uniqueness
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+def vlm_call_batch(question, imgs):
+    return run_llava_batch(VLM_MODEL_PATH, VLM_CONV_MODE, question, imgs)
 
-    # Combine them to form a filename
-    return f"images/{random_string}_{timestamp}.png"
+def vlm_call_many(questions, img, stop=None):
+    return run_llava_multi(VLM_MODEL_PATH, VLM_CONV_MODE, questions, img, stop=stop)
 
-def vlm_call(question, img):
-    return run_llava("/ml2/trained/vllm/VILA/VILA-13b", "vicuna_v1", question, img)
+def vlm_score(question, imgs, candidates=("Yes", "No")):
+    return score_llava(VLM_MODEL_PATH, VLM_CONV_MODE, question, imgs, candidates=candidates)
+
+vlm_client = None
+
+def get_vlm_client():
+    """The shared worker client if VLM_WORKER_SOCKET is set (or one was installed), else None."""
+    global vlm_client
+    socket_path = os.environ.get("VLM_WORKER_SOCKET")
+    if vlm_client is None and socket_path:
+        vlm_client = VLMClient(socket_path)
+    return vlm_client
+
+def set_vlm_client(client):
+    global vlm_client
+    vlm_client = client
+
+# Local scoring runs in a thread so concurrent callers (e.g. a ranking round) can be batched,
+# with one batch on the model at a time
+vlm_context = PipelineContext(scheduler=Scheduler({"gpu-vlm": 1}))
+vlm_score_batchers = {}
+
+async def run_local_vlm(func, *args, **kwargs):
+    """Run a blocking in-process model call in a thread, one at a time on the gpu-vlm slot."""
+    async with vlm_context.scheduler.slot("gpu-vlm"):
+        return await run_sync(func, args, kwargs, THREAD)
+
+async def vlm_call_async(question, img):
+    client = get_vlm_client()
+    if client is None:
+        return await run_local_vlm(vlm_call, question, img)
+    return await client.generate(question, img)
+
+async def vlm_call_many_async(questions, img, expect_yes=None):
+    """vlm_call_many through the worker when one is set, so the model isn't loaded twice; else in a thread."""
+    client = get_vlm_client()
+    if client is None:
+        return await run_local_vlm(vlm_call_many, questions, img, stop=answer_stop(expect_yes))
+    return await client.generate_many(questions, img, expect_yes)
+
+async def vlm_score_async(question, img, candidates=("Yes", "No")):
+    client = get_vlm_client()
+    if client is not None:
+        return await client.score(question, img, candidates)
+    key = (question, tuple(candidates))
+    if key not in vlm_score_batchers:
+        vlm_score_batchers[key] = batched_task(
+            lambda imgs: vlm_score(question, imgs, candidates),
+            name=f"vlm_score({question!r})", max_batch=8, max_wait_ms=20, executor=THREAD, resource="gpu-vlm"
+        )
+    return await vlm_score_batchers[key](vlm_context, img)
+
+def judge_vlm_score(p_yes, question, img, reverse=False, threshold=0.5):
+    passed = p_yes < threshold if reverse else p_yes >= threshold
+    print("Pass" if passed else "Fail", question, f"P(Yes)={p_yes:.3f}")
+    return img if passed else Reject(f"P(Yes)={p_yes:.3f}")
+
+def judge_vlm_response(r, question, img, reverse=False):
+    # Failing images become a Reject so a sequential chain of filters stops at this question
+    if reverse:
+        if "Yes" in r:
+            print("reverse fail", question)
+            return Reject(r)
+        elif "No" in r:
+            print("reverse pass", question)
+            return img
+        else:
+            print("reverse cancel", question, r)
+            return img
+    else:
+        if "Yes" in r:
+            print("Pass", question)
+            return img
+        elif "No" in r:
+            print("Fail", question)
+            return Reject(r)
+        else:
+            print("Retry Fail", question, r)
+            return Reject(r)
+
+def verdict_key(name, img):
+    # "verdict" keeps these keys apart from entries that stored a task's returned image
+    return stable_hash("verdict", name, img)
+
+def cached_verdict(cache, name, img):
+    """
+    The cached judgment of `img`: `img` itself if it passed, else a Reject; MISS if not cached.
+
+    Only the verdict is cached, never the image it was computed for, so byte-identical images
+    at different paths each come back as themselves.
+    """
+    if cache is None or img is None:
+        return MISS
+    verdict = cache.get(verdict_key(name, img))
+    if verdict is MISS:
+        return MISS
+    passed, reason = verdict
+    return img if passed else Reject(reason)
+
+def store_verdict(cache, name, img, result):
+    if cache is not None and img is not None:
+        rejected = isinstance(result, Reject)
+        cache.set(verdict_key(name, img), (not rejected, result.reason if rejected else None))
 
 #from deepseek_vl.models import VLChatProcessor, MultiModalityCausalLM
 #from deepseek_vl.utils.io import load_pil_images
-def filter_vlm(question: str, reverse=False):
-    @task
-    async def get_vlm_response_(img) -> str:
-        if img is None:
-            return None
-        q = "<image>\nQ: "+question+"\nA: "
+def filter_vlm(question: str, reverse=False, max_batch=1, max_wait_ms=50, cache=None, threshold=0.5):
+    """
+    Filter images on a Yes/No question.
+
+    By default the answer is scored from the Yes/No logits of a single forward pass and the
+    image passes when P(Yes) >= threshold (< threshold with reverse). threshold=None falls back
+    to generating a free-text answer and searching it for Yes/No. With `cache`, verdicts are
+    cached per image content.
+    """
+    q = "<image>\nQ: "+question+"\nA: "
+    # The question is part of the name so cached answers are keyed per question
+    name = f"filter_vlm({question!r}, reverse={reverse}, threshold={threshold})"
+
+    def judge_all(imgs):
+        present = [img for img in imgs if img is not None]
+        if threshold is None:
+            answers = iter(vlm_call_batch(q, present) if present else [])
+            return [None if img is None else judge_vlm_response(next(answers), question, img, reverse) for img in imgs]
+        scores = iter(vlm_score(q, present) if present else [])
+        return [None if img is None else judge_vlm_score(next(scores)["Yes"], question, img, reverse, threshold) for img in imgs]
+
+    async def judge(img):
+        if threshold is not None:
+            p_yes = (await vlm_score_async(q, img))["Yes"]
+            return judge_vlm_score(p_yes, question, img, reverse, threshold)
         print(q)
-        r = vlm_call(q, img)
+        r = await vlm_call_async(q, img)
         print(r)
         #r = get_vlm_request("<image_placeholder>"+question, [img])
-        if reverse:
-            if "Yes" in r:
-                print("reverse fail", question)
-                return None
-            elif "No" in r:
-                print("reverse pass", question)
-                return img
-            else:
-                print("reverse cancel", question, r)
-                return img
-        else:
-            if "Yes" in r:
-                print("Pass", question)
-                return img
-            elif "No" in r:
-                print("Fail", question)
-                return None
-            else:
-                print("Retry Fail", question, r)
-                return None
+        return judge_vlm_response(r, question, img, reverse)
+
+    if max_batch > 1 and get_vlm_client() is None:
+        # Images from concurrent pipeline runs share one batched forward/generate call
+        # (a VLM worker batches requests itself, so the single-image task is used with one).
+        # The call runs in a thread so the loop keeps filling the next batch meanwhile.
+        @batched_task(name=name, max_batch=max_batch, max_wait_ms=max_wait_ms, executor=THREAD, resource="gpu-vlm")
+        def get_vlm_responses_(imgs):
+            results = [cached_verdict(cache, name, img) for img in imgs]
+            misses = [i for i, result in enumerate(results) if result is MISS]
+            for i, result in zip(misses, judge_all([imgs[i] for i in misses])):
+                store_verdict(cache, name, imgs[i], result)
+                results[i] = result
+            return results
+        return get_vlm_responses_
+
+    @task(name=name)
+    async def get_vlm_response_(img) -> str:
+        if img is None:
+            return None
+        result = cached_verdict(cache, name, img)
+        if result is MISS:
+            result = await judge(img)
+            store_verdict(cache, name, img, result)
+        return result
+
     return get_vlm_response_
 
+def filter_vlm_many(questions, reverse=False, cache=None):
+    """
+    Ask every question about an image in one pass that encodes the image once.
+
+    Stops at the first failing answer and rejects with the failing question as the reason.
+    With `cache`, verdicts are cached per image content.
+    """
+    qs = ["<image>\nQ: "+question+"\nA: " for question in questions]
+    name = f"filter_vlm_many({list(questions)!r}, reverse={reverse})"
+
+    @task(name=name, resource="gpu-vlm")
+    async def get_vlm_responses_(img):
+        if img is None:
+            return None
+        result = cached_verdict(cache, name, img)
+        if result is not MISS:
+            return result
+        answers = await vlm_call_many_async(qs, img, expect_yes=not reverse)
+        result = img
+        for question, r in zip(questions, answers):
+            if not judge_vlm_response(r, question, img, reverse):
+                result = Reject(question)
+                break
+        store_verdict(cache, name, img, result)
+        return result
+    return get_vlm_responses_
+
 if False:
     # specify the path to the model
     model_path = "deepseek-ai/deepseek-vl-7b-chat"
@@ -0,0 +1,406 @@
+"""
+Long-lived VLM worker process.
+
+The worker loads the model once and serves newline-delimited JSON requests on a Unix socket.
+Concurrent `generate`/`score` requests with the same query are batched into one model call,
+`generate_many` asks several questions about one image in one pass, and model calls are serialized on a single "gpu" scheduler slot so load/unload never races a batch.
+
+    python -m mlq_pipelines.vlm_worker --socket /tmp/vlm.sock
+
+`VLMClient` is the asyncio client; `mlq_pipelines.vlm` uses it when `VLM_WORKER_SOCKET` is set.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from pipelines import BatchedTask, PipelineContext, Scheduler, THREAD
+
+DEFAULT_MODEL_PATH = "/ml2/trained/vllm/VILA/VILA-13b"
+DEFAULT_CONV_MODE = "vicuna_v1"
+
+class VLMWorkerError(Exception):
+    pass
+
+# Blocks created by this process (a client); the worker may run in the same process in tests
+owned_blocks = set()
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        block = shared_memory.SharedMemory(name=name)
+        if block._name not in owned_blocks:
+            # Before Python 3.13 attaching also registers the block for cleanup here; the client owns it
+            resource_tracker.unregister(block._name, "shared_memory")
+        return block
+
+def share_images(images: Any) -> Tuple[Any, List[shared_memory.SharedMemory]]:
+    """
+    Make `images` sendable to the worker: paths pass through unchanged, in-memory images (PIL or
+    objects with an `.image`, e.g. t2i.GeneratedImage) are copied once into shared memory as raw
+    pixels instead of being encoded to files. The caller closes and unlinks the returned blocks.
+    """
+    if isinstance(images, str):
+        return images, []
+    if isinstance(images, (list, tuple)):
+        shared, blocks = [], []
+        for image in images:
+            ref, image_blocks = share_images(image)
+            shared.append(ref)
+            blocks.extend(image_blocks)
+        return shared, blocks
+    image = getattr(images, "image", images)
+    data = image.tobytes()
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    owned_blocks.add(block._name)
+    return {"shm": block.name, "mode": image.mode, "size": list(image.size)}, [block]
+
+def open_shared_images(images: Any) -> Any:
+    """Worker side of `share_images`: shared-memory references become PIL images."""
+    if isinstance(images, list):
+        return [open_shared_images(image) for image in images]
+    if isinstance(images, dict):
+        block = attach_shared_memory(images["shm"])
+        try:
+            size = tuple(images["size"])
+            # frombytes copies, so the block can be released as soon as the image is built
+            return Image.frombytes(images["mode"], size, bytes(block.buf[:len(block.buf)]))
+        finally:
+            block.close()
+    return images
+
+def release_shared_images(blocks: List[shared_memory.SharedMemory]):
+    for block in blocks:
+        owned_blocks.discard(block._name)
+        block.close()
+        block.unlink()
+
+class LlavaBackend:
+    """Backend serving the llava_util model. Imported lazily so the client never needs torch."""
+    def __init__(self, model_path: str = DEFAULT_MODEL_PATH, conv_mode: str = DEFAULT_CONV_MODE):
+        self.model_path = model_path
+        self.conv_mode = conv_mode
+
+    @property
+    def loaded(self) -> bool:
+        from scripts import llava_util
+        return llava_util.llavamodel is not None
+
+    def load(self):
+        from scripts.llava_util import get_llava_model
+        get_llava_model(argparse.Namespace(model_path=self.model_path, model_base=None))
+
+    def unload(self):
+        from scripts.llava_util import unload_llava_model
+        unload_llava_model()
+
+    def stats(self) -> Dict[str, Any]:
+        from mlq_pipelines.image_cache import image_cache
+        return {"image_cache": image_cache.stats()}
+
+    def generate(self, query: str, images_list: List[str], **options) -> List[str]:
+        from scripts.llava_util import run_llava_batch
+        return run_llava_batch(self.model_path, self.conv_mode, query, images_list, **options)
+
+    def score(self, query: str, images_list: List[str], candidates: Sequence[str]) -> List[Dict[str, float]]:
+        from scripts.llava_util import score_llava
+        return score_llava(self.model_path, self.conv_mode, query, images_list, candidates=tuple(candidates))
+
+    def generate_many(self, queries: List[str], image: Any, expect_yes: Optional[bool] = None) -> List[str]:
+        from scripts.llava_util import run_llava_multi
+        return run_llava_multi(self.model_path, self.conv_mode, queries, image, stop=answer_stop(expect_yes))
+
+def answer_stop(expect_yes: Optional[bool]):
+    """`stop` callback ending a multi-question pass at the first answer that doesn't match `expect_yes`."""
+    if expect_yes is None:
+        return None
+    return lambda index, answer: ("Yes" in answer) != expect_yes
+
+def load_backend(spec: str, **kwargs) -> Any:
+    """Instantiate a backend from a "module:attribute" spec."""
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)(**kwargs)
+
+class VLMWorker:
+    def __init__(self, backend: Any, socket_path: str, max_batch: int = 8, max_wait_ms: float = 20):
+        self.backend = backend
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        # One slot: batches, loads and unloads run one at a time on the model
+        self.context = PipelineContext(scheduler=Scheduler({"gpu": 1}))
+        self.batchers: Dict[str, BatchedTask] = {}
+        self.requests = 0
+        self.server = None
+        self.connections = set()
+
+    def batcher(self, op: str, query: str, options: Dict[str, Any]) -> BatchedTask:
+        key = json.dumps([op, query, options], sort_keys=True)
+        if key not in self.batchers:
+            method = getattr(self.backend, op)
+
+            def run(images_list):
+                return method(query, images_list, **options)
+            self.batchers[key] = BatchedTask(run, name=f"{op}({query!r})", max_batch=self.max_batch,
+                                             max_wait_ms=self.max_wait_ms, executor=THREAD, resource="gpu")
+        return self.batchers[key]
+
+    async def exclusive(self, func) -> Any:
+        async with self.context.scheduler.slot("gpu"):
+            return await asyncio.get_running_loop().run_in_executor(None, func)
+
+    def health(self) -> Dict[str, Any]:
+        batch_sizes = [size for batcher in self.batchers.values() for size in batcher.batch_sizes]
+        return {
+            "pid": os.getpid(),
+            "loaded": bool(getattr(self.backend, "loaded", False)),
+            "requests": self.requests,
+            "batches": len(batch_sizes),
+            "mean_batch": sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0.0,
+            "active": dict(self.context.scheduler.active),
+            **(self.backend.stats() if hasattr(self.backend, "stats") else {}),
+        }
+
+    async def dispatch(self, request: Dict[str, Any]) -> Any:
+        op = request.get("op")
+        if op == "generate":
+            self.requests += 1
+            batcher = self.batcher("generate", request["query"], request.get("options", {}))
+            return await batcher(self.context, open_shared_images(request["images"]))
+        if op == "score":
+            self.requests += 1
+            batcher = self.batcher("score", request["query"], {"candidates": list(request.get("candidates", ("Yes", "No")))})
+            return await batcher(self.context, open_shared_images(request["images"]))
+        if op == "generate_many":
+            # One image, many questions: the backend shares the image encoding, so this isn't batched
+            self.requests += 1
+            image = open_shared_images(request["images"])
+            return await self.exclusive(lambda: self.backend.generate_many(request["queries"], image, request.get("expect_yes")))
+        if op == "load":
+            await self.exclusive(self.backend.load)
+            return self.health()
+        if op == "unload":
+            await self.exclusive(self.backend.unload)
+            return self.health()
+        if op == "health":
+            return self.health()
+        raise VLMWorkerError(f"Unknown op {op!r}")
+
+    async def respond(self, request: Dict[str, Any], writer: asyncio.StreamWriter, lock: asyncio.Lock):
+        try:
+            response = {"id": request.get("id"), "result": await self.dispatch(request)}
+        except Exception as e:
+            response = {"id": request.get("id"), "error": f"{type(e).__name__}: {e}"}
+        async with lock:
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Requests on one connection are answered as they finish, matched up by id
+        lock = asyncio.Lock()
+        pending = set()
+        self.connections.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request_task = asyncio.ensure_future(self.respond(json.loads(line), writer, lock))
+                pending.add(request_task)
+                request_task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # Server.close() leaves accepted connections open; clients should see the worker go away
+            for writer in list(self.connections):
+                writer.close()
+            await self.server.wait_closed()
+            self.server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+class VLMClient:
+    """
+    Asyncio client for a VLMWorker. Requests are multiplexed over one connection per event
+    loop, so many pipeline tasks can await the worker concurrently (and get batched there).
+    """
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.connection_loop = None
+        self.connect_lock = None
+        self.futures: Dict[int, asyncio.Future] = {}
+        self.next_id = 0
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        if self.connection_loop is not loop:
+            # Connections and locks belong to the loop that created them
+            self.writer = None
+            self.connect_lock = asyncio.Lock()
+            self.connection_loop = loop
+        async with self.connect_lock:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+                self.reader_task = asyncio.ensure_future(self.read_responses(self.reader))
+
+    async def read_responses(self, reader: asyncio.StreamReader):
+        error = VLMWorkerError("VLM worker closed the connection")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self.futures.pop(response["id"], None)
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    future.set_exception(VLMWorkerError(response["error"]))
+                else:
+                    future.set_result(response["result"])
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            error = VLMWorkerError(f"VLM worker connection lost: {e}")
+        finally:
+            # The next request reconnects; requests in flight on this connection fail
+            self.writer = None
+            futures, self.futures = self.futures, {}
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def request(self, op: str, **payload) -> Any:
+        await self.connect()
+        self.next_id += 1
+        request_id = self.next_id
+        future = asyncio.get_running_loop().create_future()
+        self.futures[request_id] = future
+        try:
+            self.writer.write(json.dumps({"id": request_id, "op": op, **payload}).encode() + b"\n")
+            await self.writer.drain()
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self.futures.pop(request_id, None)
+
+    async def request_with_images(self, op: str, images: Any, **payload) -> Any:
+        shared, blocks = share_images(images)
+        try:
+            return await self.request(op, images=shared, **payload)
+        finally:
+            release_shared_images(blocks)
+
+    async def generate(self, query: str, images: Any, **options) -> str:
+        """Answer `query` for one image entry: comma-joined paths, or in-memory image(s)."""
+        return await self.request_with_images("generate", images, query=query, options=options)
+
+    async def score(self, query: str, images: Any, candidates: Sequence[str] = ("Yes", "No")) -> Dict[str, float]:
+        return await self.request_with_images("score", images, query=query, candidates=list(candidates))
+
+    async def generate_many(self, queries: Sequence[str], images: Any, expect_yes: Optional[bool] = None) -> List[str]:
+        """
+        Answer several queries about one image entry in a single pass, stopping at the first
+        answer whose "Yes" doesn't match `expect_yes` (None answers every query).
+        """
+        return await self.request_with_images("generate_many", images, queries=list(queries), expect_yes=expect_yes)
+
+    async def load(self) -> Dict[str, Any]:
+        return await self.request("load")
+
+    async def unload(self) -> Dict[str, Any]:
+        return await self.request("unload")
+
+    async def health(self) -> Dict[str, Any]:
+        return await self.request("health")
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.reader_task is not None:
+            await asyncio.gather(self.reader_task, return_exceptions=True)
+            self.reader_task = None
+
+def wait_for_socket(socket_path: str, process: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise VLMWorkerError(f"VLM worker exited with code {process.returncode}")
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(socket_path)
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise VLMWorkerError(f"VLM worker did not start listening on {socket_path} within {timeout}s")
+
+def start_worker(socket_path: str, backend: str = "mlq_pipelines.vlm_worker:LlavaBackend", max_batch: int = 8,
+                 max_wait_ms: float = 20, load: bool = False, timeout: float = 60, env: Dict[str, str] = None) -> subprocess.Popen:
+    """Spawn a worker process and wait until it accepts connections."""
+    command = [sys.executable, "-m", "mlq_pipelines.vlm_worker", "--socket", socket_path, "--backend", backend,
+               "--max-batch", str(max_batch), "--max-wait-ms", str(max_wait_ms)]
+    if load:
+        command.append("--load")
+    process = subprocess.Popen(command, env=env)
+    try:
+        wait_for_socket(socket_path, process, timeout)
+    except VLMWorkerError:
+        process.kill()
+        raise
+    return process
+
+async def run_worker(args):
+    worker = VLMWorker(load_backend(args.backend), args.socket, args.max_batch, args.max_wait_ms)
+    if args.load:
+        worker.backend.load()
+    await worker.start()
+    print("VLM worker listening on", args.socket, flush=True)
+    try:
+        await worker.serve_forever()
+    finally:
+        await worker.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", type=str, default="/tmp/vlm-worker.sock")
+    parser.add_argument("--backend", type=str, default="mlq_pipelines.vlm_worker:LlavaBackend")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--load", action="store_true", help="Load the model before accepting requests")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_worker(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,224 @@
+import functools
+import json
+import re
+from typing import Any, AsyncIterator, List, Optional, Type
+
+import pydantic
+
+FENCED_JSON = re.compile(r'```(?:json)?\s*(.*?)\s*(?:```|$)', re.DOTALL)
+
+class LLMJSONError(ValueError):
+    pass
+
+@functools.lru_cache(maxsize=None)
+def get_type_adapter(model: Any) -> pydantic.TypeAdapter:
+    """Build (once per type) the TypeAdapter used to validate LLM output."""
+    return pydantic.TypeAdapter(model)
+
+def scan_json_value(text: str, start: int) -> int:
+    """
+    Return the index just past the JSON object/array that opens at `start`.
+
+    If the value is truncated, returns len(text).
+    """
+    depth = 0
+    in_string = False
+    escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            depth += 1
+        elif ch in '}]':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return len(text)
+
+def extract_json(text: str) -> Optional[str]:
+    """
+    Pull the JSON payload out of an LLM response.
+
+    Prefers a ```json fenced block (an unterminated one runs to the end of the text),
+    then any ``` block, then the first bare object or array that parses. Brackets in the
+    prose before the payload (e.g. "[see above]") are skipped: each `{`/`[` is tried in order,
+    first as valid JSON, then as JSON that `repair_json` can fix.
+    """
+    fence = text.find("```json")
+    if fence != -1:
+        match = FENCED_JSON.match(text, fence)
+        return match.group(1)
+    match = FENCED_JSON.search(text)
+    if match and match.group(1).lstrip()[:1] in ('{', '['):
+        return match.group(1)
+    starts = [i for i, ch in enumerate(text) if ch in '{[']
+    if not starts:
+        return None
+    decoder = json.JSONDecoder()
+    for start in starts:
+        try:
+            _, end = decoder.raw_decode(text, start)
+        except ValueError:
+            continue
+        return text[start:end]
+    candidates = [text[start:scan_json_value(text, start)] for start in starts]
+    for candidate in candidates:
+        try:
+            json.loads(repair_json(candidate))
+        except ValueError:
+            continue
+        return candidate
+    return candidates[0]
+
+def repair_json(text: str) -> str:
+    """
+    Fix common defects in LLM-written JSON: trailing commas, and output truncated
+    mid-string, mid-member or before the closing brackets.
+    """
+    out = []
+    closers = []
+    in_string = False
+    escape = False
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            closers.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            strip_trailing_comma(out)
+            if closers:
+                closers.pop()
+        out.append(ch)
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    repaired = ''.join(out).rstrip()
+    if closers:
+        repaired = drop_dangling_member(repaired, closers[-1])
+    return repaired + ''.join(reversed(closers))
+
+def strip_trailing_comma(out: List[str]):
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ',':
+        del out[i:]
+
+def drop_dangling_member(text: str, closer: str) -> str:
+    # Remove a trailing comma, or an object key whose value was never written
+    text = text.rstrip()
+    if text.endswith(','):
+        return text[:-1].rstrip()
+    if closer != '}':
+        return text
+    colon = text.endswith(':')
+    body = text[:-1].rstrip() if colon else text
+    if not body.endswith('"'):
+        return text
+    key_start = body.rfind('"', 0, len(body) - 1)
+    while key_start > 0 and body[key_start - 1] == '\\':
+        key_start = body.rfind('"', 0, key_start - 1)
+    before = body[:key_start].rstrip()
+    if colon or before.endswith(('{', ',')):
+        return before[:-1].rstrip() if before.endswith(',') else before
+    return text
+
+def parse_llm_json(model: Any, text: str, repair: bool = True) -> Any:
+    """
+    Extract, optionally repair, and validate JSON from an LLM response against `model`
+    (a pydantic model or any type TypeAdapter accepts, e.g. List[Candidate]).
+    """
+    payload = extract_json(text)
+    if payload is None:
+        raise LLMJSONError("No JSON found in response")
+    adapter = get_type_adapter(model)
+    try:
+        return adapter.validate_json(payload)
+    except pydantic.ValidationError as e:
+        if not repair:
+            raise LLMJSONError(f"Invalid JSON for {model}: {e}") from e
+        error = e
+    try:
+        return adapter.validate_json(repair_json(payload))
+    except pydantic.ValidationError as e:
+        raise LLMJSONError(f"Invalid JSON for {model}: {error}") from e
+
+class JSONArrayStream:
+    """
+    Incrementally split a streamed top-level JSON array into its object elements.
+
+    Text before the array (prose, a ```json fence) is skipped; `feed` returns the
+    elements completed by each chunk.
+    """
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.done = False
+        self.element = []
+
+    def feed(self, chunk: str) -> List[str]:
+        completed = []
+        for ch in chunk:
+            if self.done:
+                break
+            if not self.started:
+                if ch == '[':
+                    self.started = True
+                    self.depth = 1
+                continue
+            if self.depth > 1:
+                self.element.append(ch)
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                self.depth += 1
+                if self.depth == 2:
+                    self.element = [ch]
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth == 1:
+                    completed.append(''.join(self.element))
+                    self.element = []
+                elif self.depth == 0:
+                    self.done = True
+        return completed
+
+async def iter_json_array(deltas: AsyncIterator[str], model: Any = None) -> AsyncIterator[Any]:
+    """Yield each object of a streamed JSON array as soon as it closes, validated against `model` if given."""
+    stream = JSONArrayStream()
+    adapter = get_type_adapter(model) if model is not None else None
+    async for delta in deltas:
+        for element in stream.feed(delta):
+            if adapter is None:
+                yield json.loads(element)
+            else:
+                yield adapter.validate_json(element)
+        if stream.done:
+            break
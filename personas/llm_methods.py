@@ -1,43 +1,272 @@
 import json
-from typing import Type, Tuple, Any, Union
+import random
+import time
+from typing import Type, Tuple, Any, Union, Optional, Dict, AsyncIterator
 import aiohttp
+import pydantic
 import asyncio
 import os
 
+from .llm_json import LLMJSONError, extract_json, parse_llm_json, repair_json
+
+ANTHROPIC_MESSAGES_URL = "https://api.anthropic.com/v1/messages"
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504, 529}
+
+class AnthropicAPIError(Exception):
+    def __init__(self, status: int, body: str):
+        self.status = status
+        self.body = body
+        super().__init__(f"Anthropic request failed with status code {status}: {body}")
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to `per_minute`; `acquire` waits until enough units are available."""
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = per_minute
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        # Requests larger than the bucket would never fit, so they wait for a full bucket instead
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            self.refill()
+            while self.available < amount:
+                await asyncio.sleep((amount - self.available) / self.rate)
+                self.refill()
+            self.available -= amount
+
+class AnthropicClient:
+    """
+    Long-lived Anthropic messages client.
+
+    Keeps one pooled keep-alive aiohttp session, retries 429/5xx responses and connection errors
+    with exponential backoff (honoring `retry-after`), and optionally limits requests and
+    (estimated) tokens per minute.
+    """
+    def __init__(self, api_key: Optional[str] = None, url: str = ANTHROPIC_MESSAGES_URL, max_connections: int = 16,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 timeout: float = 600, stream_read_timeout: float = 60):
+        self.api_key = api_key
+        self.url = url
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.stream_read_timeout = stream_read_timeout
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.session = None
+        self.session_loop = None
+
+    def headers(self) -> Dict[str, str]:
+        api_key = self.api_key or os.getenv('ANTHROPIC_API_KEY', None)  # Ensure the ANTHROPIC_API_KEY is set in your environment variables
+        if api_key is None:
+            raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
+        return {
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json"
+        }
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # A session is bound to the loop it was created on, so asyncio.run() callers get a fresh one
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.session_loop = loop
+        return self.session
+
+    def retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        delay = min(self.base_delay * 2 ** attempt, self.max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def throttle(self, data: Dict[str, Any]):
+        if self.request_bucket is not None:
+            await self.request_bucket.acquire()
+        if self.token_bucket is not None:
+            # Rough estimate: ~4 characters per input token plus the full output budget
+            estimated = len(json.dumps(data.get("messages", ""))) // 4 + len(data.get("system", "")) // 4 + data.get("max_tokens", 0)
+            await self.token_bucket.acquire(estimated)
+
+    async def post(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        headers = self.headers()
+        attempt = 0
+        while True:
+            await self.throttle(data)
+            retry_after = None
+            try:
+                async with self.get_session().post(self.url, headers=headers, json=data) as response:
+                    if response.status == 200:
+                        return await response.json()
+                    body = await response.text()
+                    if response.status not in RETRYABLE_STATUSES or attempt >= self.max_retries:
+                        raise AnthropicAPIError(response.status, body)
+                    retry_after = response.headers.get("retry-after")
+                    print(f"Request failed with status code: {response.status}, retrying")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                print(f"Request failed: {e!r}, retrying")
+            await asyncio.sleep(self.retry_delay(attempt, retry_after))
+            attempt += 1
+
+    def message_data(self, message: str, model: str, system, temperature, max_tokens) -> Dict[str, Any]:
+        data = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": [
+                {"role": "user", "content": message}
+            ]
+        }
+        if system:
+            data["system"] = system
+        return data
+
+    async def post_message(self, message: str, model: str = "claude-3-opus-20240229", system=None, temperature=0.5, max_tokens=2048) -> Dict[str, Any]:
+        return await self.post(self.message_data(message, model, system, temperature, max_tokens))
+
+    async def stream_message(self, message: str, model: str = "claude-3-opus-20240229", system=None, temperature=0.5, max_tokens=2048) -> AsyncIterator[str]:
+        """
+        Yield text deltas from the streaming messages API as they arrive.
+
+        Failures are retried only until the first delta has been yielded; after that they raise,
+        so no text is yielded twice. Instead of a total timeout, a stream fails when no data
+        arrives for `stream_read_timeout` seconds, so long generations are not cut off.
+        Closing the iterator early (e.g. `break`) closes the connection and stops generation.
+        """
+        data = self.message_data(message, model, system, temperature, max_tokens)
+        data["stream"] = True
+        headers = self.headers()
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.stream_read_timeout)
+        yielded = False
+        attempt = 0
+        while True:
+            await self.throttle(data)
+            retry_after = None
+            try:
+                async with self.get_session().post(self.url, headers=headers, json=data, timeout=timeout) as response:
+                    if response.status == 200:
+                        finished = False
+                        try:
+                            async for event in sse_events(response.content):
+                                if event.get("type") == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                                    yielded = True
+                                    yield event["delta"]["text"]
+                                elif event.get("type") == "error":
+                                    raise AnthropicAPIError(response.status, json.dumps(event))
+                                elif event.get("type") == "message_stop":
+                                    break
+                            finished = True
+                        finally:
+                            if not finished:
+                                # Drop the connection instead of returning it to the pool so the server stops generating
+                                response.close()
+                        return
+                    body = await response.text()
+                    if response.status not in RETRYABLE_STATUSES or attempt >= self.max_retries:
+                        raise AnthropicAPIError(response.status, body)
+                    retry_after = response.headers.get("retry-after")
+                    print(f"Request failed with status code: {response.status}, retrying")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if yielded or attempt >= self.max_retries:
+                    raise
+                print(f"Request failed: {e!r}, retrying")
+            await asyncio.sleep(self.retry_delay(attempt, retry_after))
+            attempt += 1
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        self.session_loop = None
+
+default_client = None
+
+def get_anthropic_client() -> AnthropicClient:
+    """Return the process-wide client used by `post_message_to_anthropic`."""
+    global default_client
+    if default_client is None:
+        default_client = AnthropicClient()
+    return default_client
+
+def set_anthropic_client(client: AnthropicClient):
+    global default_client
+    default_client = client
+
 async def post_message_to_anthropic(message: str, model: str = "claude-3-opus-20240229", system=None, temperature=0.5):
-    anthropic_api_key = os.getenv('ANTHROPIC_API_KEY', None)  # Ensure the ANTHROPIC_API_KEY is set in your environment variables
-    if anthropic_api_key is None:
-        raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
-    url = "https://api.anthropic.com/v1/messages"
-    headers = {
-        "x-api-key": anthropic_api_key,
-        "anthropic-version": "2023-06-01",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": model,
-        "max_tokens": 2048,
-        "temperature": temperature,
-        "messages": [
-            {"role": "user", "content": message}
-        ]
-    }
-    if system:
-        data["system"] = system
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=data) as response:
-            if response.status == 200:
-                print("Request successful.")
-                return await response.json()
-            else:
-                print(f"Request failed with status code: {response.status}")
+    response = await get_anthropic_client().post_message(message, model=model, system=system, temperature=temperature)
+    print("Request successful.")
+    return response
+
+def stream_message_to_anthropic(message: str, model: str = "claude-3-opus-20240229", system=None, temperature=0.5) -> AsyncIterator[str]:
+    return get_anthropic_client().stream_message(message, model=model, system=system, temperature=temperature)
+
+async def sse_events(content: aiohttp.StreamReader) -> AsyncIterator[Dict[str, Any]]:
+    """Parse a server-sent event stream into the JSON payloads of its `data:` lines."""
+    data_lines = []
+    async for raw_line in content:
+        line = raw_line.decode('utf-8').rstrip('\r\n')
+        if line.startswith("data:"):
+            data_lines.append(line[5:].strip())
+        elif line == "" and data_lines:
+            yield json.loads("\n".join(data_lines))
+            data_lines = []
+    if data_lines:
+        yield json.loads("\n".join(data_lines))
+
+async def first_json_block(deltas: AsyncIterator[str], fence: str = "```json") -> Tuple[Optional[str], str]:
+    """
+    Consume text deltas until the first ```json block is closed and stop the stream there.
+
+    Returns:
+    - A tuple of the block contents (None if the stream ended without a complete block) and the text read so far.
+    """
+    text = ""
+    try:
+        async for delta in deltas:
+            text += delta
+            start = text.find(fence)
+            if start == -1:
+                continue
+            body_start = start + len(fence)
+            end = text.find("```", body_start)
+            if end != -1:
+                return text[body_start:end].strip(), text
+        return None, text
+    finally:
+        # Closing the generator closes the HTTP response, cancelling the rest of the generation
+        if hasattr(deltas, "aclose"):
+            await deltas.aclose()
+
+async def stream_json_from_anthropic(message: str, model: str = "claude-3-opus-20240229", system=None, temperature=0.5) -> Tuple[Optional[str], str]:
+    """Stream a response and return as soon as its ```json block is complete."""
+    return await first_json_block(stream_message_to_anthropic(message, model=model, system=system, temperature=temperature))
 
 # Adjusted function to support any model with **kwargs
 async def deserialize_llm_response_json(model: Type[Any], response: str) -> Tuple[Union[Any, None], str]:
     """
     Deserializes a JSON string response into a specified model.
 
+    The JSON may be fenced or surrounded by prose and is repaired if malformed. Pydantic models
+    are validated with a cached TypeAdapter.
+
     Parameters:
     - model: Type[Any] - The model class to deserialize the response into. Must support **kwargs.
     - response: str - The JSON string response.
@@ -47,10 +276,22 @@ async def deserialize_llm_response_json(model: Type[Any], response: str) -> Tupl
         - An instance of the model if deserialization is successful, or None if it fails.
         - An error message indicating the reason for failure or an empty string if successful.
     """
+    if isinstance(model, type) and issubclass(model, pydantic.BaseModel):
+        try:
+            return parse_llm_json(model, response), ''
+        except LLMJSONError as e:
+            return None, f"Malformed JSON response: {e}"
+
+    payload = extract_json(response)
+    if payload is None:
+        return None, "Malformed JSON response: no JSON found"
     try:
-        data = json.loads(response)
-    except json.JSONDecodeError as e:
-        return None, f"Malformed JSON response: {e}"
+        data = json.loads(payload)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(repair_json(payload))
+        except json.JSONDecodeError as e:
+            return None, f"Malformed JSON response: {e}"
 
     try:
         model_instance = model(**data)
@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+class ResponseStore:
+    """
+    Persistent store of LLM responses keyed on the full request payload.
+
+    The database is opened once and kept open; identical requests that are in flight at the
+    same time share a single call to `fetch` (single-flight) instead of each hitting the API.
+    WAL mode lets other processes read the store while this one writes.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, payload TEXT NOT NULL, response TEXT NOT NULL)")
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+
+    @staticmethod
+    def key(payload: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def get(self, payload: Dict[str, Any]) -> Optional[Any]:
+        with self.lock:
+            row = self.connection.execute("SELECT response FROM responses WHERE key = ?", (self.key(payload),)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, payload: Dict[str, Any], response: Any):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, payload, response) VALUES (?, ?, ?)",
+                (self.key(payload), json.dumps(payload, sort_keys=True), json.dumps(response)),
+            )
+
+    async def get_or_fetch(self, payload: Dict[str, Any], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the stored response for `payload`, calling `fetch` on a miss.
+
+        Failed fetches (exceptions or None) are not stored, so the next call retries.
+        """
+        key = self.key(payload)
+        inflight = self.inflight.get(key)
+        if inflight is not None:
+            self.joined += 1
+            return await asyncio.shield(inflight)
+        response = self.get(payload)
+        if response is not None:
+            self.hits += 1
+            return response
+        self.misses += 1
+        # The fetch runs as its own task, so a cancelled caller only stops its own wait
+        inflight = asyncio.ensure_future(self.fetch_and_store(payload, fetch))
+        self.inflight[key] = inflight
+        inflight.add_done_callback(lambda done: self.fetch_done(key, done))
+        return await asyncio.shield(inflight)
+
+    async def fetch_and_store(self, payload: Dict[str, Any], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        response = await fetch()
+        if response is not None:
+            self.put(payload, response)
+        return response
+
+    def fetch_done(self, key: str, done: asyncio.Future):
+        if self.inflight.get(key) is done:
+            del self.inflight[key]
+        if not done.cancelled():
+            # Every waiter may have been cancelled; retrieve the exception to avoid "never retrieved" warnings
+            done.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(response)), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses + self.joined
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "joined": self.joined,
+            "hit_rate": (self.hits + self.joined) / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+_stores: Dict[str, ResponseStore] = {}
+
+def open_response_store(path: str) -> ResponseStore:
+    """Return the process-wide ResponseStore for `path`, opening it on first use."""
+    path = os.path.abspath(path)
+    store = _stores.get(path)
+    if store is None:
+        store = ResponseStore(path)
+        _stores[path] = store
+    return store
@@ -1,2 +1,11 @@
 from .pipeline import Pipeline, PipelineError, OutputMismatchError
 from .task import task, set_output, get_output, TaskExecutionError
+from .task import Composable, TaskGroup, SetOutput, GetOutput, GraphNode, Task, Reject
+from .pipeline_context import PipelineContext
+from .executor import INLINE, THREAD, PROCESS, ExecutorModeError
+from .scheduler import Scheduler
+from .batching import BatchedTask, batched_task
+from .cache import CacheBackend, MemoryCache, SQLiteCache, stable_hash
+from .tracing import Tracer, Span
+from .params import Param, param, resolve, UnboundParameterError
+from .ordering import AdaptiveFilterChain, StageStats
@@ -0,0 +1,97 @@
+import asyncio
+import functools
+import time
+from typing import Any, Callable, List, Union, Awaitable
+
+from .task import Task, TaskExecutionError
+from .executor import ExecutionMode
+from .pipeline_context import PipelineContext
+from .cache import CacheBackend
+from .tracing import current_span
+
+class BatchedTask(Task):
+    """A Task whose function takes a list of inputs and returns a list of results.
+
+    Concurrent single-item calls (typically from many pipeline invocations) are collected
+    until `max_batch` items are queued or `max_wait_ms` has passed since the first one, then
+    the function is called once and each caller receives its own result. A call with one
+    positional argument contributes that argument to the batch, otherwise its args tuple.
+    """
+    def __init__(self, func: Callable[[List[Any]], Union[Awaitable[List[Any]], List[Any]]], name: str = None,
+                 max_batch: int = 8, max_wait_ms: float = 10, executor: ExecutionMode = None, resource: str = None,
+                 cache: CacheBackend = None, version: str = None):
+        super().__init__(func, name, executor, resource, cache, version)
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.pending = []
+        self.pending_context = None
+        self.timer = None
+        self.running = set()
+        self.batch_sizes = []
+
+    async def schedule(self, context: PipelineContext, *args, **kwargs) -> Any:
+        if kwargs:
+            raise TypeError(f"Batched task '{self.name}' does not accept keyword arguments")
+        item = args[0] if len(args) == 1 else args
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self.pending:
+            self.pending_context = context
+            self.timer = loop.call_later(self.max_wait_ms / 1000, self.flush)
+        self.pending.append((item, future, current_span.get()))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        # Time spent waiting for the batch to fill counts as queue wait
+        now = time.perf_counter()
+        for _, _, span in batch:
+            if span is not None:
+                span.wait = now - span.start
+        batch = [(item, future) for item, future, _ in batch]
+        run = asyncio.ensure_future(self.run_batch(self.pending_context, batch))
+        self.running.add(run)
+        run.add_done_callback(self.running.discard)
+
+    async def run_batch(self, context: PipelineContext, batch):
+        # Callers cancelled while waiting are dropped before the batch is sent
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+        self.batch_sizes.append(len(batch))
+        items = [item for item, _ in batch]
+        try:
+            scheduler = getattr(context, "scheduler", None)
+            if scheduler is None:
+                results = await self.run(context, items)
+            else:
+                async with scheduler.slot(self.resource):
+                    results = await self.run(context, items)
+            if results is None or len(results) != len(items):
+                raise TaskExecutionError(self.name, f"expected {len(items)} results, got {results!r}", None)
+        except BaseException as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+def batched_task(func: Callable[[List[Any]], Any] = None, name: str = None, max_batch: int = 8, max_wait_ms: float = 10,
+                 executor: ExecutionMode = None, resource: str = None, cache: CacheBackend = None, version: str = None) -> BatchedTask:
+    if func is None:
+        return functools.partial(batched_task, name=name, max_batch=max_batch, max_wait_ms=max_wait_ms,
+                                 executor=executor, resource=resource, cache=cache, version=version)
+    return BatchedTask(func, name, max_batch, max_wait_ms, executor, resource, cache, version)
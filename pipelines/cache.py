@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+MISS = object()
+
+HASHED_FILE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+
+_file_digests = {}
+
+def file_digest(path: str) -> str:
+    """sha256 of a file's contents, memoized on (path, mtime, size)."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    digest = _file_digests.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _file_digests[memo_key] = digest
+    return digest
+
+def canonicalize(value: Any) -> Any:
+    """Convert a value into a JSON-serializable structure that is stable across runs."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        if value.lower().endswith(HASHED_FILE_EXTENSIONS) and os.path.isfile(value):
+            return {"__file__": file_digest(value)}
+        return value
+    if isinstance(value, os.PathLike):
+        return canonicalize(os.fspath(value))
+    if isinstance(value, bytes):
+        return {"__bytes__": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((canonicalize(v) for v in value), key=lambda v: json.dumps(v, sort_keys=True))
+    if isinstance(value, dict):
+        return {str(k): canonicalize(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if hasattr(value, "model_dump"):
+        return {"__model__": type(value).__qualname__, "data": canonicalize(value.model_dump(mode="json"))}
+    if hasattr(value, "cache_key"):
+        # Objects that know their own content identity, e.g. in-memory generated images
+        return {"__key__": type(value).__qualname__, "data": canonicalize(value.cache_key())}
+    raise TypeError(f"Cannot build a cache key from {type(value).__name__}")
+
+def stable_hash(*parts: Any) -> str:
+    encoded = json.dumps(canonicalize(parts), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+class CacheBackend:
+    def get(self, key: str) -> Any:
+        """Return the cached value or MISS."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any):
+        raise NotImplementedError
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache with optional TTL in seconds."""
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        entry = self.entries.get(key)
+        if entry is None:
+            return MISS
+        created, value = entry
+        if self.ttl is not None and time.time() - created > self.ttl:
+            del self.entries[key]
+            return MISS
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self.entries[key] = (time.time(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+class SQLiteCache(CacheBackend):
+    """On-disk cache of pickled values evicted by TTL, entry count and total size (least recently used first)."""
+    def __init__(self, path: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS task_cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS task_cache_accessed ON task_cache (accessed)")
+
+    def get(self, key: str) -> Any:
+        with self.lock:
+            row = self.connection.execute("SELECT value, created FROM task_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return MISS
+            value, created = row
+            now = time.time()
+            with self.connection:
+                if self.ttl is not None and now - created > self.ttl:
+                    self.connection.execute("DELETE FROM task_cache WHERE key = ?", (key,))
+                    return MISS
+                self.connection.execute("UPDATE task_cache SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(value)
+
+    def set(self, key: str, value: Any):
+        blob = pickle.dumps(value)
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO task_cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            self.evict(now)
+
+    def evict(self, now: float):
+        if self.ttl is not None:
+            self.connection.execute("DELETE FROM task_cache WHERE created < ?", (now - self.ttl,))
+        if self.max_entries is not None:
+            self.connection.execute(
+                "DELETE FROM task_cache WHERE key IN (SELECT key FROM task_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            total, = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM task_cache").fetchone()
+            for key, size in self.connection.execute("SELECT key, size FROM task_cache ORDER BY accessed").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.connection.execute("DELETE FROM task_cache WHERE key = ?", (key,))
+                total -= size
+
+    def close(self):
+        self.connection.close()
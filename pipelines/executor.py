@@ -0,0 +1,78 @@
+import asyncio
+import contextvars
+import functools
+import importlib
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Union
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+
+EXECUTION_MODES = (INLINE, THREAD, PROCESS)
+
+ExecutionMode = Union[str, Executor, None]
+
+_process_pool = None
+
+class ExecutorModeError(ValueError):
+    pass
+
+def validate_mode(mode: ExecutionMode) -> ExecutionMode:
+    if mode is None or isinstance(mode, Executor) or mode in EXECUTION_MODES:
+        return mode
+    raise ExecutorModeError(f"Unknown execution mode '{mode}', expected one of {EXECUTION_MODES} or an Executor")
+
+def is_process_mode(mode: ExecutionMode) -> bool:
+    return mode == PROCESS or isinstance(mode, ProcessPoolExecutor)
+
+def validate_process_target(func: Callable[..., Any]):
+    """
+    Process workers re-import the function by module and qualified name, so it must be defined
+    at module level; nested functions and lambdas would only fail once the task runs.
+    """
+    qualname = getattr(func, "__qualname__", "")
+    if "<locals>" in qualname or "<lambda>" in qualname:
+        raise ExecutorModeError(
+            f"'{qualname}' cannot run in process mode: the function must be defined at module level of {func.__module__}"
+        )
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Lazily create the process pool shared by all 'process' tasks."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor()
+    return _process_pool
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown()
+        _process_pool = None
+
+def _resolve_and_call(module: str, qualname: str, args, kwargs):
+    # Functions decorated with @task are shadowed by their Task in the module namespace,
+    # so the worker process looks the name up again and unwraps the Task.
+    target = importlib.import_module(module)
+    for attr in qualname.split("."):
+        target = getattr(target, attr)
+    target = getattr(target, "func", target)
+    return target(*args, **kwargs)
+
+async def run_sync(func: Callable[..., Any], args, kwargs: Dict[str, Any], mode: ExecutionMode = INLINE) -> Any:
+    """Run a synchronous function inline, on a thread pool or on a process pool."""
+    if mode is None or mode == INLINE:
+        return func(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    if mode == THREAD:
+        # Copy contextvars (e.g. bound pipeline params) into the worker thread
+        return await loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, func, *args, **kwargs))
+    if is_process_mode(mode):
+        validate_process_target(func)
+    if mode == PROCESS:
+        call = functools.partial(_resolve_and_call, func.__module__, func.__qualname__, args, kwargs)
+        return await loop.run_in_executor(get_process_pool(), call)
+    if isinstance(mode, ProcessPoolExecutor):
+        call = functools.partial(_resolve_and_call, func.__module__, func.__qualname__, args, kwargs)
+        return await loop.run_in_executor(mode, call)
+    return await loop.run_in_executor(mode, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,96 @@
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from .task import GraphNode, Reject
+from .pipeline_context import PipelineContext
+
+class StageStats:
+    def __init__(self, calls: int = 0, passes: int = 0, seconds: float = 0.0):
+        self.calls = calls
+        self.passes = passes
+        self.seconds = seconds
+
+    @property
+    def pass_rate(self) -> float:
+        # Laplace smoothing keeps unseen stages at 0.5 and never reaches exactly 0 or 1
+        return (self.passes + 1) / (self.calls + 2)
+
+    def mean_cost(self, default: float) -> float:
+        return self.seconds / self.calls if self.calls else default
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"calls": self.calls, "passes": self.passes, "seconds": self.seconds}
+
+class AdaptiveFilterChain(GraphNode):
+    """
+    Runs independent filter stages, cheapest-and-most-rejecting first.
+
+    Every stage receives the same input and either passes it through or returns a Reject (or None).
+    The chain stops at the first rejection, so for independent filters the expected cost per item
+    is minimized by ordering stages by mean_cost / (1 - pass_rate). Statistics are collected as the
+    chain runs and, given `stats_path`, loaded from and saved to JSON so the order carries over
+    between runs.
+    """
+    def __init__(self, stages: List[GraphNode], stats_path: Optional[str] = None, name: str = None):
+        self.stages = list(stages)
+        self.name = name or "adaptive(" + ", ".join(str(stage.name) for stage in self.stages) + ")"
+        self.stats_path = stats_path
+        self.stats: Dict[str, StageStats] = {str(stage.name): StageStats() for stage in self.stages}
+        if stats_path is not None and os.path.exists(stats_path):
+            self.load(stats_path)
+
+    def load(self, path: str):
+        with open(path, 'r') as file:
+            saved = json.load(file)
+        for name, values in saved.items():
+            if name in self.stats:
+                self.stats[name] = StageStats(**values)
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.stats_path
+        saved = {}
+        if os.path.exists(path):
+            # Keep statistics for stages not part of this chain (e.g. questions removed for now)
+            with open(path, 'r') as file:
+                saved = json.load(file)
+        saved.update({name: stats.to_dict() for name, stats in self.stats.items()})
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(saved, file, indent=2)
+        os.replace(tmp_path, path)
+
+    def rank(self, stage: GraphNode, default_cost: float) -> float:
+        stats = self.stats[str(stage.name)]
+        return stats.mean_cost(default_cost) / (1 - stats.pass_rate)
+
+    def order(self) -> List[GraphNode]:
+        known = [stats.seconds / stats.calls for stats in self.stats.values() if stats.calls]
+        default_cost = sum(known) / len(known) if known else 1.0
+        return sorted(self.stages, key=lambda stage: self.rank(stage, default_cost))
+
+    def expected_cost(self, stages: Optional[List[GraphNode]] = None) -> float:
+        """Expected seconds per item for an ordering (the current optimal one by default)."""
+        stages = stages if stages is not None else self.order()
+        known = [stats.seconds / stats.calls for stats in self.stats.values() if stats.calls]
+        default_cost = sum(known) / len(known) if known else 1.0
+        cost, reach = 0.0, 1.0
+        for stage in stages:
+            stats = self.stats[str(stage.name)]
+            cost += reach * stats.mean_cost(default_cost)
+            reach *= stats.pass_rate
+        return cost
+
+    async def __call__(self, context: PipelineContext, *args, **kwargs):
+        result = args[0] if len(args) == 1 else args
+        for stage in self.order():
+            start = time.perf_counter()
+            result = await stage(context, *args, **kwargs)
+            stats = self.stats[str(stage.name)]
+            stats.calls += 1
+            stats.seconds += time.perf_counter() - start
+            if result is None or isinstance(result, Reject):
+                return result
+            stats.passes += 1
+        return result
@@ -0,0 +1,48 @@
+import contextvars
+from typing import Any
+
+from .task import GraphNode
+from .pipeline_context import PipelineContext
+
+current_params = contextvars.ContextVar("current_params", default=None)
+
+MISSING = object()
+
+class UnboundParameterError(Exception):
+    def __init__(self, name: str):
+        self.name = name
+        super().__init__(f"Pipeline parameter '{name}' is not bound")
+
+class Param(GraphNode):
+    """
+    Placeholder for a value bound per invocation with `Pipeline.bind(name=value)`.
+
+    Used as a graph node it produces the bound value (`param("filename") >> filter_vlm(q)`);
+    task factories can also close over it and call `resolve(p)` when the task runs.
+    """
+    def __init__(self, name: str, default: Any = MISSING):
+        self.name = name
+        self.default = default
+
+    async def __call__(self, context: PipelineContext, *args, **kwargs) -> Any:
+        return self.get(context)
+
+    def get(self, context: PipelineContext = None) -> Any:
+        params = context.params if context is not None else current_params.get()
+        if params is not None and self.name in params:
+            return params[self.name]
+        if self.default is not MISSING:
+            return self.default
+        raise UnboundParameterError(self.name)
+
+    def __repr__(self):
+        return f"Param({self.name!r})"
+
+def param(name: str, default: Any = MISSING) -> Param:
+    return Param(name, default)
+
+def resolve(value: Any) -> Any:
+    """Return the bound value of a Param for the running pipeline, or `value` unchanged."""
+    if isinstance(value, Param):
+        return value.get()
+    return value
@@ -1,7 +1,14 @@
 from .task import Composable, TaskGroup, SetOutput, GetOutput, GraphNode, Task
 from .pipeline_context import PipelineContext
+from .executor import ExecutionMode, validate_mode
+from .scheduler import Scheduler
+from .tracing import Tracer
+from .plan import ExecutionPlan
+from .params import current_params
 import asyncio
-from typing import Callable, TypeVar, Generic, Union, Awaitable, Dict, Any, List
+import copy
+from collections import Counter
+from typing import Callable, TypeVar, Generic, Union, Awaitable, Dict, Any, List, AsyncIterator, AsyncIterable, Iterable, Tuple
 
 class PipelineError(Exception):
     pass
@@ -10,8 +17,16 @@ class OutputMismatchError(Exception):
     pass
 
 class Pipeline:
-    def __init__(self, *subgraphs: Composable):
+    def __init__(self, *subgraphs: Composable, executor: ExecutionMode = None, scheduler: Scheduler = None, tracer: Tracer = None,
+                 params: Dict[str, Any] = None):
         self.subgraphs = subgraphs
+        self.executor = validate_mode(executor)
+        self.scheduler = scheduler
+        self.tracer = tracer
+        self.params = dict(params or {})
+        # Per-stage count of Reject results across every invocation (shared with bound copies)
+        self.rejections = Counter()
+        self.plan = None
         self.validate_pipeline()
 
     def validate_pipeline(self):
@@ -26,20 +41,121 @@ class Pipeline:
             raise OutputMismatchError(get_outputs - set_outputs)
 
     def traverse_dag(self, task, set_outputs, get_outputs):
-        if isinstance(task, SetOutput):
-            set_outputs.add(task.name)
-        elif isinstance(task, GetOutput):
-            get_outputs.add(task.name)
-        elif isinstance(task, TaskGroup):
-            for subtask in task.tasks:
-                self.traverse_dag(subtask, set_outputs, get_outputs)
+        # Iterative so chains nested thousands of groups deep don't hit the recursion limit
+        stack = [task]
+        while stack:
+            task = stack.pop()
+            if isinstance(task, SetOutput):
+                set_outputs.add(task.name)
+            elif isinstance(task, GetOutput):
+                get_outputs.add(task.name)
+            elif isinstance(task, TaskGroup):
+                stack.extend(task.tasks)
+
+    def compile(self) -> 'Pipeline':
+        """
+        Flatten the subgraphs into an ExecutionPlan used by every later call.
+
+        Nested sequential groups are inlined, so deep `>>` chains run in a single loop instead of
+        one nested await per group. TaskGroup spans are not traced for compiled pipelines.
+        """
+        plan = ExecutionPlan(self.subgraphs)
+        if len(plan.requires - plan.provides) > 0:
+            raise OutputMismatchError(plan.requires - plan.provides)
+        self.plan = plan
+        return self
+
+    def bind(self, **params) -> 'Pipeline':
+        """
+        Return a copy of this pipeline with `params` bound for its Param placeholders.
+
+        The copy shares the subgraphs, compiled plan, scheduler and tracer, so binding skips
+        construction and validation entirely.
+        """
+        bound = copy.copy(self)
+        bound.params = {**self.params, **params}
+        return bound
 
     async def __call__(self, *args, context: PipelineContext = None, **kwargs) -> List[Any]:
         if context is None:
-            context = PipelineContext()
-        outputs = []
-        subgraphs_to_execute = [subgraph(context, *args, **kwargs) for subgraph in self.subgraphs]
-        outputs = await asyncio.gather(*subgraphs_to_execute)
+            context = self.new_context()
+        token = current_params.set(context.params)
+        try:
+            if self.plan is not None:
+                outputs = await self.plan(context, args, kwargs)
+            else:
+                subgraphs_to_execute = [subgraph(context, *args, **kwargs) for subgraph in self.subgraphs]
+                outputs = await asyncio.gather(*subgraphs_to_execute)
+        finally:
+            current_params.reset(token)
         if len(outputs) == 1:
             return outputs[0]
         return outputs
+
+    def new_context(self) -> PipelineContext:
+        return PipelineContext(executor=self.executor, scheduler=self.scheduler, tracer=self.tracer, params=dict(self.params), rejections=self.rejections)
+
+    async def run_item(self, index: int, item: Any, return_exceptions: bool = False) -> Tuple[int, Any, Any]:
+        # Tuples are unpacked into positional arguments, like between sequential stages
+        args = item if isinstance(item, tuple) else (item,)
+        try:
+            return index, item, await self(*args, context=self.new_context())
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return index, item, e
+
+    async def stream(self, inputs: Union[Iterable, AsyncIterable], concurrency: int = 8, ordered: bool = False,
+                     return_exceptions: bool = False) -> AsyncIterator[Tuple[Any, Any]]:
+        """Run the pipeline over `inputs`, yielding (input, result) pairs with at most `concurrency` items in flight.
+
+        Inputs are only pulled when a slot frees up. With `ordered=True` results are yielded in input order
+        and finished items waiting on a slower predecessor still count against `concurrency`.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        iterator = aiter_inputs(inputs)
+        pending = set()
+        finished = {}
+        next_index = 0
+        next_yield = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) + len(finished) < concurrency:
+                    try:
+                        item = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(self.run_item(next_index, item, return_exceptions)))
+                    next_index += 1
+                if not pending and not finished:
+                    return
+                if pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for future in done:
+                        index, item, result = future.result()
+                        finished[index] = (item, result)
+                if ordered:
+                    while next_yield in finished:
+                        yield finished.pop(next_yield)
+                        next_yield += 1
+                else:
+                    for index in sorted(finished):
+                        yield finished.pop(index)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def map(self, inputs: Union[Iterable, AsyncIterable], concurrency: int = 8, return_exceptions: bool = False) -> List[Any]:
+        """Run the pipeline over `inputs` and return the results in input order."""
+        return [result async for _, result in self.stream(inputs, concurrency=concurrency, ordered=True, return_exceptions=return_exceptions)]
+
+async def aiter_inputs(inputs: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    if hasattr(inputs, "__aiter__"):
+        async for item in inputs:
+            yield item
+    else:
+        for item in inputs:
+            yield item
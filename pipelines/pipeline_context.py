@@ -1,9 +1,15 @@
 import asyncio
+from collections import Counter
 
 class PipelineContext:
-    def __init__(self):
+    def __init__(self, executor=None, scheduler=None, tracer=None, params=None, rejections=None):
         self.outputs = {}
         self.events = {}
+        self.executor = executor
+        self.scheduler = scheduler
+        self.tracer = tracer
+        self.params = params if params is not None else {}
+        self.rejections = rejections if rejections is not None else Counter()
 
     async def set_output(self, name, value):
         """Set the output value and notify any waiters."""
@@ -20,5 +26,12 @@ class PipelineContext:
         if name not in self.events:
             self.events[name] = asyncio.Event()
 
-        await self.events[name].wait()
+        if self.tracer is None:
+            await self.events[name].wait()
+            return self.outputs[name]
+        span = self.tracer.start("get_output", name)
+        try:
+            await self.events[name].wait()
+        finally:
+            self.tracer.end(span)
         return self.outputs[name]
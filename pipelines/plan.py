@@ -0,0 +1,111 @@
+import asyncio
+from typing import Any, List, Set, Tuple
+
+from .task import Composable, TaskGroup, GetOutput, SetOutput, Reject
+from .pipeline_context import PipelineContext
+
+# Step kinds
+CALL = 0
+GET = 1
+PARALLEL = 2
+
+Step = Tuple[int, Any]
+
+def flatten_sequence(group: TaskGroup) -> List[Step]:
+    """
+    Flatten a sequential TaskGroup, inlining nested sequential groups.
+
+    `a >> b >> c` built with reduce nests one group per stage; inlining them is equivalent because a
+    sequential group passes its last result on exactly like a single stage would. Iterative, so
+    arbitrarily deep chains compile without hitting the recursion limit.
+    """
+    steps = []
+    stack = [iter(group.tasks)]
+    while stack:
+        child = next(stack[-1], None)
+        if child is None:
+            stack.pop()
+        elif type(child) is TaskGroup and not child.parallel:
+            stack.append(iter(child.tasks))
+        else:
+            steps.append(compile_step(child))
+    return steps
+
+def compile_step(node: Composable) -> Step:
+    if type(node) is TaskGroup and node.parallel:
+        return (PARALLEL, [compile_branch(child) for child in node.tasks])
+    if isinstance(node, GetOutput):
+        return (GET, node.name)
+    return (CALL, node)
+
+def compile_branch(node: Composable) -> List[Step]:
+    if type(node) is TaskGroup and not node.parallel:
+        return flatten_sequence(node)
+    return [compile_step(node)]
+
+def compile_subgraph(node: Composable) -> List[Step]:
+    # A bare GetOutput subgraph is called directly (and returns None), same as Pipeline does
+    if isinstance(node, GetOutput):
+        return [(CALL, node)]
+    return compile_branch(node)
+
+def step_outputs(steps: List[Step]) -> Tuple[Set[str], Set[str]]:
+    """Names a compiled branch sets and gets."""
+    provides, requires = set(), set()
+    stack = [steps]
+    while stack:
+        for kind, payload in stack.pop():
+            if kind == PARALLEL:
+                stack.extend(payload)
+            elif kind == GET:
+                requires.add(payload)
+            elif isinstance(payload, SetOutput):
+                provides.add(payload.name)
+            elif isinstance(payload, GetOutput):
+                requires.add(payload.name)
+    return provides, requires
+
+async def run_steps(steps: List[Step], context: PipelineContext, args, kwargs) -> Any:
+    for kind, payload in steps:
+        # Same argument routing as TaskGroup: a single result becomes the only positional arg
+        if not isinstance(args, list) and not isinstance(args, tuple) and args != ():
+            args = [args]
+        if kind == CALL:
+            args = await payload(context, *args, **kwargs)
+        elif kind == GET:
+            args = await context.get_output(payload)
+        else:
+            args = await asyncio.gather(*[run_steps(branch, context, args, kwargs) for branch in payload])
+        if isinstance(args, Reject):
+            return args
+    return args
+
+class ExecutionPlan:
+    """A Pipeline's subgraphs compiled into flat step lists executed by `run_steps`."""
+    def __init__(self, subgraphs):
+        self.branches = [compile_subgraph(subgraph) for subgraph in subgraphs]
+        self.outputs = [step_outputs(branch) for branch in self.branches]
+
+    @property
+    def provides(self) -> Set[str]:
+        return set().union(*(provides for provides, _ in self.outputs))
+
+    @property
+    def requires(self) -> Set[str]:
+        return set().union(*(requires for _, requires in self.outputs))
+
+    def __len__(self):
+        count = 0
+        stack = list(self.branches)
+        while stack:
+            for kind, payload in stack.pop():
+                if kind == PARALLEL:
+                    stack.extend(payload)
+                else:
+                    count += 1
+        return count
+
+    async def __call__(self, context: PipelineContext, args, kwargs) -> List[Any]:
+        if len(self.branches) == 1:
+            return [await run_steps(self.branches[0], context, args, kwargs)]
+        return await asyncio.gather(*[run_steps(branch, context, args, kwargs) for branch in self.branches])
@@ -0,0 +1,45 @@
+import asyncio
+import contextlib
+from typing import Dict, Optional
+
+class Scheduler:
+    """Caps how many tasks run at once, globally and per named resource.
+
+    A single Scheduler is meant to be shared by every invocation of a Pipeline (or by several
+    pipelines) so that e.g. hundreds of concurrent runs still only send 2 requests to "sdwebui".
+    """
+    def __init__(self, limits: Optional[Dict[str, int]] = None, max_concurrency: Optional[int] = None):
+        self.limits = dict(limits or {})
+        self.max_concurrency = max_concurrency
+        self.semaphores = {name: asyncio.Semaphore(limit) for name, limit in self.limits.items()}
+        self.global_semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.active = {}
+
+    def set_limit(self, resource: str, limit: int):
+        if self.active.get(resource):
+            raise RuntimeError(f"Cannot change the limit of '{resource}' while it has running tasks")
+        self.limits[resource] = limit
+        self.semaphores[resource] = asyncio.Semaphore(limit)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, resource: Optional[str] = None):
+        """Wait for a free global slot and a free slot on `resource`, then hold both."""
+        semaphore = self.semaphores.get(resource)
+        # Resource first so tasks queued on a saturated resource don't hog global slots
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            if self.global_semaphore is not None:
+                await self.global_semaphore.acquire()
+            try:
+                self.active[resource] = self.active.get(resource, 0) + 1
+                try:
+                    yield
+                finally:
+                    self.active[resource] -= 1
+            finally:
+                if self.global_semaphore is not None:
+                    self.global_semaphore.release()
+        finally:
+            if semaphore is not None:
+                semaphore.release()
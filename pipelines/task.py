@@ -1,9 +1,13 @@
 import asyncio
 import inspect
 import functools
+import time
 from typing import Callable, TypeVar, Generic, Union, Awaitable, Dict, Any, List
 
 from .pipeline_context import PipelineContext
+from .executor import ExecutionMode, is_process_mode, run_sync, validate_mode, validate_process_target
+from .cache import CacheBackend, MISS, stable_hash
+from .tracing import current_span
 
 class TaskExecutionError(Exception):
     def __init__(self, task_name: str, message: str, original_exception: Exception):
@@ -12,6 +16,34 @@ class TaskExecutionError(Exception):
         self.original_exception = original_exception
         super().__init__(f"Error executing task '{task_name}': {message}")
 
+class Reject:
+    """
+    Returned by a task to reject its input.
+
+    A sequential TaskGroup stops at the first Reject and returns it, with `stage` set to the
+    name of the task that rejected. Rejects are falsy.
+    """
+    __slots__ = ("reason", "stage")
+
+    def __init__(self, reason: Any = None, stage: str = None):
+        self.reason = reason
+        self.stage = stage
+
+    def __bool__(self):
+        return False
+
+    def __eq__(self, other):
+        return isinstance(other, Reject) and (self.reason, self.stage) == (other.reason, other.stage)
+
+    def __hash__(self):
+        return hash((Reject, self.stage))
+
+    def __reduce__(self):
+        return (Reject, (self.reason, self.stage))
+
+    def __repr__(self):
+        return f"Reject({self.reason!r}, stage={self.stage!r})"
+
 # Credit to Claude 3 Opus 20240220 and ChatGPT
 T = TypeVar('T')
 R = TypeVar('R')
@@ -38,7 +70,20 @@ class TaskGroup(Composable[T, R]):
         return task(context, *args, **kwargs)
 
     async def __call__(self, context, *args, **kwargs):
-
+        tracer = getattr(context, "tracer", None)
+        if tracer is None:
+            return await self.execute(context, *args, **kwargs)
+        separator = " | " if self.parallel else " >> "
+        span = tracer.start("group", separator.join(str(name) for name in self.name), args)
+        try:
+            result = await self.execute(context, *args, **kwargs)
+        except BaseException as e:
+            tracer.end(span, e)
+            raise
+        tracer.end(span)
+        return result
+
+    async def execute(self, context, *args, **kwargs):
         if self.parallel:
             # Use a comprehension with the execute_task method for parallel execution
             tasks_to_execute = [self.execute_task(task, context, *args, **kwargs) for task in self.tasks]
@@ -50,6 +95,8 @@ class TaskGroup(Composable[T, R]):
             if not isinstance(args, list) and not isinstance(args, tuple) and args != ():
                 args = [args]
             result = await self.execute_task(task, context, *args, **kwargs)
+            if isinstance(result, Reject):
+                return result
             args = result
         # For sequential tasks, return the last result if there is one
         return args
@@ -81,16 +128,80 @@ class GraphNode(Composable[T, R]):
         return other.__or__(self)
 
 class Task(GraphNode[T, R]):
-    def __init__(self, func: Callable[..., Union[Awaitable[R], R]], name: str = None):
+    def __init__(self, func: Callable[..., Union[Awaitable[R], R]], name: str = None, executor: ExecutionMode = None, resource: str = None,
+                 cache: CacheBackend = None, version: str = None):
         self.func = func
         self.name = name or func.__name__
+        self.executor = validate_mode(executor)
+        if is_process_mode(self.executor) and not inspect.iscoroutinefunction(func):
+            validate_process_target(func)
+        self.resource = resource
+        self.cache = cache
+        self.version = version
+
+    def resolve_executor(self, context: PipelineContext) -> ExecutionMode:
+        if self.executor is not None:
+            return self.executor
+        return getattr(context, "executor", None)
+
+    def cache_key(self, args, kwargs) -> str:
+        # Bump `version` whenever the task body changes in a way that invalidates old results
+        return stable_hash(self.name, self.version, args, kwargs)
 
     async def __call__(self, context: PipelineContext, *args, **kwargs) -> R:
+        tracer = getattr(context, "tracer", None)
+        if tracer is None:
+            return await self.call(context, *args, **kwargs)
+        span = tracer.start("task", self.name, args)
+        token = current_span.set(span)
+        try:
+            result = await self.call(context, *args, **kwargs)
+        except BaseException as e:
+            tracer.end(span, e)
+            raise
+        finally:
+            current_span.reset(token)
+        tracer.end(span)
+        return result
+
+    async def call(self, context: PipelineContext, *args, **kwargs) -> R:
+        if self.cache is None:
+            result = await self.schedule(context, *args, **kwargs)
+        else:
+            key = self.cache_key(args, kwargs)
+            result = self.cache.get(key)
+            if result is MISS:
+                result = await self.schedule(context, *args, **kwargs)
+                self.cache.set(key, result)
+        if isinstance(result, Reject):
+            result = self.record_rejection(context, result)
+        return result
+
+    def record_rejection(self, context: PipelineContext, result: Reject) -> Reject:
+        if result.stage is None:
+            result = Reject(result.reason, self.name)
+        rejections = getattr(context, "rejections", None)
+        if rejections is not None and result.stage == self.name:
+            rejections[self.name] += 1
+        return result
+
+    async def schedule(self, context: PipelineContext, *args, **kwargs) -> R:
+        scheduler = getattr(context, "scheduler", None)
+        if scheduler is None:
+            return await self.run(context, *args, **kwargs)
+        span = current_span.get()
+        queued = time.perf_counter()
+        async with scheduler.slot(self.resource):
+            if span is not None:
+                span.wait = time.perf_counter() - queued
+            return await self.run(context, *args, **kwargs)
+
+    async def run(self, context: PipelineContext, *args, **kwargs) -> R:
         try:
             if inspect.iscoroutinefunction(self.func):
                 return await self.func(*args, **kwargs)
             else:
-                return self.func(*args, **kwargs)
+                return await run_sync(self.func, args, kwargs, self.resolve_executor(context))
         except Exception as e:
             raise TaskExecutionError(self.name, str(e), e) from e
 
@@ -109,8 +220,11 @@ class GetOutput(GraphNode[T, T]):
     async def __call__(self, context: PipelineContext, *args, **kwargs) -> T:
         return None
 
-def task(func: Callable[..., Awaitable[R]], name: str = None) -> Task[T, R]:
-    return Task(func, name)
+def task(func: Callable[..., Awaitable[R]] = None, name: str = None, executor: ExecutionMode = None, resource: str = None,
+         cache: CacheBackend = None, version: str = None) -> Task[T, R]:
+    if func is None:
+        return functools.partial(task, name=name, executor=executor, resource=resource, cache=cache, version=version)
+    return Task(func, name, executor, resource, cache, version)
 
 def set_output(name: str) -> SetOutput[T]:
     return SetOutput(name)
@@ -0,0 +1,125 @@
+import asyncio
+import contextvars
+import json
+import math
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("kind", "name", "start", "end", "wait", "args_size", "error", "track")
+
+    def __init__(self, kind: str, name: str, start: float, args_size: int, track: int):
+        self.kind = kind
+        self.name = name
+        self.start = start
+        self.end = None
+        self.wait = 0.0
+        self.args_size = args_size
+        self.error = None
+        self.track = track
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile: the smallest value with at least q% of the values at or below it."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+class Tracer:
+    """
+    Records start/end/error spans for tasks, task groups and get_output waits.
+
+    Pass one to `Pipeline(..., tracer=Tracer())`; when no tracer is set the pipeline only pays a
+    None check per node. Subclass and override `on_start`/`on_end` to stream events elsewhere.
+    """
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.origin = time.perf_counter()
+        self.tracks: Dict[int, int] = {}
+
+    def track_id(self) -> int:
+        # Each asyncio task (i.e. each parallel branch) gets its own row in the trace viewer
+        try:
+            key = id(asyncio.current_task())
+        except RuntimeError:
+            key = 0
+        return self.tracks.setdefault(key, len(self.tracks) + 1)
+
+    def start(self, kind: str, name: str, args=()) -> Span:
+        args_size = sum(sys.getsizeof(arg) for arg in args)  # Shallow size, cheap enough for every call
+        span = Span(kind, name, time.perf_counter(), args_size, self.track_id())
+        self.spans.append(span)
+        self.on_start(span)
+        return span
+
+    def end(self, span: Span, error: Optional[BaseException] = None):
+        span.end = time.perf_counter()
+        if error is not None:
+            span.error = repr(error)
+        self.on_end(span)
+
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        pass
+
+    def summary(self, kind: str = "task") -> Dict[str, Dict[str, float]]:
+        """Latency statistics in seconds per span name."""
+        by_name: Dict[str, List[Span]] = {}
+        for span in self.spans:
+            if span.kind == kind and span.end is not None:
+                by_name.setdefault(span.name, []).append(span)
+        summary = {}
+        for name, spans in by_name.items():
+            durations = [s.duration for s in spans]
+            waits = [s.wait for s in spans]
+            summary[name] = {
+                "count": len(spans),
+                "errors": sum(1 for s in spans if s.error is not None),
+                "total": sum(durations),
+                "mean": sum(durations) / len(durations),
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "wait_p50": percentile(waits, 50),
+                "wait_p95": percentile(waits, 95),
+            }
+        return summary
+
+    def summary_table(self, kind: str = "task") -> str:
+        rows = sorted(self.summary(kind).items(), key=lambda item: -item[1]["total"])
+        width = max([len("task")] + [len(name) for name, _ in rows])
+        lines = [f"{'task':<{width}}  {'count':>6}  {'errors':>6}  {'p50 ms':>9}  {'p95 ms':>9}  {'wait p95 ms':>11}  {'total s':>8}"]
+        for name, stats in rows:
+            lines.append(
+                f"{name:<{width}}  {stats['count']:>6}  {stats['errors']:>6}  {stats['p50'] * 1000:>9.1f}  "
+                f"{stats['p95'] * 1000:>9.1f}  {stats['wait_p95'] * 1000:>11.1f}  {stats['total']:>8.2f}"
+            )
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Trace-event JSON loadable in Perfetto / chrome://tracing."""
+        events = []
+        for span in self.spans:
+            if span.end is None:
+                continue
+            start_us = (span.start - self.origin) * 1e6
+            args = {"args_bytes": span.args_size}
+            if span.error is not None:
+                args["error"] = span.error
+            if span.wait:
+                args["wait_ms"] = span.wait * 1000
+                events.append({"name": f"{span.name} (queued)", "cat": "wait", "ph": "X", "pid": 1, "tid": span.track,
+                               "ts": start_us, "dur": span.wait * 1e6})
+            events.append({"name": span.name, "cat": span.kind, "ph": "X", "pid": 1, "tid": span.track,
+                           "ts": start_us, "dur": span.duration * 1e6, "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str):
+        with open(path, 'w') as file:
+            json.dump(self.chrome_trace(), file)
@@ -1,10 +1,10 @@
 from pydantic import BaseModel
 from typing import TypeVar, Type, Optional, Dict, List
-import shelve
 import pydantic
 import json
 import os
 from personas.llm_methods import post_message_to_anthropic
+from personas.response_store import open_response_store
 
 # Defining a generic Pydantic type for our functions
 T = TypeVar('T', bound=BaseModel)
@@ -58,17 +58,14 @@ def load_pydantic_or_none(obj_type: Type[T], filename: str) -> Optional[T]:
     except (FileNotFoundError, json.JSONDecodeError):
         return None
 
-CACHE_FILENAME = "anthropic_cache.db"
+CACHE_FILENAME = "anthropic_cache.sqlite"
 
-async def post_message_to_anthropic_cached(prompt, temperature=0.5, system=None):
-    cache_filepath = os.path.abspath(CACHE_FILENAME)  # Get absolute path for reliability
-    with shelve.open(cache_filepath) as cache:  # Open the cache as a database-like object
-        if prompt in cache:
-            return cache[prompt]
-        else:
-            response_data = await post_message_to_anthropic(prompt,temperature=temperature, system=system)  # Call the Anthropic API
-            cache[prompt] = response_data
-            return response_data
+async def post_message_to_anthropic_cached(prompt, temperature=0.5, system=None, model="claude-3-opus-20240229", cache_filename=CACHE_FILENAME):
+    store = open_response_store(cache_filename)  # Opened once per process and shared by every call
+    payload = {"model": model, "message": prompt, "system": system, "temperature": temperature}
+    return await store.get_or_fetch(
+        payload, lambda: post_message_to_anthropic(prompt, model=model, temperature=temperature, system=system)  # Call the Anthropic API
+    )
 
 def schema_to_prompt(schema: pydantic.BaseModel) -> str:
     """Converts a Pydantic schema into a formatted prompt, including examples if available.
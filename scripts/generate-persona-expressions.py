@@ -4,7 +4,7 @@ import pydantic
 import re
 import os
 from typing import List
-from pipelines import task, Pipeline, set_output, get_output
+from pipelines import task, Pipeline, Scheduler, set_output, get_output
 from common import save_pydantic, load_pydantic_or_none, WorldConfig, ValidationError, schema_to_prompt, post_message_to_anthropic_cached, PersonaConfig
 from personas.llm_methods import post_message_to_anthropic
 from pathlib import Path
@@ -24,6 +24,9 @@ personas = {
     "Utopia_Lumina": "abd94c190be04c529f4eb5149dcc2607",
     "Dystopia_Liam Hawkins": "af7979bd0ac846528a168717c7d4e9ac"
 }
+# Shared across every persona so the sliders API never sees more than 5 generations at once
+scheduler = Scheduler({"sliders": 5})
+
 worlds = {
     "Utopia": "d57d772e39cd4dc09699743803ca3e51",
     "Neotopia": "895d89c8247d4cc0bbf94d078473e271",
@@ -116,8 +119,8 @@ def check_if_image_exists(i: int, j: int, persona_name: str, world_name: str) ->
     return file_path.exists()
 
 
-async def process_coordinates(i, j, persona, world, emotions, persona_uuid, prompt, seed, semaphore):
-	async with semaphore:
+async def process_coordinates(i, j, persona, world, emotions, persona_uuid, prompt, seed):
+	async with scheduler.slot("sliders"):
 
 		if check_if_image_exists(i, j, persona.name, world.name):
 			print("Skipping", i, j, persona.name, world.name)
@@ -147,8 +150,7 @@ async def generate_expressions(world, persona, world_uuid, persona_uuid):
     prompt = "headshot photo"
     seed = 42
 
-    semaphore = asyncio.Semaphore(5)  # Adjust the number as needed
-    tasks = [process_coordinates(i, j, persona, world, emotions, persona_uuid, prompt, seed, semaphore)
+    tasks = [process_coordinates(i, j, persona, world, emotions, persona_uuid, prompt, seed)
              for i in range(10, -11, -1) for j in range(10, -11, -1)]
     await asyncio.gather(*tasks)
 
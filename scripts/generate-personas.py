@@ -4,7 +4,8 @@ import re
 from typing import List
 from pipelines import task, Pipeline, set_output, get_output
 from common import save_pydantic, load_pydantic_or_none, WorldConfig, ValidationError, schema_to_prompt, post_message_to_anthropic_cached, PersonaConfig
-from personas.llm_methods import post_message_to_anthropic
+from personas.llm_methods import post_message_to_anthropic, stream_json_from_anthropic
+from personas.llm_json import extract_json, parse_llm_json
 
 @task
 async def load_world(world_name: str) -> WorldConfig:
@@ -15,11 +16,12 @@ async def load_world(world_name: str) -> WorldConfig:
 async def create_persona_json(world: WorldConfig) -> str:
     schema_desc = schema_to_prompt(PersonaConfig)
     prompt = f"Generate a persona for a `personas` chat project. Characters will come from this world: ```\n{world}\n```\n\nThe resulting persona should have the following attributes:\n```\n{schema_desc}\n```\n\nWrite your resulting Persona in json. Be sure to wrap it in \"```json\" markdown tag. Don't use the name Zephyr or Aria."
-    response_data = await post_message_to_anthropic(prompt)
-    content = response_data['content'][0]['text']
-    json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-    if json_match:
-        json_string = json_match.group(1)
+    # Returns as soon as the ```json block closes instead of waiting for the whole response
+    json_string, content = await stream_json_from_anthropic(prompt)
+    if json_string is None:
+        # Truncated or unfenced output is still worth handing to the tolerant parser
+        json_string = extract_json(content)
+    if json_string is not None:
         return json_string
     else:
         raise LLMResponseInvalid()
@@ -28,7 +30,7 @@ async def create_persona_json(world: WorldConfig) -> str:
 def validate_persona_json(persona_json: str) -> PersonaConfig:
     # Parse and validate the generated persona JSON using Pydantic
     # Replace this with your actual validation logic
-    return PersonaConfig.parse_raw(persona_json)
+    return parse_llm_json(PersonaConfig, persona_json)
 
 # Define the pipeline
 pipeline = Pipeline(
@@ -39,10 +41,9 @@ async def main():
     # Execute the pipeline
     world_types = ["Utopia", "Neotopia", "Dystopia"]
     try:
-        for world_type in world_types:
-            for i in range(2):
-                persona = await pipeline(world_type)
-                save_pydantic(persona, f"{world_type}_{persona.name}.json")
+        inputs = [world_type for world_type in world_types for i in range(2)]
+        async for world_type, persona in pipeline.stream(inputs, concurrency=4):
+            save_pydantic(persona, f"{world_type}_{persona.name}.json")
 
         print(f"Generated Persona: {persona.name}")
     except Exception as e:
@@ -5,6 +5,7 @@ import json
 import re
 import os
 import asyncio
+from personas.llm_json import LLMJSONError, extract_json, parse_llm_json
 from common import save_pydantic, WorldConfig, ValidationError, schema_to_prompt, post_message_to_anthropic_cached
 
 @task
@@ -13,15 +14,15 @@ async def get_world_prompt(world_type: str) -> str:
     # You can customize this function to generate specific prompts for different world types
     return f"Create a {world_type} world with a unique name, description, geography, climate, and inhabitants."
 
+# Responses are cached once, in the shared response store behind post_message_to_anthropic_cached
 @task
 async def get_llm_request(world_type: str) -> str:
     schema_desc = schema_to_prompt(WorldConfig)
     prompt = f"Generate an interesting world for a `personas` project. Characters will come from this world which should be {world_type}. It should have the following attributes:\n```{schema_desc}```\n\nWrite your results in json. Be sure to wrap it in \"```json\" markdown tag."
     response_data = await post_message_to_anthropic_cached(prompt)
     content = response_data['content'][0]['text']
-    json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-    if json_match:
-        json_string = json_match.group(1)
+    json_string = extract_json(content)
+    if json_string is not None:
         return json_string
     else:
         print("--", content)
@@ -31,9 +32,9 @@ async def get_llm_request(world_type: str) -> str:
 async def validate_world_json(world_json: str) -> WorldConfig:
     # Parse and validate the generated world JSON using Pydantic
     try:
-        world_config = WorldConfig.parse_raw(world_json)
+        world_config = parse_llm_json(WorldConfig, world_json)
         return world_config
-    except ValidationError as e:
+    except LLMJSONError as e:
         # Handle validation errors
         raise ValueError(f"Invalid world JSON: {e}")
 
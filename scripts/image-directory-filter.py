@@ -10,7 +10,7 @@ import json
 import asyncio
 from pydantic import BaseModel, Field
 from typing import List
-from pipelines import task, Pipeline, set_output, get_output
+from pipelines import task, Pipeline, AdaptiveFilterChain, SQLiteCache, Tracer, set_output, get_output
 import torch
 from transformers import AutoModelForCausalLM
 from datetime import datetime
@@ -29,26 +29,16 @@ def identity(x):
         return x
     return identity_
 
-async def filter(filename):
-    """
-    Placeholder filter function.
-    Implement your filtering logic here.
-    Returns None if the image fails the filter criteria.
-    Returns anything else (not None) if the image passes the filter criteria.
-    """
-    try:
-        questions = open("txt2img/qs.txt", "r").read().strip().split("\n")
-        pipeline = Pipeline(
-                reduce(lambda x, y: x >> filter_vlm(y), questions, identity(filename))
-        )
+# Answers are keyed on image contents, so re-running over an unchanged directory skips the VLM
+vlm_cache = SQLiteCache(os.path.abspath("vlm_cache.db"))
 
-        A = await pipeline()
-        return A
-    except Exception as e:
-        print(traceback.format_exc())
+tracer = Tracer()
 
-        print(f"Error generating world and personas: {e}")
-        return None
+def build_filter_pipeline():
+    questions = open("txt2img/qs.txt", "r").read().strip().split("\n")
+    # Questions are independent, so ask the cheapest, most-rejecting one first (learned across runs)
+    filters = AdaptiveFilterChain([filter_vlm(q, cache=vlm_cache) for q in questions], stats_path="txt2img/qs_stats.json")
+    return Pipeline(filters, tracer=tracer).compile(), filters
 
 async def process_images(directory):
     unload_checkpoint()
@@ -62,21 +52,29 @@ async def process_images(directory):
     if not os.path.exists(fail_dir):
         os.makedirs(fail_dir)
 
-    # Iterate over all files in the directory
-    for filename in os.listdir(directory):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-            filepath = os.path.join(directory, filename)
-            try:
-                if await filter(filepath) is None:
-                    print("F MOVE", filepath, os.path.join(fail_dir, filename))
-                    # Move to 'fail' directory if filter returns None
-                    move(filepath, os.path.join(fail_dir, filename))
-                else:
-                    print("P MOVE", filepath, os.path.join(pass_dir, filename))
-                    # Move to 'pass' directory otherwise
-                    move(filepath, os.path.join(pass_dir, filename))
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
+    filepaths = [os.path.join(directory, filename) for filename in os.listdir(directory)
+                 if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
+    pipeline, filters = build_filter_pipeline()
+    # Failed images report their exception instead of aborting the whole directory
+    async for filepath, result in pipeline.stream(filepaths, concurrency=4, return_exceptions=True):
+        filename = os.path.basename(filepath)
+        try:
+            if isinstance(result, Exception):
+                print(f"Error processing {filename}: {result}")
+            elif not result:
+                print("F MOVE", filepath, os.path.join(fail_dir, filename), getattr(result, "stage", None))
+                # Move to 'fail' directory if filter returns None
+                move(filepath, os.path.join(fail_dir, filename))
+            else:
+                print("P MOVE", filepath, os.path.join(pass_dir, filename))
+                # Move to 'pass' directory otherwise
+                move(filepath, os.path.join(pass_dir, filename))
+        except Exception as e:
+            print(f"Error processing {filename}: {e}")
+    print(tracer.summary_table())
+    print("Rejections per stage", dict(pipeline.rejections))
+    filters.save()
+    tracer.export_chrome_trace(os.path.join(directory, "filter_trace.json"))
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
@@ -2,6 +2,7 @@
 # This file is modified from https://github.com/haotian-liu/LLaVA/
 
 import argparse
+import copy
 import torch
 
 from llava.constants import (
@@ -27,6 +28,10 @@ import requests
 from PIL import Image
 from io import BytesIO
 import re
+import json
+
+from mlq_pipelines.answer_tokens import candidate_token_ids
+from mlq_pipelines.image_cache import image_cache, load_image_cached, process_image_cached
 
 
 def run_llava(model_path, conv_mode, query, images, sep=",", temperature=0.2, top_p=None, num_beams=1, max_new_tokens=512, model_base=None):
@@ -45,11 +50,23 @@ def run_llava(model_path, conv_mode, query, images, sep=",", temperature=0.2, to
 
     return eval_model(args)
 
+def split_images(images, sep=","):
+    """Image files joined by `sep`, a list of images, or a single in-memory image, as a list."""
+    if isinstance(images, str):
+        return images.split(sep)
+    if isinstance(images, (list, tuple)):
+        return list(images)
+    return [images]
+
 def image_parser(args):
-    out = args.image_file.split(args.sep)
+    out = split_images(args.image_file, args.sep)
     return out
 
 def load_image(image_file):
+    if not isinstance(image_file, str):
+        # Already decoded: a PIL image, or an object holding one (e.g. t2i.GeneratedImage)
+        image = getattr(image_file, "image", image_file)
+        return image if image.mode == "RGB" else image.convert("RGB")
     if image_file.startswith("http") or image_file.startswith("https"):
         response = requests.get(image_file)
         image = Image.open(BytesIO(response.content)).convert("RGB")
@@ -60,10 +77,38 @@ def load_image(image_file):
 def load_images(image_files):
     out = []
     for image_file in image_files:
-        image = load_image(image_file)
+        image = load_image_cached(image_file, load_image)
         out.append(image)
     return out
 
+processor_keys = {}
+
+def processor_key(image_processor, model_config):
+    """Identifies the preprocessing so cached tensors are only reused under the same config."""
+    key = processor_keys.get(id(image_processor))
+    if key is None:
+        config = image_processor.to_dict() if hasattr(image_processor, "to_dict") else vars(image_processor)
+        key = (type(image_processor).__name__, json.dumps(config, sort_keys=True, default=str))
+        processor_keys[id(image_processor)] = key
+    return key + (getattr(model_config, "image_aspect_ratio", None),)
+
+def images_to_tensor(image_files, image_processor, model):
+    """
+    Preprocess images into one fp16 tensor on the model's device.
+
+    Each file's preprocessed CPU tensor is cached (see mlq_pipelines.image_cache), so an image
+    compared or filtered repeatedly is decoded and run through process_images once.
+    """
+    key = processor_key(image_processor, model.config)
+    tensors = [
+        process_image_cached(image_file, key, load_image, lambda image: process_images([image], image_processor, model.config))
+        for image_file in image_files
+    ]
+    if any(not torch.is_tensor(tensor) for tensor in tensors):
+        # Processors that return per-image lists (e.g. anyres) are passed through uncached
+        return process_images(load_images(image_files), image_processor, model.config).to(model.device, dtype=torch.float16)
+    return torch.cat(tensors, dim=0).to(model.device, dtype=torch.float16)
+
 llavamodel = None
 
 def unload_llava_model():
@@ -72,18 +117,16 @@ def unload_llava_model():
     llavamodel = None
     torch.cuda.empty_cache()
 
-def eval_model(args):
-    # Model
-    disable_torch_init()
+def get_llava_model(args):
     global llavamodel
-
-    model_name = get_model_name_from_path(args.model_path)
     if llavamodel is None:
         llavamodel = load_pretrained_model(
-            args.model_path, args.model_base, model_name
+            args.model_path, args.model_base, get_model_name_from_path(args.model_path)
         )
-    tokenizer, model, image_processor, context_len = llavamodel 
+    return llavamodel
 
+def build_prompt(args, model):
+    model_name = get_model_name_from_path(args.model_path)
     qs = args.query
     image_token_se = DEFAULT_IM_START_TOKEN + DEFAULT_IMAGE_TOKEN + DEFAULT_IM_END_TOKEN
     if IMAGE_PLACEHOLDER in qs:
@@ -120,25 +163,10 @@ def eval_model(args):
     conv = conv_templates[args.conv_mode].copy()
     conv.append_message(conv.roles[0], qs)
     conv.append_message(conv.roles[1], None)
-    prompt = conv.get_prompt()
+    return conv.get_prompt(), conv
 
-    image_files = image_parser(args)
-    images = load_images(image_files)
-    images_tensor = process_images(
-        images,
-        image_processor,
-        model.config
-    ).to(model.device, dtype=torch.float16)
-
-    input_ids = (
-        tokenizer_image_token(prompt, tokenizer, IMAGE_TOKEN_INDEX, return_tensors="pt")
-        .unsqueeze(0)
-        .cuda()
-    )
-
-    stop_str = conv.sep if conv.sep_style != SeparatorStyle.TWO else conv.sep2
-    keywords = [stop_str]
-    stopping_criteria = KeywordsStoppingCriteria(keywords, tokenizer, input_ids)
+def generate(args, input_ids, images_tensor, stop_str, tokenizer, model):
+    stopping_criteria = KeywordsStoppingCriteria([stop_str], tokenizer, input_ids)
 
     with torch.inference_mode():
         output_ids = model.generate(
@@ -161,12 +189,203 @@ def eval_model(args):
         )
     outputs = tokenizer.batch_decode(
         output_ids[:, input_token_len:], skip_special_tokens=True
-    )[0]
-    outputs = outputs.strip()
-    if outputs.endswith(stop_str):
-        outputs = outputs[: -len(stop_str)]
-    outputs = outputs.strip()
-    return outputs
+    )
+    results = []
+    for output in outputs:
+        output = output.strip()
+        if output.endswith(stop_str):
+            output = output[: -len(stop_str)]
+        results.append(output.strip())
+    return results
+
+def eval_model(args):
+    # Model
+    disable_torch_init()
+    tokenizer, model, image_processor, context_len = get_llava_model(args)
+    prompt, conv = build_prompt(args, model)
+
+    image_files = image_parser(args)
+    images_tensor = images_to_tensor(image_files, image_processor, model)
+
+    input_ids = (
+        tokenizer_image_token(prompt, tokenizer, IMAGE_TOKEN_INDEX, return_tensors="pt")
+        .unsqueeze(0)
+        .cuda()
+    )
+
+    stop_str = conv.sep if conv.sep_style != SeparatorStyle.TWO else conv.sep2
+    return generate(args, input_ids, images_tensor, stop_str, tokenizer, model)[0]
+
+def run_llava_batch(model_path, conv_mode, query, images_list, sep=",", temperature=0.2, top_p=None, num_beams=1, max_new_tokens=512, model_base=None):
+    """Answer the same query for each entry of `images_list` in one batched `generate` call.
+
+    Every entry uses the same prompt, so the input ids are identical and need no padding.
+    """
+    args = argparse.Namespace(
+        model_path=model_path,
+        model_base=model_base,
+        temperature=temperature,
+        top_p=top_p,
+        num_beams=num_beams,
+        max_new_tokens=max_new_tokens,
+        conv_mode=conv_mode,
+        query=query,
+        image_file=None,
+        sep=sep
+    )
+    disable_torch_init()
+    tokenizer, model, image_processor, context_len = get_llava_model(args)
+    prompt, conv = build_prompt(args, model)
+
+    image_files = [image_file for images in images_list for image_file in split_images(images, sep)]
+    images_tensor = images_to_tensor(image_files, image_processor, model)
+
+    input_ids = (
+        tokenizer_image_token(prompt, tokenizer, IMAGE_TOKEN_INDEX, return_tensors="pt")
+        .unsqueeze(0)
+        .repeat(len(images_list), 1)
+        .cuda()
+    )
+
+    stop_str = conv.sep if conv.sep_style != SeparatorStyle.TWO else conv.sep2
+    return generate(args, input_ids, images_tensor, stop_str, tokenizer, model)
+
+
+def encode_image_prefix(model, tokenizer, prefix, images_tensor):
+    """
+    Run the prompt prefix (system prompt + image tokens) through the model once.
+
+    Returns the KV cache and the prefix length in positions (image tokens expanded to their
+    patch embeddings).
+    """
+    prefix_ids = (
+        tokenizer_image_token(prefix, tokenizer, IMAGE_TOKEN_INDEX, return_tensors="pt")
+        .unsqueeze(0)
+        .to(model.device)
+    )
+    # The vision tower runs here too, so keep it out of autograd along with the forward pass
+    with torch.inference_mode():
+        _, position_ids, attention_mask, _, inputs_embeds, _ = model.prepare_inputs_labels_for_multimodal(
+            prefix_ids, None, None, None, None, images_tensor
+        )
+        out = model(inputs_embeds=inputs_embeds, use_cache=True, return_dict=True)
+    return out.past_key_values, inputs_embeds.shape[1]
+
+def copy_kv_cache(past_key_values):
+    # Legacy tuple caches are never mutated in place; Cache objects are, so each question gets a copy
+    if isinstance(past_key_values, tuple):
+        return past_key_values
+    return copy.deepcopy(past_key_values)
+
+def answer_from_prefix(model, tokenizer, past_key_values, suffix, stop_str, max_new_tokens):
+    """Greedy-decode an answer to `suffix`, continuing from a cached image prefix."""
+    suffix_ids = tokenizer(suffix, add_special_tokens=False, return_tensors="pt").input_ids.to(model.device)
+    generated = []
+    with torch.inference_mode():
+        out = model(input_ids=suffix_ids, past_key_values=copy_kv_cache(past_key_values), use_cache=True, return_dict=True)
+        for _ in range(max_new_tokens):
+            next_id = out.logits[:, -1, :].argmax(dim=-1)
+            if next_id.item() == tokenizer.eos_token_id:
+                break
+            generated.append(next_id.item())
+            if stop_str and tokenizer.decode(generated, skip_special_tokens=True).endswith(stop_str):
+                break
+            out = model(input_ids=next_id.unsqueeze(0), past_key_values=out.past_key_values, use_cache=True, return_dict=True)
+    output = tokenizer.decode(generated, skip_special_tokens=True).strip()
+    if stop_str and output.endswith(stop_str):
+        output = output[: -len(stop_str)]
+    return output.strip()
+
+def run_llava_multi(model_path, conv_mode, queries, image_file, stop=None, max_new_tokens=16, model_base=None):
+    """
+    Answer several single-image queries about `image_file` with one image encoding.
+
+    The image is loaded, preprocessed and run through the vision tower and the shared prompt
+    prefix once; each query then only decodes its own tokens on top of a copy of the prefix
+    KV cache. Decoding is greedy. `stop(index, answer)` can end the loop early (e.g. on the
+    first failed filter); answers are returned for the queries that ran.
+    Every query must contain the image exactly once, before any question text.
+    """
+    args = argparse.Namespace(
+        model_path=model_path,
+        model_base=model_base,
+        temperature=0,
+        top_p=None,
+        num_beams=1,
+        max_new_tokens=max_new_tokens,
+        conv_mode=conv_mode,
+        query=None,
+        image_file=image_file,
+        sep=","
+    )
+    disable_torch_init()
+    tokenizer, model, image_processor, context_len = get_llava_model(args)
+    images_tensor = images_to_tensor([image_file], image_processor, model)
+
+    prefix = None
+    past_key_values = None
+    answers = []
+    for index, query in enumerate(queries):
+        args.query = query
+        prompt, conv = build_prompt(args, model)
+        image_end = prompt.index(DEFAULT_IMAGE_TOKEN) + len(DEFAULT_IMAGE_TOKEN)
+        if model.config.mm_use_im_start_end:
+            image_end = prompt.index(DEFAULT_IM_END_TOKEN, image_end) + len(DEFAULT_IM_END_TOKEN)
+        if prefix is None:
+            prefix = prompt[:image_end]
+            past_key_values, _ = encode_image_prefix(model, tokenizer, prefix, images_tensor)
+        elif prompt[:image_end] != prefix:
+            raise ValueError(f"Query {index} does not share the image prefix of the first query")
+        stop_str = conv.sep if conv.sep_style != SeparatorStyle.TWO else conv.sep2
+        answer = answer_from_prefix(model, tokenizer, past_key_values, prompt[image_end:], stop_str, max_new_tokens)
+        answers.append(answer)
+        if stop is not None and stop(index, answer):
+            break
+    return answers
+
+
+def score_llava(model_path, conv_mode, query, images_list, candidates=("Yes", "No"), sep=",", model_base=None):
+    """
+    Score the first answer token instead of generating text.
+
+    Runs one forward pass per batch and returns, for each entry of `images_list`, the probability
+    of each candidate answer normalized over the candidates (from the logits of each candidate's
+    first token). Candidates must differ in their first word token.
+    """
+    args = argparse.Namespace(
+        model_path=model_path,
+        model_base=model_base,
+        temperature=0,
+        top_p=None,
+        num_beams=1,
+        max_new_tokens=1,
+        conv_mode=conv_mode,
+        query=query,
+        image_file=None,
+        sep=sep
+    )
+    disable_torch_init()
+    tokenizer, model, image_processor, context_len = get_llava_model(args)
+    prompt, conv = build_prompt(args, model)
+
+    image_files = [image_file for images in images_list for image_file in split_images(images, sep)]
+    images_tensor = images_to_tensor(image_files, image_processor, model)
+
+    input_ids = (
+        tokenizer_image_token(prompt, tokenizer, IMAGE_TOKEN_INDEX, return_tensors="pt")
+        .unsqueeze(0)
+        .repeat(len(images_list), 1)
+        .to(model.device)
+    )
+
+    with torch.inference_mode():
+        logits = model(input_ids, images=images_tensor, return_dict=True).logits[:, -1, :].float()
+    log_probs = torch.log_softmax(logits, dim=-1)
+    candidate_scores = torch.stack(
+        [torch.logsumexp(log_probs[:, ids], dim=-1) for ids in candidate_token_ids(tokenizer, candidates)], dim=-1
+    )
+    probabilities = torch.softmax(candidate_scores, dim=-1).tolist()
+    return [dict(zip(candidates, p)) for p in probabilities]
 
 
 if __name__ == "__main__":
@@ -4,22 +4,16 @@ import os
 import aiohttp
 import re
 import json
-import shelve
 from typing import List
 from pipelines import task, Pipeline
-from personas.llm_methods import post_message_to_anthropic
+from personas.llm_methods import post_message_to_anthropic, stream_json_from_anthropic
+from personas.llm_json import extract_json, parse_llm_json
+from common import post_message_to_anthropic_cached as common_post_message_to_anthropic_cached
 
-CACHE_FILENAME = "anthropic_cache2.db"
+CACHE_FILENAME = "anthropic_cache2.sqlite"
 
 async def post_message_to_anthropic_cached(prompt, system=None):
-    cache_filepath = os.path.abspath(CACHE_FILENAME)  # Get absolute path for reliability
-    with shelve.open(cache_filepath) as cache:  # Open the cache as a database-like object
-        if prompt in cache:
-            return cache[prompt]
-        else:
-            response_data = await post_message_to_anthropic(prompt, system=system)  # Call the Anthropic API
-            cache[prompt] = response_data
-            return response_data
+    return await common_post_message_to_anthropic_cached(prompt, system=system, cache_filename=CACHE_FILENAME)
 
 
 # Define the schema for your candidates
@@ -87,11 +81,10 @@ async def check_api_metrics(prompt) -> str:
 async def generate_candidates(prompt: str) -> str:  # Returns raw JSON strings
     """Queries the LLM for candidate solutions, tailored to your prompt."""
     system = "You are an AI artist AI. You work with text-to-image AIs like stable diffusion and bring brilliant ideas to life. Your main job right now is training LoRA 'sliders' using innovative positives and negatives."
-    response_data = await post_message_to_anthropic(prompt, system=system) 
-    content = response_data['content'][0]['text']
-    json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-    if json_match:
-        json_string = json_match.group(1)
+    json_string, content = await stream_json_from_anthropic(prompt, system=system)
+    if json_string is None:
+        json_string = extract_json(content)
+    if json_string is not None:
         return json_string
     else:
         print("--", content)
@@ -100,16 +93,8 @@ async def generate_candidates(prompt: str) -> str:  # Returns raw JSON strings
 @task
 async def parse_candidates(raw_candidates: str) -> List[Candidate]:
     """Parses raw JSON strings into validated Candidate objects."""
-    candidates_data = json.loads(raw_candidates)  # Load JSON into a list/dictionary structure
-    parsed_candidates = []
-    for candidate_data in candidates_data:  # Iterate over candidates in the list/dictionary
-        try:
-            candidate = Candidate(**candidate_data)  # Create Candidate object
-            parsed_candidates.append(candidate)
-        except pydantic.ValidationError as e:
-            raise e
-
-    return parsed_candidates
+    # Repairs trailing commas / truncation and validates the whole list with a cached TypeAdapter
+    return parse_llm_json(List[Candidate], raw_candidates)
 
 @task
 async def filter_existing(*candidates: List[Candidate]) -> List[Candidate]:
@@ -10,7 +10,7 @@ import json
 import asyncio
 from pydantic import BaseModel, Field
 from typing import List
-from pipelines import task, Pipeline, set_output, get_output
+from pipelines import task, Pipeline, AdaptiveFilterChain, param, set_output, get_output
 import torch
 from transformers import AutoModelForCausalLM
 from datetime import datetime
@@ -18,6 +18,18 @@ from scripts.vlm import *
 from functools import reduce
 import random
 import string
+import time
+from mlq_pipelines.config import config_text
+
+STATS_SAVE_INTERVAL = 60
+
+def build_pipeline(questions):
+    filters = AdaptiveFilterChain([filter_vlm(q) for q in questions], stats_path="qs_stats.json")
+    template = Pipeline(
+            # Images stay in memory through the filters; only ones that pass are written
+            text_to_image(param("prompt"), param("negative_prompt"), save=False) >> filters
+    ).compile()
+    return filters, template
 
 async def main():
     unload_checkpoint()
@@ -25,26 +37,39 @@ async def main():
     os.makedirs("images/"+random_dir, exist_ok=True)
     old = None
     i = 0
+    questions = None
+    filters = None
+    saved_at = time.monotonic()
     try:
         while True:
-            p = open("prompt-a.txt", "r").read()
-            np = open("nprompt-a.txt", "r").read()
-            questions = open("qs.txt", "r").read().strip().split("\n")
-            pipeline = Pipeline(
-                    reduce(lambda x, y: x >> filter_vlm(y), questions, text_to_image(p, np))
-            )
+            # The files are re-read only when they change (config_text caches by mtime), so
+            # edits apply on the next iteration; the pipeline is rebuilt only when qs.txt changes
+            p = config_text("prompt-a.txt")
+            np = config_text("nprompt-a.txt")
+            current = config_text("qs.txt").strip().split("\n")
+            if current != questions:
+                if filters is not None:
+                    filters.save()
+                questions = current
+                filters, template = build_pipeline(questions)
 
             #A = await pipeline(A, imageprompt, vlmquestion)
-            A = await pipeline()
-            if A is not None and old != A:
+            A = await template.bind(prompt=p, negative_prompt=np)()
+            if time.monotonic() - saved_at > STATS_SAVE_INTERVAL:
+                filters.save()
+                saved_at = time.monotonic()
+            if A and old != A:
                 print("Found ", A)
                 old = A
                 i+=1
-                shutil.copy(A, "images/"+random_dir+"/"+random_dir+"_"+str(i)+".png")
+                A.save("images/"+random_dir+"/"+random_dir+"_"+str(i)+".png")
     except Exception as e:
         print(traceback.format_exc())
 
         print(f"Error generating world and personas: {e}")
+    finally:
+        if filters is not None:
+            filters.save()
 
 if __name__ == "__main__":
     asyncio.run(main())
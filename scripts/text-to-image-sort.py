@@ -11,6 +11,7 @@ from vlm import *
 from pydantic import BaseModel, Field
 from typing import List
 from pipelines import task, Pipeline, set_output, get_output
+from mlq_pipelines.config import config_glob, config_text, sort_question
 import torch
 from transformers import AutoModelForCausalLM
 from datetime import datetime
@@ -79,7 +80,7 @@ def choose_first_occurrence(s, opta, optb):
         return None
 
 async def compare(a, b):
-    question = open("txt2img/q.txt", "r").read().strip()
+    question = sort_question()
     vlmquestion = f"Q: <image> <image>\n{question}\nA: "
     rag = [a, b]
     random.shuffle(rag)
@@ -122,21 +123,23 @@ async def main():
     #unload_checkpoint()
     #load_model("XL/mario/toprated1.safetensors")
     reload_checkpoint()
-    while i < num_elements:
-        print(i)
-        pattern = "txt2img/prompt-*"
-        files_matching = glob.glob(pattern)
-
-        # Choose a random file from the matched files
-        random_file = random.choice(files_matching) if files_matching else None
-        p = open(random_file, "r").read()
-        np = open("txt2img/nprompt-a.txt", "r").read()
-        #if i % 2 == 0:
-        #    p = "blank black background"
-        #    np = "people, interesting, colors"
-        A = await pipeline(p, np)
-        all_elements.append(A)
-        i += 1
+    def prompts():
+        for i in range(num_elements):
+            print(i)
+            pattern = "txt2img/prompt-*"
+            # Cached until a prompt file is added or removed (and each file until it is edited)
+            files_matching = config_glob(pattern)
+
+            # Choose a random file from the matched files
+            random_file = random.choice(files_matching) if files_matching else None
+            p = config_text(random_file)
+            np = config_text("txt2img/nprompt-a.txt")
+            #if i % 2 == 0:
+            #    p = "blank black background"
+            #    np = "people, interesting, colors"
+            yield (p, np)
+
+    all_elements = await pipeline.map(prompts(), concurrency=4)
     unload_checkpoint()
 
     sorted_list = await sort_with_correction(all_elements)
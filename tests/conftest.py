@@ -0,0 +1,22 @@
+import asyncio
+import pytest
+from pipelines import Reject, task
+
+@pytest.fixture
+def calls():
+    return []
+
+@pytest.fixture
+def filter_stage(calls):
+    """Factory for filter tasks that record their name in `calls` and reject when `rejects(x)`."""
+    def make(name, rejects, delay=0.0):
+        @task(name=name)
+        async def stage_(x):
+            calls.append(name)
+            if delay:
+                await asyncio.sleep(delay)
+            if rejects(x):
+                return Reject(f"{name} rejected {x}")
+            return x
+        return stage_
+    return make
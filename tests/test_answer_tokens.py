@@ -0,0 +1,33 @@
+import pytest
+from mlq_pipelines.answer_tokens import candidate_token_ids
+
+class StubTokenizer:
+    """SentencePiece-like: a leading space may become a bare "▁" piece (id 1)."""
+    vocab = {"▁": 1, "Yes": 2, "▁Yes": 3, "No": 4, "▁N": 5, "o": 6, "first": 7, "second": 8}
+
+    def __init__(self, encodings):
+        self.encodings = encodings
+
+    def __call__(self, text, add_special_tokens=True):
+        class Encoded:
+            input_ids = [self.vocab[piece] for piece in self.encodings[text]]
+        return Encoded()
+
+    def decode(self, ids):
+        pieces = {v: k for k, v in self.vocab.items()}
+        return "".join(pieces[i] for i in ids).replace("▁", " ")
+
+def test_shared_space_piece_is_skipped():
+    tokenizer = StubTokenizer({"Yes": ["Yes"], " Yes": ["▁", "Yes"], "No": ["No"], " No": ["▁", "No"]})
+    assert candidate_token_ids(tokenizer, ["Yes", "No"]) == [[2], [4]]
+
+def test_both_spellings_are_scored():
+    tokenizer = StubTokenizer({"Yes": ["Yes"], " Yes": ["▁Yes"], "No": ["No"], " No": ["▁N", "o"]})
+    assert candidate_token_ids(tokenizer, ["Yes", "No"]) == [[2, 3], [4, 5]]
+
+def test_ids_shared_between_candidates_are_dropped():
+    tokenizer = StubTokenizer({"first": ["first"], " first": ["▁Yes"], "second": ["second"], " second": ["▁Yes"]})
+    assert candidate_token_ids(tokenizer, ["first", "second"]) == [[7], [8]]
+    tokenizer = StubTokenizer({"first": ["▁Yes"], " first": ["▁Yes"], "second": ["second"], " second": ["▁Yes"]})
+    with pytest.raises(ValueError):
+        candidate_token_ids(tokenizer, ["first", "second"])
@@ -0,0 +1,84 @@
+import asyncio
+import time
+import pytest
+from pipelines import THREAD, Pipeline, Scheduler, TaskExecutionError, batched_task, task
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_batched():
+    calls = []
+
+    @batched_task(max_batch=4, max_wait_ms=50)
+    async def double(xs):
+        calls.append(list(xs))
+        return [x * 2 for x in xs]
+
+    results = await Pipeline(double).map(range(10), concurrency=10)
+    assert results == [x * 2 for x in range(10)]
+    assert [len(c) for c in calls] == [4, 4, 2]
+
+@pytest.mark.asyncio
+async def test_wait_flushes_partial_batch():
+    @batched_task(max_batch=100, max_wait_ms=1)
+    def ident(xs):
+        return xs
+
+    assert await Pipeline(ident)(5) == 5
+    assert ident.batch_sizes == [1]
+
+@pytest.mark.asyncio
+async def test_multiple_args_batch_as_tuples():
+    @batched_task(max_batch=2)
+    async def add(pairs):
+        return [a + b for a, b in pairs]
+
+    assert await Pipeline(add).map([(1, 2), (3, 4)]) == [3, 7]
+
+@pytest.mark.asyncio
+async def test_batched_stage_in_chain():
+    @task
+    async def inc(x):
+        return x + 1
+
+    @batched_task(max_batch=8, max_wait_ms=20)
+    async def square(xs):
+        return [x * x for x in xs]
+
+    assert await Pipeline(inc >> square).map(range(4)) == [1, 4, 9, 16]
+    assert square.batch_sizes == [4]
+
+@pytest.mark.asyncio
+async def test_batch_holds_one_scheduler_slot():
+    @batched_task(max_batch=4, max_wait_ms=20, resource="gpu")
+    async def ident(xs):
+        return xs
+
+    pipeline = Pipeline(ident, scheduler=Scheduler({"gpu": 1}))
+    assert await pipeline.map(range(4)) == [0, 1, 2, 3]
+    assert ident.batch_sizes == [4]
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    @batched_task(max_batch=2)
+    async def broken(xs):
+        return xs[:1]
+
+    results = await Pipeline(broken).map(range(2), return_exceptions=True)
+    assert all(isinstance(r, TaskExecutionError) for r in results)
+
+@pytest.mark.asyncio
+async def test_threaded_batch_leaves_the_loop_free_to_fill_the_next():
+    @batched_task(max_batch=4, max_wait_ms=10, executor=THREAD)
+    def slow(xs):
+        # Stands in for a blocking multi-image model call
+        time.sleep(0.3)
+        return xs
+
+    first = asyncio.ensure_future(Pipeline(slow).map(range(4), concurrency=4))
+    await asyncio.sleep(0.05)
+    assert slow.batch_sizes == [4] and not first.done()
+    second = asyncio.ensure_future(asyncio.gather(Pipeline(slow)(4), Pipeline(slow)(5)))
+    await asyncio.sleep(0.1)
+    # The second batch filled and was flushed by its timer while the first was still running
+    assert slow.batch_sizes == [4, 2] and not first.done()
+    assert await first == [0, 1, 2, 3]
+    assert await second == [4, 5]
@@ -0,0 +1,94 @@
+import pytest
+from pydantic import BaseModel
+from pipelines.cache import MISS
+from pipelines import MemoryCache, Pipeline, SQLiteCache, batched_task, stable_hash, task
+
+class Prompt(BaseModel):
+    text: str
+
+def counting_task(cache, calls, version="1"):
+    @task(cache=cache, version=version)
+    async def describe(prompt):
+        calls.append(prompt)
+        return f"described {prompt}"
+    return describe
+
+def test_stable_hash():
+    assert stable_hash("a", {"x": 1, "y": [1, 2]}) == stable_hash("a", {"y": [1, 2], "x": 1})
+    assert stable_hash(Prompt(text="a")) == stable_hash(Prompt(text="a"))
+    assert stable_hash(Prompt(text="a")) != stable_hash(Prompt(text="b"))
+    with pytest.raises(TypeError):
+        stable_hash(object())
+
+def test_image_paths_hash_contents(tmp_path):
+    image = tmp_path / "a.png"
+    image.write_bytes(b"one")
+    first = stable_hash(str(image))
+    image.write_bytes(b"two!")
+    assert stable_hash(str(image)) != first
+    copy = tmp_path / "b.png"
+    copy.write_bytes(b"two!")
+    assert stable_hash(str(copy)) == stable_hash(str(image))
+
+@pytest.mark.asyncio
+async def test_memory_cache_skips_calls():
+    calls = []
+    pipeline = Pipeline(counting_task(MemoryCache(), calls))
+    assert await pipeline("x") == "described x"
+    assert await pipeline("x") == "described x"
+    await pipeline("y")
+    assert calls == ["x", "y"]
+
+@pytest.mark.asyncio
+async def test_version_invalidates():
+    calls = []
+    cache = MemoryCache()
+    await Pipeline(counting_task(cache, calls, "1"))("x")
+    await Pipeline(counting_task(cache, calls, "2"))("x")
+    assert calls == ["x", "x"]
+
+def test_memory_cache_lru_and_ttl():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISS and cache.get("a") == 1
+    expired = MemoryCache(ttl=-1)
+    expired.set("a", 1)
+    assert expired.get("a") is MISS
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_persists(tmp_path):
+    path = str(tmp_path / "cache.db")
+    calls = []
+    await Pipeline(counting_task(SQLiteCache(path), calls))(Prompt(text="x"))
+    result = await Pipeline(counting_task(SQLiteCache(path), calls))(Prompt(text="x"))
+    assert result == "described text='x'"
+    assert len(calls) == 1
+
+def test_sqlite_cache_eviction(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), max_entries=2)
+    for key in "abc":
+        cache.set(key, key * 10)
+    assert cache.get("a") is MISS
+    assert cache.get("c") == "c" * 10
+    small = SQLiteCache(str(tmp_path / "small.db"), max_bytes=100)
+    small.set("a", "x" * 60)
+    small.set("b", "y" * 60)
+    assert small.get("b") == "y" * 60
+    assert small.get("a") is MISS
+
+@pytest.mark.asyncio
+async def test_batched_task_caches_per_item():
+    batches = []
+
+    @batched_task(max_batch=4, cache=MemoryCache())
+    async def double(xs):
+        batches.append(list(xs))
+        return [x * 2 for x in xs]
+
+    pipeline = Pipeline(double)
+    assert await pipeline.map([1, 2]) == [2, 4]
+    assert await pipeline.map([1, 2, 3]) == [2, 4, 6]
+    assert batches == [[1, 2], [3]]
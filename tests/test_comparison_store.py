@@ -0,0 +1,65 @@
+import pytest
+from PIL import Image
+from mlq_pipelines.comparison_store import ComparisonStore, open_comparison_store
+
+def save_image(path, color):
+    Image.new("RGB", (4, 4), color).save(path)
+    return str(path)
+
+def test_pairs_are_stored_once_in_either_order(tmp_path):
+    store = ComparisonStore(str(tmp_path / "comparisons.sqlite"))
+    store.put("a", "b", "q", "m", 0.8)
+    assert store.get("a", "b", "q", "m") == pytest.approx(0.8)
+    assert store.get("b", "a", "q", "m") == pytest.approx(0.2)
+    assert store.get("a", "b", "other question", "m") is None
+    assert store.get("a", "b", "q", "other model") is None
+    store.put("b", "a", "q", "m", 0.6)
+    assert store.get("a", "b", "q", "m") == pytest.approx(0.6)
+    assert store.stats()["entries"] == 1
+
+def test_keys_are_content_hashes(tmp_path):
+    path = str(tmp_path / "comparisons.sqlite")
+    a = save_image(tmp_path / "a.png", "red")
+    b = save_image(tmp_path / "b.png", "blue")
+    store = ComparisonStore(path)
+    store.put(a, b, "q", "m", 0.9)
+    store.close()
+    # A renamed (e.g. already sorted) file still hits, also from a fresh connection
+    moved = str(tmp_path / "000_a.png")
+    (tmp_path / "a.png").rename(moved)
+    assert ComparisonStore(path).get(b, moved, "q", "m") == pytest.approx(0.1)
+
+def test_transitive_inference(tmp_path):
+    store = ComparisonStore(str(tmp_path / "comparisons.sqlite"))
+    store.put("a", "b", "q", "m", 0.9)
+    store.put("c", "b", "q", "m", 0.1)
+    assert store.infer("a", "c", "q", "m") == 1.0
+    assert store.infer("c", "a", "q", "m") == 0.0
+    assert store.infer("a", "d", "q", "m") is None
+    # Unconfident judgments don't imply anything
+    store.put("c", "d", "q", "m", 0.6)
+    assert store.infer("a", "d", "q", "m") is None
+    # A cycle (a > b > c > a) leaves the order unknown
+    store.put("c", "a", "q", "m", 0.95)
+    assert store.infer("a", "c", "q", "m") is None
+    assert store.infer("b", "a", "q", "m") is None
+
+@pytest.mark.asyncio
+async def test_get_or_compare_skips_known_and_implied_pairs(tmp_path):
+    store = open_comparison_store(str(tmp_path / "nested" / "comparisons.sqlite"))
+    assert open_comparison_store(str(tmp_path / "nested" / "comparisons.sqlite")) is store
+    calls = []
+
+    def judge(a, b):
+        async def compare():
+            calls.append((a, b))
+            return 1.0 if a < b else 0.0
+        return compare
+
+    for a, b in [("a", "b"), ("b", "c"), ("b", "a"), ("a", "c")]:
+        await store.get_or_compare(a, b, "q", "m", judge(a, b))
+    assert calls == [("a", "b"), ("b", "c")]
+    assert await store.get_or_compare("c", "a", "q", "m", judge("c", "a"), infer=False) == 0.0
+    assert calls[-1] == ("c", "a")
+    stats = store.stats()
+    assert (stats["hits"], stats["implied"], stats["misses"]) == (1, 1, 3)
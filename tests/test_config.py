@@ -0,0 +1,78 @@
+import json
+import os
+import time
+from mlq_pipelines import config
+from mlq_pipelines.config import ConfigFiles, read_json, sdwebui_config, set_config_files
+
+def touch(path, content):
+    # Bump mtime explicitly so coarse filesystem timestamps can't hide the edit
+    previous = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+    path.write_text(content)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, max(stat.st_mtime_ns, previous + 1)))
+
+def test_files_are_parsed_once_until_they_change(tmp_path):
+    files = ConfigFiles()
+    path = tmp_path / "config.json"
+    touch(path, '{"sd_webui_url": "http://a"}')
+    first = files.json(str(path))
+    assert files.json(str(path)) is first
+    assert files.stats() == {"hits": 1, "loads": 1, "entries": 1}
+
+    touch(path, '{"sd_webui_url": "http://b"}')
+    assert files.json(str(path)) == {"sd_webui_url": "http://b"}
+    assert files.stats()["loads"] == 2
+
+def test_parsers_are_cached_separately(tmp_path):
+    files = ConfigFiles(root=str(tmp_path))
+    touch(tmp_path / "q.txt", "first\nsecond\n")
+    assert files.text("q.txt") == "first\nsecond\n"
+    assert files.lines("q.txt") == ["first", "second", ""]
+    assert files.stats()["entries"] == 2
+
+def test_glob_sees_added_files(tmp_path):
+    files = ConfigFiles()
+    pattern = str(tmp_path / "prompt-*")
+    touch(tmp_path / "prompt-a.txt", "a")
+    assert files.glob(pattern) == [str(tmp_path / "prompt-a.txt")]
+    assert files.glob(str(tmp_path / "other-*")) == []
+
+    touch(tmp_path / "prompt-b.txt", "b")
+    stat = os.stat(tmp_path)
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert files.glob(pattern) == [str(tmp_path / "prompt-a.txt"), str(tmp_path / "prompt-b.txt")]
+
+def test_check_interval_and_invalidate(tmp_path):
+    files = ConfigFiles(check_interval=60)
+    path = tmp_path / "q.txt"
+    touch(path, "old")
+    assert files.text(str(path)) == "old"
+    touch(path, "new")
+    # Within the interval the file isn't even stat'ed
+    assert files.text(str(path)) == "old"
+    files.invalidate(str(path))
+    assert files.text(str(path)) == "new"
+
+def test_shared_instance_can_be_replaced(tmp_path):
+    touch(tmp_path / "sdwebui_config.json", '{"sd_webui_url": "http://local"}')
+    previous = config.config_files
+    set_config_files(ConfigFiles(root=str(tmp_path)))
+    try:
+        assert sdwebui_config("sdwebui_config.json")["sd_webui_url"] == "http://local"
+    finally:
+        set_config_files(previous)
+
+def test_cached_config_overhead(tmp_path):
+    path = tmp_path / "sdwebui_config.json"
+    touch(path, json.dumps({"sd_webui_url": "http://localhost:7860", "steps": 30, "cfg_scale": 7}))
+    files = ConfigFiles()
+    runs = 2000
+    timings = {}
+    for label, read in [("open+json.load", read_json), ("cached", files.json)]:
+        start = time.perf_counter()
+        for _ in range(runs):
+            read(str(path))
+        timings[label] = (time.perf_counter() - start) / runs
+    print("\n" + "\n".join(f"{label}: {seconds * 1e6:.1f} us/read" for label, seconds in timings.items()))
+    assert files.stats()["loads"] == 1
+    assert timings["cached"] < timings["open+json.load"]
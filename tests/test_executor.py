@@ -0,0 +1,65 @@
+import time
+import pytest
+from pipelines import Pipeline, TaskGroup, TaskExecutionError, task, INLINE, THREAD, PROCESS, ExecutorModeError
+
+N = 8
+SLEEP = 0.1
+
+def sleepy(x=None):
+    time.sleep(SLEEP)
+    return x
+
+@task(executor=PROCESS)
+def square(x):
+    return x * x
+
+def parallel_sleepers(executor=None):
+    return TaskGroup([task(sleepy, name=f"sleepy_{i}", executor=executor) for i in range(N)], parallel=True)
+
+async def timed(pipeline):
+    start = time.perf_counter()
+    await pipeline()
+    return time.perf_counter() - start
+
+def test_decorator_with_options():
+    assert square.executor == PROCESS
+    assert square.name == "square"
+
+def test_unknown_mode():
+    with pytest.raises(ExecutorModeError):
+        task(sleepy, executor="gpu")
+    with pytest.raises(ExecutorModeError):
+        Pipeline(task(sleepy), executor="gpu")
+
+def test_process_mode_rejects_nested_functions():
+    def nested(x):
+        return x
+    with pytest.raises(ExecutorModeError, match="module level"):
+        task(nested, executor=PROCESS)
+    with pytest.raises(ExecutorModeError, match="module level"):
+        task(lambda x: x, name="identity", executor=PROCESS)
+    # Fine outside process mode
+    assert task(nested, executor=THREAD).executor == THREAD
+
+@pytest.mark.asyncio
+async def test_pipeline_process_mode_reports_nested_functions():
+    # The pipeline default only applies at run time, so the same check happens there
+    with pytest.raises(TaskExecutionError) as e:
+        await Pipeline(task(lambda x: x, name="identity"), executor=PROCESS)(1)
+    assert isinstance(e.value.original_exception, ExecutorModeError)
+
+@pytest.mark.asyncio
+async def test_process_task():
+    result = await Pipeline(square)(7)
+    assert result == 49
+
+@pytest.mark.asyncio
+async def test_benchmark_parallel_sync_tasks():
+    """N parallel sleeping sync tasks: ~N*t inline, ~t on a thread pool."""
+    inline = await timed(Pipeline(parallel_sleepers(), executor=INLINE))
+    threaded = await timed(Pipeline(parallel_sleepers(), executor=THREAD))
+    per_task = await timed(Pipeline(parallel_sleepers(THREAD)))
+    print(f"\n{N} x {SLEEP}s sync tasks: inline={inline:.3f}s thread={threaded:.3f}s per-task thread={per_task:.3f}s")
+    assert inline >= N * SLEEP * 0.9
+    assert threaded < N * SLEEP / 2
+    assert per_task < N * SLEEP / 2
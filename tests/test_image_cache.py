@@ -0,0 +1,91 @@
+import os
+from PIL import Image
+from mlq_pipelines.image_cache import MISS, ImageCache, file_key, load_image_cached, nbytes, process_image_cached
+
+def save_image(path, color, size=(8, 8)):
+    Image.new("RGB", size, color).save(path)
+    return str(path)
+
+def counting_loader():
+    calls = []
+
+    def load(path):
+        calls.append(path)
+        return Image.open(path).convert("RGB")
+    return load, calls
+
+def test_decoded_images_are_reused_until_the_file_changes(tmp_path):
+    cache = ImageCache()
+    path = save_image(tmp_path / "a.png", "red")
+    load, calls = counting_loader()
+    first = load_image_cached(path, load, cache)
+    assert load_image_cached(path, load, cache) is first
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    save_image(path, "blue", size=(9, 9))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    changed = load_image_cached(path, load, cache)
+    assert changed.getpixel((0, 0)) == (0, 0, 255)
+    assert len(calls) == 2
+
+def test_tensors_are_keyed_by_processor(tmp_path):
+    cache = ImageCache()
+    path = save_image(tmp_path / "a.png", "red")
+    load, calls = counting_loader()
+    processed = []
+
+    def process(scale):
+        def run(image):
+            processed.append(scale)
+            return image.resize((image.width * scale, image.height * scale))
+        return run
+
+    small = process_image_cached(path, ("resize", 1), load, process(1), cache)
+    assert process_image_cached(path, ("resize", 1), load, process(1), cache) is small
+    large = process_image_cached(path, ("resize", 2), load, process(2), cache)
+    assert large.size == (16, 16)
+    assert processed == [1, 2]
+    # Both tensors come from one decode
+    assert len(calls) == 1
+
+def test_memory_budget_evicts_least_recently_used(tmp_path):
+    image = Image.new("RGB", (10, 10))
+    assert nbytes(image) == 300
+    cache = ImageCache(max_bytes=700)
+    cache.set("a", image)
+    cache.set("b", image)
+    cache.get("a")
+    cache.set("c", image)
+    assert cache.get("b") is MISS
+    assert cache.get("a") is image and cache.get("c") is image
+    assert cache.bytes == 600 and cache.evictions == 1
+    # Values larger than the whole budget are not cached
+    cache.set("huge", Image.new("RGB", (100, 100)))
+    assert cache.get("huge") is MISS and cache.bytes == 600
+
+def test_uncacheable_sources_are_loaded_every_time(tmp_path):
+    assert file_key("https://example.com/a.png") is None
+    assert file_key(str(tmp_path / "missing.png")) is None
+    cache = ImageCache()
+    assert cache.get_or_create(None, lambda: 1) == 1
+    assert cache.stats()["entries"] == 0
+
+def test_in_memory_images_carry_their_tensors():
+    class InMemory:
+        def __init__(self):
+            self.image = Image.new("RGB", (2, 2))
+            self.processed = {}
+
+    source = InMemory()
+    processed = []
+
+    def process(image):
+        processed.append(image)
+        return image.size
+    cache = ImageCache()
+    assert process_image_cached(source, "p", lambda s: s.image, process, cache) == (2, 2)
+    assert process_image_cached(source, "p", lambda s: s.image, process, cache) == (2, 2)
+    assert len(processed) == 1 and source.processed == {"p": (2, 2)}
+    assert cache.stats()["entries"] == 0
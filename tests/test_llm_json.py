@@ -0,0 +1,64 @@
+import json
+import pytest
+from typing import List
+from pydantic import BaseModel
+from personas.llm_json import LLMJSONError, extract_json, get_type_adapter, iter_json_array, parse_llm_json, repair_json
+
+class Candidate(BaseModel):
+    positive: str
+    negative: str
+
+def test_extract_json():
+    assert extract_json('Sure!\n```json\n{"a": 1}\n```\nbye') == '{"a": 1}'
+    assert extract_json('```\n[1, 2]\n```') == '[1, 2]'
+    assert extract_json('The answer is {"a": "}"} ok') == '{"a": "}"}'
+    assert extract_json('```json\n{"a": [1,') == '{"a": [1,'
+    assert extract_json('no json here') is None
+    # Brackets in the leading prose aren't mistaken for the payload
+    assert extract_json('As noted [see above]: {"a": 1}') == '{"a": 1}'
+    assert extract_json('As noted [see above]: {"a": [1,') == '{"a": [1,'
+    assert extract_json('See {this}: {"a": 1,}') == '{"a": 1,}'
+
+@pytest.mark.parametrize("broken, expected", [
+    ('{"a": 1,}', {"a": 1}),
+    ('[1, 2, ]', [1, 2]),
+    ('[{"a": 1}, {"a": 2', [{"a": 1}, {"a": 2}]),
+    ('{"a": "trunc', {"a": "trunc"}),
+    ('{"a": 1, "b":', {"a": 1}),
+    ('{"a": 1, "b"', {"a": 1}),
+    ('[{"a": 1},', [{"a": 1}]),
+    ('{"a": ["x", "y\\', {"a": ["x", "y"]}),
+])
+def test_repair_json(broken, expected):
+    assert json.loads(repair_json(broken)) == expected
+
+def test_parse_llm_json():
+    text = 'Here:\n```json\n[{"positive": "happy", "negative": "sad"},\n {"positive": "big", "negative": "small"},]\n```'
+    candidates = parse_llm_json(List[Candidate], text)
+    assert [c.positive for c in candidates] == ["happy", "big"]
+    with pytest.raises(LLMJSONError):
+        parse_llm_json(List[Candidate], text, repair=False)
+    with pytest.raises(LLMJSONError):
+        parse_llm_json(Candidate, '{"positive": "x"}')
+    assert get_type_adapter(List[Candidate]) is get_type_adapter(List[Candidate])
+
+@pytest.mark.asyncio
+async def test_iter_json_array():
+    text = 'Ideas:\n```json\n[{"positive": "a [x]", "negative": "b"}, {"positive": "c", "negative": "d \\" }"}]\n```'
+
+    async def deltas():
+        for i in range(0, len(text), 7):
+            yield text[i:i + 7]
+
+    items = [c async for c in iter_json_array(deltas(), Candidate)]
+    assert [c.positive for c in items] == ["a [x]", "c"]
+    assert items[1].negative == 'd " }'
+
+@pytest.mark.asyncio
+async def test_deserialize_llm_response_json():
+    from personas.llm_methods import deserialize_llm_response_json
+    from personas.models import Person
+    person, error = await deserialize_llm_response_json(Person, '```json\n{"name": "Lila", "age": 30, "background": "pilot",}\n```')
+    assert error == '' and person.name == "Lila"
+    person, error = await deserialize_llm_response_json(Person, '{"name": "Lila", "age": -1, "background": "x"}')
+    assert person is None and error.startswith("Malformed JSON response")
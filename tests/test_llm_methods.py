@@ -0,0 +1,158 @@
+import asyncio
+import json
+import time
+import pytest
+from aiohttp import web
+from personas.llm_methods import AnthropicAPIError, AnthropicClient, TokenBucket, first_json_block
+
+async def serve(handler):
+    app = web.Application()
+    app.router.add_post("/v1/messages", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/v1/messages"
+
+@pytest.mark.asyncio
+async def test_retries_throttled_requests():
+    statuses = [429, 503, 200]
+    seen = []
+
+    async def handler(request):
+        seen.append(await request.json())
+        status = statuses[len(seen) - 1]
+        if status != 200:
+            return web.Response(status=status, headers={"retry-after": "0"})
+        return web.json_response({"content": [{"type": "text", "text": "ok"}]})
+
+    runner, url = await serve(handler)
+    client = AnthropicClient(api_key="test", url=url)
+    try:
+        response = await client.post_message("hi", system="sys")
+        assert response["content"][0]["text"] == "ok"
+        assert len(seen) == 3
+        assert seen[0]["system"] == "sys"
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_raises_on_client_errors_and_exhausted_retries():
+    async def handler(request):
+        return web.Response(status=400 if "bad" in (await request.json())["messages"][0]["content"] else 500, text="nope")
+
+    runner, url = await serve(handler)
+    client = AnthropicClient(api_key="test", url=url, max_retries=2, base_delay=0.001)
+    try:
+        with pytest.raises(AnthropicAPIError) as e:
+            await client.post_message("bad")
+        assert e.value.status == 400
+        with pytest.raises(AnthropicAPIError) as e:
+            await client.post_message("retry")
+        assert e.value.status == 500
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_token_bucket():
+    bucket = TokenBucket(per_minute=600)  # 10 per second
+    start = time.monotonic()
+    await bucket.acquire(600)
+    await bucket.acquire(2)
+    assert 0.15 < time.monotonic() - start < 1
+
+def sse(*events):
+    return "".join(f"event: {e['type']}\ndata: {json.dumps(e)}\n\n" for e in events)
+
+def delta(text):
+    return {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}
+
+@pytest.mark.asyncio
+async def test_stream_stops_after_json_block():
+    chunks = ["Here you go:\n```js", "on\n{\"name\": ", "\"Zara\"}\n``", "`\nAnd some more"] + [" trailing text"] * 10
+    sent = []
+
+    async def handler(request):
+        assert (await request.json())["stream"] is True
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(sse({"type": "message_start", "message": {}}).encode())
+        try:
+            for chunk in chunks:
+                sent.append(chunk)
+                await response.write(sse(delta(chunk)).encode())
+                await asyncio.sleep(0.02)
+            await response.write(sse({"type": "message_stop"}).encode())
+        except ConnectionResetError:
+            pass
+        return response
+
+    runner, url = await serve(handler)
+    client = AnthropicClient(api_key="test", url=url)
+    try:
+        deltas = [d async for d in client.stream_message("hi")]
+        assert "".join(deltas) == "".join(chunks)
+        sent.clear()
+        json_string, text = await first_json_block(client.stream_message("hi"))
+        assert json.loads(json_string) == {"name": "Zara"}
+        assert "trailing" not in text
+        await asyncio.sleep(0.15)
+        assert len(sent) < len(chunks)
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_stream_failing_after_text_is_not_retried():
+    requests = []
+
+    async def handler(request):
+        requests.append(1)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(sse(delta(f"chunk{len(requests)} ")).encode())
+        # Stall mid-stream until the client's read timeout fires
+        await asyncio.sleep(1)
+        return response
+
+    runner, url = await serve(handler)
+    client = AnthropicClient(api_key="test", url=url, base_delay=0.001, stream_read_timeout=0.1)
+    deltas = []
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            async for d in client.stream_message("hi"):
+                deltas.append(d)
+    finally:
+        await client.close()
+        await runner.cleanup()
+    assert deltas == ["chunk1 "]
+    assert len(requests) == 1
+
+@pytest.mark.asyncio
+async def test_stream_read_timeout_allows_long_generations():
+    async def handler(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i in range(5):
+            await response.write(sse(delta(f"{i} ")).encode())
+            await asyncio.sleep(0.05)
+        await response.write(sse({"type": "message_stop"}).encode())
+        return response
+
+    runner, url = await serve(handler)
+    # The whole stream takes longer than `timeout`, but data keeps arriving
+    client = AnthropicClient(api_key="test", url=url, timeout=0.1, stream_read_timeout=1)
+    try:
+        assert "".join([d async for d in client.stream_message("hi")]) == "0 1 2 3 4 "
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_first_json_block_incomplete():
+    async def deltas():
+        yield "```json\n{\"a\": "
+    assert await first_json_block(deltas()) == (None, "```json\n{\"a\": ")
@@ -0,0 +1,32 @@
+import pytest
+from pipelines import AdaptiveFilterChain, Pipeline, param
+
+def make_chain(filter_stage, stats_path=None):
+    return AdaptiveFilterChain([
+        filter_stage("slow_rarely_rejects", lambda x: x % 10 == 0, delay=0.004),
+        filter_stage("fast_often_rejects", lambda x: x % 4 != 0, delay=0.001),
+    ], stats_path=stats_path)
+
+@pytest.mark.asyncio
+async def test_reorders_to_cheapest_most_rejecting_first(filter_stage):
+    chain = make_chain(filter_stage)
+    pipeline = Pipeline(chain)
+    file_order = [s.name for s in chain.stages]
+    results = await pipeline.map(range(40), concurrency=1)
+    assert [r for r in results if r] == [4, 8, 12, 16, 24, 28, 32, 36]
+    assert [s.name for s in chain.order()] == ["fast_often_rejects", "slow_rarely_rejects"]
+    assert chain.expected_cost() < chain.expected_cost(chain.stages)
+    assert file_order == [s.name for s in chain.stages]
+    assert pipeline.rejections["fast_often_rejects"] > 0
+
+@pytest.mark.asyncio
+async def test_stats_persist_between_runs(tmp_path, calls, filter_stage):
+    path = str(tmp_path / "stats.json")
+    chain = make_chain(filter_stage, path)
+    await Pipeline(chain).map(range(20), concurrency=1)
+    chain.save()
+    reloaded = make_chain(filter_stage, path)
+    assert reloaded.stats["fast_often_rejects"].calls == chain.stats["fast_often_rejects"].calls
+    calls.clear()
+    await Pipeline(param("x") >> reloaded).bind(x=1)()
+    assert calls == ["fast_often_rejects"]
@@ -0,0 +1,38 @@
+import asyncio
+import pytest
+from pipelines import Pipeline, THREAD, UnboundParameterError, param, resolve, task
+
+def greet(greeting):
+    @task
+    async def greet_(name):
+        return f"{resolve(greeting)} {name}"
+    return greet_
+
+@task(executor=THREAD)
+def shout(text):
+    return text + resolve(param("suffix", "!"))
+
+@pytest.mark.asyncio
+async def test_param_node_and_closure():
+    template = Pipeline(param("name") >> greet(param("greeting")) >> shout, params={"greeting": "Hello"}).compile()
+    assert await template.bind(name="Ada")() == "Hello Ada!"
+    assert await template.bind(name="Bob", greeting="Hi", suffix="?")() == "Hi Bob?"
+    assert template.bind(name="x").plan is template.plan
+
+@pytest.mark.asyncio
+async def test_concurrent_bindings_are_isolated():
+    template = Pipeline(greet(param("greeting")))
+
+    async def run(greeting):
+        await asyncio.sleep(0)
+        return await template.bind(greeting=greeting)("you")
+
+    assert await asyncio.gather(run("Hi"), run("Yo")) == ["Hi you", "Yo you"]
+
+@pytest.mark.asyncio
+async def test_unbound_param():
+    with pytest.raises(Exception) as e:
+        await Pipeline(greet(param("greeting")))("you")
+    assert isinstance(e.value.__cause__, UnboundParameterError)
+    with pytest.raises(UnboundParameterError):
+        await Pipeline(param("name") >> shout)()
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from functools import reduce
+import pytest
+from pipelines import Pipeline, TaskGroup, task, set_output, get_output, OutputMismatchError
+from test_pipeline import (A, B, C, task_generate_a, task_generate_b, task_generate_tuple, task_combine_tuple,
+                           task_convert_a, task_convert_b, task_chain_b, task_combine_a_b)
+
+@task
+def inc(x):
+    return x + 1
+
+def chain(n):
+    return reduce(lambda graph, i: graph >> task(inc.func, name=f"inc_{i}"), range(1, n), task(inc.func, name="inc_0"))
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("graph", [
+    lambda: (task_generate_a,),
+    lambda: (task_generate_a >> task_convert_a >> task_convert_b,),
+    lambda: (task_generate_tuple >> task_combine_tuple,),
+    lambda: ((task_generate_a | task_generate_b) >> task_combine_a_b,),
+    lambda: ((task_generate_a >> task_convert_a) | (task_generate_b >> task_chain_b),),
+    lambda: (task_generate_a, task_generate_b),
+    lambda: (task_generate_a >> set_output("a"), get_output("a") >> (task_convert_a | task_convert_a)),
+])
+async def test_compiled_matches_interpreter(graph):
+    interpreted = await Pipeline(*graph())()
+    compiled = await Pipeline(*graph()).compile()()
+    flatten = lambda r: [flatten(x) for x in r] if isinstance(r, list) else (type(r), r.content)
+    assert flatten(compiled) == flatten(interpreted)
+
+@pytest.mark.asyncio
+async def test_compile_flattens_deep_chains():
+    pipeline = Pipeline(chain(5000)).compile()
+    assert len(pipeline.plan) == 5000
+    assert len(pipeline.plan.branches[0]) == 5000
+    assert await pipeline(0) == 5000
+    assert await pipeline.map([0, 10]) == [5000, 5010]
+
+def test_compile_validates_outputs():
+    pipeline = Pipeline(task_generate_a >> set_output("a"), get_output("a") >> task_convert_a).compile()
+    assert pipeline.plan.provides == {"a"} and pipeline.plan.requires == {"a"}
+
+@pytest.mark.asyncio
+async def test_benchmark_compiled_overhead():
+    """Per-invocation overhead of 1k-task chains: interpreter vs compiled plan."""
+    flat = TaskGroup([task(inc.func, name=f"inc_{i}") for i in range(1000)])
+    # The interpreter recurses once per nested group, so 1k-deep reduce chains overflow the stack
+    nested = chain(300)
+    runs = 20
+    timings = {}
+    for label, pipeline, expected in [
+        ("flat 1k interpreted", Pipeline(flat), 1000),
+        ("flat 1k compiled", Pipeline(flat).compile(), 1000),
+        ("nested 300 interpreted", Pipeline(nested), 300),
+        ("nested 300 compiled", Pipeline(nested).compile(), 300),
+        ("nested 1k compiled", Pipeline(chain(1000)).compile(), 1000),
+    ]:
+        start = time.perf_counter()
+        for _ in range(runs):
+            assert await pipeline(0) == expected
+        timings[label] = (time.perf_counter() - start) / runs
+    print("\n" + "\n".join(f"{label}: {seconds * 1000:.2f} ms/invocation" for label, seconds in timings.items()))
+    assert timings["nested 300 compiled"] < timings["nested 300 interpreted"]
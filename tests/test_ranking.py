@@ -0,0 +1,165 @@
+import asyncio
+import math
+import random
+import pytest
+from pipelines import PipelineContext, batched_task
+from mlq_pipelines.ranking import BradleyTerry, correction_pass, insertion_point, merge, rank, rank_bradley_terry, select_round, select_top_k
+
+def counting_before():
+    calls = []
+
+    async def before(a, b):
+        calls.append((a, b))
+        await asyncio.sleep(0)
+        return a > b
+    return before, calls
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 7, 16, 33, 100])
+async def test_rank_sorts_best_first(n):
+    items = random.Random(n).sample(range(1000), n)
+    before, calls = counting_before()
+    assert await rank(items, before) == sorted(items, reverse=True)
+    if n > 1:
+        assert len(calls) <= 2 * n * math.log2(n)
+
+@pytest.mark.asyncio
+async def test_merge_and_insertion_point():
+    before, _ = counting_before()
+    assert await insertion_point(5, [9, 7, 3, 1], before) == 2
+    assert await merge([9, 6, 5, 2, 1], [8, 7, 4, 3], before) == [9, 8, 7, 6, 5, 4, 3, 2, 1]
+    assert await merge([], [2, 1], before) == [2, 1]
+
+@pytest.mark.asyncio
+async def test_top_k_ranks_the_head_with_fewer_comparisons():
+    items = random.Random(1).sample(range(1000), 128)
+    before, full_calls = counting_before()
+    await rank(items, before)
+    before, top_calls = counting_before()
+    ranked = await rank(items, before, top_k=5)
+    assert ranked[:5] == sorted(items, reverse=True)[:5]
+    assert sorted(ranked) == sorted(items)
+    assert len(top_calls) < len(full_calls) / 2
+
+@pytest.mark.asyncio
+async def test_inconsistent_comparator_still_returns_a_permutation():
+    rng = random.Random(3)
+    items = list(range(50))
+
+    async def before(a, b):
+        return rng.random() < 0.5
+    ranked = await rank(items, before)
+    assert sorted(ranked) == items
+
+@pytest.mark.asyncio
+async def test_comparisons_are_dispatched_in_rounds():
+    # Comparisons issued together land in the same batch, so batches count rounds
+    n = 128
+
+    @batched_task(max_batch=n, max_wait_ms=1)
+    def compare_batch(pairs):
+        return [a > b for a, b in pairs]
+    context = PipelineContext()
+
+    async def before(a, b):
+        return await compare_batch(context, (a, b))
+
+    items = random.Random(7).sample(range(10000), n)
+    assert await rank(items, before) == sorted(items, reverse=True)
+    rounds = len(compare_batch.batch_sizes)
+    comparisons = sum(compare_batch.batch_sizes)
+    # Sequential binary insertion would need one round per comparison (~n log2 n)
+    assert comparisons <= 2 * n * math.log2(n)
+    assert rounds <= 2 * math.log2(n) ** 2
+    assert rounds < comparisons / 5
+
+def inversions(ranked):
+    return sum(1 for i in range(len(ranked)) for j in range(i + 1, len(ranked)) if ranked[i] < ranked[j])
+
+def test_bradley_terry_fit():
+    model = BradleyTerry(["a", "b", "c"])
+    for _ in range(3):
+        model.add("a", "b")
+        model.add("b", "c")
+    model.add("c", "a", 0.2)
+    model.fit()
+    assert model.ranking() == ["a", "b", "c"]
+    assert model.probability("a", "c") > model.probability("a", "b") > 0.5
+    assert model.probability("a", "b") + model.probability("b", "a") == pytest.approx(1.0)
+    assert model.confidence("a", "c") > model.confidence("a", "b")
+    assert model.compared("a", "b") and model.comparisons == 7
+
+def test_select_round_uses_each_item_once():
+    assert select_round([("a", "b"), ("b", "c"), ("c", "d"), ("e", "f")], 5) == [("a", "b"), ("c", "d"), ("e", "f")]
+    assert select_round([("a", "b"), ("c", "d")], 1) == [("a", "b")]
+
+@pytest.mark.asyncio
+async def test_bradley_terry_is_robust_to_noisy_comparisons():
+    rng = random.Random(0)
+
+    async def noisy(a, b):
+        p = 1.0 if a > b else 0.0
+        return 1 - p if rng.random() < 0.15 else p
+
+    async def before(a, b):
+        return await noisy(a, b) >= 0.5
+
+    items = list(range(48))
+    random.Random(1).shuffle(items)
+    merged = await rank(items, before)
+    fitted = await rank_bradley_terry(items, noisy, budget=2 * len(items), repeat=True)
+    assert sorted(fitted) == sorted(items)
+    assert inversions(fitted) < inversions(merged)
+
+@pytest.mark.asyncio
+async def test_correction_pass_fixes_a_misplaced_item():
+    calls = []
+
+    async def exact(a, b):
+        calls.append((a, b))
+        return 1.0 if a > b else 0.0
+
+    ranked = [9, 8, 3, 7, 6, 5, 4, 2, 1, 0]
+    assert await correction_pass(ranked, exact, budget=30) == sorted(ranked, reverse=True)
+    assert len(calls) <= 30
+    # A deterministic judge isn't asked the same pair twice
+    assert len(set(map(frozenset, calls))) == len(calls)
+
+@pytest.mark.asyncio
+async def test_refinement_stops_within_budget():
+    calls = []
+
+    async def exact(a, b):
+        calls.append((a, b))
+        return 1.0 if a > b else 0.0
+
+    ranked = await rank_bradley_terry(list(range(20)), exact, budget=5)
+    assert sorted(ranked) == list(range(20))
+    seeded = len(calls)
+    calls.clear()
+    await correction_pass(list(range(20)), exact, budget=5)
+    assert len(calls) <= 5 and seeded > 0
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("n,k", [(500, 10), (33, 5), (7, 7), (1, 1), (5, 0), (3, 10)])
+async def test_select_top_k(n, k):
+    items = random.Random(n).sample(range(10000), n)
+    before, calls = counting_before()
+    assert await select_top_k(items, before, k) == sorted(items, reverse=True)[:k]
+    if n > 1:
+        assert len(calls) <= n + max(k - 1, 0) * math.ceil(math.log2(n))
+
+@pytest.mark.asyncio
+async def test_select_top_k_plays_first_round_concurrently():
+    @batched_task(max_batch=256, max_wait_ms=1)
+    def compare_batch(pairs):
+        return [a > b for a, b in pairs]
+    context = PipelineContext()
+
+    async def before(a, b):
+        return await compare_batch(context, (a, b))
+
+    items = list(range(256))
+    assert await select_top_k(items, before, 1) == [255]
+    assert compare_batch.batch_sizes[:2] == [128, 64]
+    assert len(compare_batch.batch_sizes) == 8
@@ -0,0 +1,42 @@
+import pickle
+from functools import reduce
+import pytest
+from pipelines import MemoryCache, Pipeline, Reject, task
+
+def filters(filter_stage):
+    return reduce(lambda graph, s: graph >> s, [
+        filter_stage("positive", lambda x: x <= 0),
+        filter_stage("even", lambda x: x % 2),
+        filter_stage("small", lambda x: x > 10),
+    ])
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compiled", [False, True])
+async def test_sequence_stops_at_reject(compiled, calls, filter_stage):
+    pipeline = Pipeline(filters(filter_stage))
+    if compiled:
+        pipeline.compile()
+    result = await pipeline(3)
+    assert isinstance(result, Reject) and not result
+    assert result.stage == "even"
+    assert calls == ["positive", "even"]
+    assert await pipeline(4) == 4
+    await pipeline.map([-1, 5, 7, 12, 2])
+    assert pipeline.rejections == {"positive": 1, "even": 3, "small": 1}
+
+@pytest.mark.asyncio
+async def test_reject_in_parallel_branch_is_a_result(filter_stage):
+    pipeline = Pipeline(filter_stage("odd", lambda x: x % 2 == 0) | filter_stage("any", lambda x: False))
+    result = await pipeline(2)
+    assert result[0] == Reject("odd rejected 2", "odd")
+    assert result[1] == 2
+
+@pytest.mark.asyncio
+async def test_cached_rejects_are_counted(calls, filter_stage):
+    cached = task(filter_stage("even", lambda x: x % 2).func, name="even", cache=MemoryCache())
+    pipeline = Pipeline(cached)
+    await pipeline(1)
+    await pipeline(1)
+    assert calls == ["even"]
+    assert pipeline.rejections["even"] == 2
+    assert pickle.loads(pickle.dumps(Reject("r", "s"))) == Reject("r", "s")
@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from personas.response_store import ResponseStore, open_response_store
+
+def response(text):
+    return {"content": [{"type": "text", "text": text}]}
+
+@pytest.mark.asyncio
+async def test_single_flight_and_persistence(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    store = ResponseStore(path)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return response("hi")
+
+    payload = {"model": "m", "message": "hello", "system": None, "temperature": 0.5}
+    results = await asyncio.gather(*[store.get_or_fetch(payload, fetch) for _ in range(5)])
+    assert results == [response("hi")] * 5
+    assert len(calls) == 1
+    assert await store.get_or_fetch(payload, fetch) == response("hi")
+    assert await store.get_or_fetch(dict(payload, temperature=1.0), fetch) == response("hi")
+    assert len(calls) == 2
+    stats = store.stats()
+    assert (stats["misses"], stats["joined"], stats["hits"], stats["entries"]) == (2, 4, 1, 2)
+    assert stats["bytes"] > 0
+    store.close()
+
+    reopened = ResponseStore(path)
+    assert reopened.get(payload) == response("hi")
+
+@pytest.mark.asyncio
+async def test_failures_are_not_stored(tmp_path):
+    store = ResponseStore(str(tmp_path / "responses.sqlite"))
+
+    async def fail():
+        raise RuntimeError("429")
+
+    async def empty():
+        return None
+
+    with pytest.raises(RuntimeError):
+        await store.get_or_fetch({"message": "x"}, fail)
+    assert await store.get_or_fetch({"message": "x"}, empty) is None
+    assert store.stats()["entries"] == 0
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_others(tmp_path):
+    store = ResponseStore(str(tmp_path / "responses.sqlite"))
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return response("hi")
+
+    first = asyncio.ensure_future(store.get_or_fetch({"message": "x"}, fetch))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(store.get_or_fetch({"message": "x"}, fetch))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    assert await second == response("hi")
+    assert first.cancelled()
+    assert len(calls) == 1
+    assert store.get({"message": "x"}) == response("hi")
+
+def test_open_once_per_path(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    assert open_response_store(path) is open_response_store(path)
@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from pipelines import Pipeline, Scheduler, task
+
+def tracked(name, resource, counters, delay=0.01):
+    @task(name=name, resource=resource)
+    async def tracked_(*args):
+        counters[resource] = counters.get(resource, 0) + 1
+        counters["peak_" + resource] = max(counters.get("peak_" + resource, 0), counters[resource])
+        counters["total"] = counters.get("total", 0) + 1
+        counters["peak_total"] = max(counters.get("peak_total", 0), counters["total"])
+        await asyncio.sleep(delay)
+        counters[resource] -= 1
+        counters["total"] -= 1
+        return resource
+    return tracked_
+
+@pytest.mark.asyncio
+async def test_per_resource_limit():
+    counters = {}
+    scheduler = Scheduler({"gpu": 2, "api": 3})
+    pipeline = Pipeline(tracked("vlm", "gpu", counters) | tracked("llm", "api", counters), scheduler=scheduler)
+    results = await asyncio.gather(*[pipeline() for _ in range(20)])
+    assert results[0] == ["gpu", "api"]
+    assert counters["peak_gpu"] == 2
+    assert counters["peak_api"] == 3
+
+@pytest.mark.asyncio
+async def test_global_limit():
+    counters = {}
+    scheduler = Scheduler({"gpu": 3}, max_concurrency=4)
+    pipeline = Pipeline(tracked("vlm", "gpu", counters) | tracked("other", "cpu", counters), scheduler=scheduler)
+    await asyncio.gather(*[pipeline() for _ in range(20)])
+    assert counters["peak_gpu"] <= 3
+    assert counters["peak_total"] == 4
+
+@pytest.mark.asyncio
+async def test_slot_outside_pipeline():
+    scheduler = Scheduler({"sliders": 1})
+    order = []
+    async def work(i):
+        async with scheduler.slot("sliders"):
+            order.append(("start", i))
+            await asyncio.sleep(0.001)
+            order.append(("end", i))
+    await asyncio.gather(work(0), work(1))
+    assert order == [("start", 0), ("end", 0), ("start", 1), ("end", 1)]
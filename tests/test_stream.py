@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from pipelines import Pipeline, task, set_output, get_output
+
+@task
+async def slow_double(x):
+    await asyncio.sleep(0.01 * (5 - x))
+    return x * 2
+
+@task
+async def add(x, y):
+    return x + y
+
+@task
+async def fail_on_three(x):
+    if x == 3:
+        raise ValueError("three")
+    return x
+
+@pytest.mark.asyncio
+async def test_map_preserves_order():
+    results = await Pipeline(slow_double).map(range(5), concurrency=5)
+    assert results == [0, 2, 4, 6, 8]
+
+@pytest.mark.asyncio
+async def test_stream_unordered_yields_as_completed():
+    pairs = [pair async for pair in Pipeline(slow_double).stream(range(5), concurrency=5)]
+    assert pairs[0] == (4, 8)
+    assert sorted(pairs) == [(i, i * 2) for i in range(5)]
+
+@pytest.mark.asyncio
+async def test_tuple_inputs_are_unpacked():
+    assert await Pipeline(add).map([(1, 2), (3, 4)]) == [3, 7]
+
+@pytest.mark.asyncio
+async def test_contexts_are_isolated():
+    pipeline = Pipeline(slow_double >> set_output("x"), get_output("x") >> slow_double)
+    results = await pipeline.map(range(5), concurrency=5)
+    assert results == [[x * 2, x * 4] for x in range(5)]
+
+@pytest.mark.asyncio
+async def test_backpressure():
+    pulled = []
+    in_flight = []
+    peak = []
+
+    @task
+    async def track(x):
+        in_flight.append(x)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.001)
+        in_flight.remove(x)
+        return x
+
+    async def source():
+        for i in range(20):
+            pulled.append(i)
+            yield i
+
+    yielded = 0
+    async for item, result in Pipeline(track).stream(source(), concurrency=3):
+        yielded += 1
+        assert len(pulled) <= yielded + 3
+    assert max(peak) == 3
+
+@pytest.mark.asyncio
+async def test_exceptions():
+    pipeline = Pipeline(fail_on_three)
+    with pytest.raises(Exception):
+        await pipeline.map(range(5))
+    results = await pipeline.map(range(5), return_exceptions=True)
+    assert isinstance(results[3], Exception)
+    assert results[4] == 4
@@ -0,0 +1,169 @@
+import asyncio
+import base64
+import io
+import json
+import pytest
+from aiohttp import web
+from PIL import Image
+from pipelines import Pipeline, param, stable_hash
+from mlq_pipelines.t2i import GeneratedImage, SDWebUIClient, SDWebUIError, infotexts_from_info, set_sdwebui_client, text_to_image
+
+def png_b64(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), color).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+async def serve(txt2img, png_info=None):
+    app = web.Application()
+    app.router.add_post("/sdapi/v1/txt2img", txt2img)
+    if png_info is not None:
+        app.router.add_post("/sdapi/v1/png-info", png_info)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, {"sd_webui_url": f"http://127.0.0.1:{port}/sdapi/v1/txt2img", "steps": 4}
+
+def fake_txt2img(seen):
+    async def handler(request):
+        data = await request.json()
+        seen.append(data)
+        count = data["batch_size"] * data["n_iter"]
+        # A trailing grid image, as the WebUI returns for multi-image requests
+        images = [png_b64((i * 40, 0, 0)) for i in range(count)] + [png_b64("white")]
+        info = {"infotexts": [f"{data['prompt']}, Seed: {data['seed'] + i}" for i in range(count)]}
+        return web.json_response({"images": images, "info": json.dumps(info)})
+    return handler
+
+@pytest.mark.asyncio
+async def test_batch_generation_writes_local_pnginfo(tmp_path):
+    seen = []
+    png_info_calls = []
+
+    async def png_info(request):
+        png_info_calls.append(1)
+        return web.json_response({"info": "remote"})
+
+    runner, config = await serve(fake_txt2img(seen), png_info)
+    client = SDWebUIClient(config)
+    try:
+        fnames = [str(tmp_path / f"{i}.png") for i in range(6)]
+        saved = await client.generate("a cat", "blurry", batch_size=3, n_iter=2, fnames=fnames)
+        assert saved == fnames
+        assert len(seen) == 1 and seen[0]["steps"] == 4 and seen[0]["negative_prompt"] == "blurry"
+        assert "sd_webui_url" not in seen[0]
+        assert png_info_calls == []
+        for i, fname in enumerate(saved):
+            image = Image.open(fname)
+            assert image.getpixel((0, 0)) == (i * 40, 0, 0)
+            assert image.text["parameters"] == f"a cat, Seed: {seen[0]['seed'] + i}"
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_png_info_round_trip_when_local_metadata_is_disabled(tmp_path):
+    async def png_info(request):
+        return web.json_response({"info": "remote parameters"})
+
+    runner, config = await serve(fake_txt2img([]), png_info)
+    client = SDWebUIClient(config, local_pnginfo=False)
+    try:
+        [fname] = await client.generate("a cat", fnames=[str(tmp_path / "a.png")])
+        assert Image.open(fname).text["parameters"] == "remote parameters"
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_retries_are_bounded(tmp_path):
+    calls = []
+
+    async def failing(request):
+        calls.append(1)
+        return web.Response(status=500, text="CUDA out of memory")
+
+    runner, config = await serve(failing)
+    client = SDWebUIClient(config, max_retries=2, base_delay=0.001)
+    try:
+        with pytest.raises(SDWebUIError) as error:
+            await client.txt2img("a cat")
+        assert error.value.status == 500
+        assert len(calls) == 3
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_transient_failures_are_retried(tmp_path):
+    calls = []
+    succeed = fake_txt2img([])
+
+    async def flaky(request):
+        calls.append(1)
+        if len(calls) == 1:
+            return web.Response(status=503)
+        return await succeed(request)
+
+    runner, config = await serve(flaky)
+    client = SDWebUIClient(config, base_delay=0.001)
+    try:
+        [fname] = await client.generate("a cat", fnames=[str(tmp_path / "a.png")])
+        assert len(calls) == 2 and Image.open(fname).text["parameters"].startswith("a cat")
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+def test_infotexts_from_info():
+    assert infotexts_from_info(json.dumps({"infotexts": ["a", "b"]})) == ["a", "b"]
+    assert infotexts_from_info({"infotexts": ["a"]}) == ["a"]
+    assert infotexts_from_info("not json") == []
+    assert infotexts_from_info(None) == []
+
+@pytest.mark.asyncio
+async def test_in_memory_images_are_saved_on_demand(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner, config = await serve(fake_txt2img([]))
+    client = SDWebUIClient(config)
+    try:
+        images = await client.generate("a cat", batch_size=2, save=False)
+    finally:
+        await client.close()
+        await runner.cleanup()
+    assert all(isinstance(image, GeneratedImage) for image in images)
+    assert list(tmp_path.iterdir()) == []
+    assert images[1].image.getpixel((0, 0)) == (40, 0, 0)
+    assert stable_hash(images[0]) == stable_hash(GeneratedImage(images[0].b64_image))
+    assert stable_hash(images[0]) != stable_hash(images[1])
+    fname = images[1].save(str(tmp_path / "kept.png"))
+    assert images[1].save() == fname
+    saved = Image.open(fname)
+    assert saved.getpixel((0, 0)) == (40, 0, 0)
+    assert saved.text["parameters"].startswith("a cat, Seed:")
+    assert [p.name for p in tmp_path.iterdir()] == ["kept.png"]
+
+@pytest.mark.asyncio
+async def test_batched_generation_keeps_bound_prompts_apart(monkeypatch):
+    seen = []
+    runner, config = await serve(fake_txt2img(seen))
+    client = SDWebUIClient(config)
+    monkeypatch.setattr("mlq_pipelines.t2i.default_client", None)
+    set_sdwebui_client(client)
+    generate = text_to_image(param("prompt"), max_batch=4, max_wait_ms=50, save=False)
+    pipeline = Pipeline(generate)
+    try:
+        cats = pipeline.bind(prompt="cat")
+        dogs = pipeline.bind(prompt="dog")
+        images = await asyncio.gather(cats(None), dogs(None), cats(None), dogs(None))
+    finally:
+        await client.close()
+        await runner.cleanup()
+    assert [image.parameters.split(",")[0] for image in images] == ["cat", "dog", "cat", "dog"]
+    # One batch, split into one request per prompt
+    assert generate.batch_sizes == [4]
+    assert sorted((data["prompt"], data["batch_size"]) for data in seen) == [("cat", 2), ("dog", 2)]
+
+def test_single_and_batched_generation_share_the_sdwebui_resource():
+    assert text_to_image("a cat").resource == "sdwebui"
+    assert text_to_image("a cat", max_batch=4).resource == "sdwebui"
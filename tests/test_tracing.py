@@ -0,0 +1,87 @@
+import asyncio
+import json
+import time
+import pytest
+from pipelines import Pipeline, Scheduler, TaskGroup, Tracer, task, set_output, get_output
+from pipelines.tracing import percentile
+
+@task
+async def fast(x=None):
+    await asyncio.sleep(0.001)
+    return x
+
+@task
+async def slow(x=None):
+    await asyncio.sleep(0.02)
+    return x
+
+@task
+async def broken(x=None):
+    raise ValueError("nope")
+
+@pytest.mark.asyncio
+async def test_summary_per_task():
+    tracer = Tracer()
+    pipeline = Pipeline(fast >> (slow | fast), tracer=tracer)
+    await pipeline.map(range(5))
+    summary = tracer.summary()
+    assert summary["fast"]["count"] == 10
+    assert summary["slow"]["count"] == 5
+    assert summary["slow"]["p50"] >= 0.02
+    assert summary["slow"]["p95"] >= summary["slow"]["p50"]
+    assert "slow" in tracer.summary_table()
+    assert tracer.summary("group")
+
+@pytest.mark.asyncio
+async def test_errors_and_queue_wait():
+    tracer = Tracer()
+    scheduler = Scheduler({"gpu": 1})
+    gpu_slow = task(slow.func, name="gpu_slow", resource="gpu")
+    await Pipeline(gpu_slow, tracer=tracer, scheduler=scheduler).map(range(3))
+    with pytest.raises(Exception):
+        await Pipeline(broken, tracer=tracer)()
+    summary = tracer.summary()
+    assert summary["broken"]["errors"] == 1
+    assert summary["gpu_slow"]["wait_p95"] >= 0.03
+
+@pytest.mark.asyncio
+async def test_chrome_trace_has_parallel_tracks(tmp_path):
+    tracer = Tracer()
+    pipeline = Pipeline(slow >> set_output("x"), get_output("x") >> (slow | slow), tracer=tracer)
+    await pipeline(1)
+    path = tmp_path / "trace.json"
+    tracer.export_chrome_trace(str(path))
+    events = json.loads(path.read_text())["traceEvents"]
+    assert {e["cat"] for e in events} >= {"task", "group", "get_output"}
+    slow_tracks = {e["tid"] for e in events if e["name"] == "slow"}
+    assert len(slow_tracks) >= 2
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+
+@pytest.mark.parametrize("values,q,expected", [
+    (range(1, 101), 95, 95),
+    (range(1, 101), 50, 50),
+    (range(1, 21), 95, 19),
+    (range(1, 21), 100, 20),
+    ([2, 1], 50, 1),
+    (range(1, 7), 50, 3),
+    ([5], 95, 5),
+    (range(1, 11), 0, 1),
+])
+def test_percentile_nearest_rank(values, q, expected):
+    assert percentile(list(values), q) == expected
+
+@pytest.mark.asyncio
+async def test_traced_chain_records_every_span():
+    chain = TaskGroup([task(lambda x: x, name=f"t{i}") for i in range(200)])
+    plain = Pipeline(chain)
+    traced = Pipeline(chain, tracer=Tracer())
+    start = time.perf_counter()
+    for _ in range(20):
+        await plain(1)
+    untraced_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(20):
+        await traced(1)
+    traced_time = time.perf_counter() - start
+    print(f"\n200-task chain x20: untraced={untraced_time * 1000:.1f}ms traced={traced_time * 1000:.1f}ms")
+    assert len(traced.tracer.spans) == 20 * 201
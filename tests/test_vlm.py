@@ -0,0 +1,129 @@
+import asyncio
+import importlib
+import sys
+import threading
+import types
+import pytest
+from pipelines import MemoryCache, Pipeline, Reject
+from mlq_pipelines.vlm_worker import VLMClient, VLMWorker, answer_stop
+
+class StubLlava:
+    """Stands in for scripts.llava_util (which needs torch): "cat" images pass every question."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def wait(self):
+        threading.Event().wait(self.delay)
+
+    def run_llava(self, model_path, conv_mode, query, images):
+        self.calls.append(("generate", images))
+        self.wait()
+        return "Yes" if "cat" in str(images) else "No"
+
+    def run_llava_batch(self, model_path, conv_mode, query, images_list):
+        self.calls.append(("generate_batch", list(images_list)))
+        return ["Yes" if "cat" in str(images) else "No" for images in images_list]
+
+    def run_llava_multi(self, model_path, conv_mode, queries, image_file, stop=None):
+        self.calls.append(("generate_many", image_file))
+        answers = []
+        for index, query in enumerate(queries):
+            answers.append("No" if "dog" in query and "cat" in str(image_file) else "Yes")
+            if stop is not None and stop(index, answers[-1]):
+                break
+        return answers
+
+    def score_llava(self, model_path, conv_mode, query, images_list, candidates=("Yes", "No")):
+        self.calls.append(("score", list(images_list)))
+        return [{"Yes": 0.9, "No": 0.1} if "cat" in str(images) else {"Yes": 0.1, "No": 0.9} for images in images_list]
+
+@pytest.fixture
+def llava(monkeypatch):
+    stub = StubLlava()
+    module = types.ModuleType("scripts.llava_util")
+    for name in ("run_llava", "run_llava_batch", "run_llava_multi", "score_llava"):
+        setattr(module, name, getattr(stub, name))
+    monkeypatch.setitem(sys.modules, "scripts.llava_util", module)
+    monkeypatch.delenv("VLM_WORKER_SOCKET", raising=False)
+    return stub
+
+@pytest.fixture
+def vlm(llava, monkeypatch):
+    # A fresh import per test: module-level schedulers and batchers belong to one event loop
+    monkeypatch.delitem(sys.modules, "mlq_pipelines.vlm", raising=False)
+    module = importlib.import_module("mlq_pipelines.vlm")
+    yield module
+    sys.modules.pop("mlq_pipelines.vlm", None)
+
+@pytest.mark.asyncio
+async def test_local_generate_runs_off_the_event_loop(vlm, llava):
+    llava.delay = 0.2
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.ensure_future(tick())
+    try:
+        result = await Pipeline(vlm.filter_vlm("Is this a cat?", threshold=None))("cat.png")
+    finally:
+        ticker.cancel()
+    assert result == "cat.png"
+    assert llava.calls == [("generate", "cat.png")]
+    # The loop kept running while the model call blocked its thread
+    assert len(ticks) > 5
+
+QUESTIONS = ["Is this a cat?", "Is this a dog?", "Is it outdoors?"]
+
+@pytest.mark.asyncio
+async def test_filter_vlm_many_stops_at_the_first_failing_question(vlm, llava):
+    pipeline = Pipeline(vlm.filter_vlm_many(QUESTIONS))
+    result = await pipeline("cat.png")
+    assert isinstance(result, Reject) and result.reason == "Is this a dog?"
+    assert await pipeline("dog.png") == "dog.png"
+    assert [op for op, _ in llava.calls] == ["generate_many", "generate_many"]
+
+class ManyBackend:
+    def __init__(self, llava):
+        self.llava = llava
+        self.calls = []
+
+    def generate_many(self, queries, image, expect_yes=None):
+        self.calls.append((list(queries), image, expect_yes))
+        return self.llava.run_llava_multi(None, None, queries, image, stop=answer_stop(expect_yes))
+
+@pytest.mark.asyncio
+async def test_filter_vlm_many_uses_the_worker_when_set(vlm, llava, tmp_path):
+    backend = ManyBackend(StubLlava())
+    worker = VLMWorker(backend, str(tmp_path / "vlm.sock"))
+    await worker.start()
+    client = VLMClient(worker.socket_path, timeout=5)
+    vlm.set_vlm_client(client)
+    try:
+        result = await Pipeline(vlm.filter_vlm_many(QUESTIONS))("cat.png")
+    finally:
+        await client.close()
+        await worker.close()
+    assert isinstance(result, Reject) and result.reason == "Is this a dog?"
+    assert len(backend.calls) == 1 and backend.calls[0][1:] == ("cat.png", True)
+    # Nothing ran on an in-process model
+    assert llava.calls == []
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_batch", [1, 4])
+async def test_cached_verdicts_return_the_current_image(vlm, llava, tmp_path, max_batch):
+    # Byte-identical files at different paths share a content-hash cache key
+    content = b"\x89PNG same bytes"
+    paths = []
+    for name in ("cat-a.png", "cat-b.png", "dog-a.png", "dog-b.png"):
+        (tmp_path / name).write_bytes(content if "cat" in name else content + b"dog")
+        paths.append(str(tmp_path / name))
+    pipeline = Pipeline(vlm.filter_vlm("Is this a cat?", max_batch=max_batch, cache=MemoryCache()))
+    cat_a, cat_b, dog_a, dog_b = [await pipeline(path) for path in paths]
+    assert (cat_a, cat_b) == (paths[0], paths[1])
+    assert isinstance(dog_a, Reject) and dog_a == dog_b
+    # One model call per distinct content
+    assert len(llava.calls) == 2
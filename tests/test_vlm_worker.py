@@ -0,0 +1,142 @@
+import asyncio
+import contextlib
+import os
+import threading
+import pytest
+from PIL import Image
+from mlq_pipelines.vlm_worker import VLMClient, VLMWorker, VLMWorkerError, start_worker
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class StubBackend:
+    """CPU stand-in for the VLM: answers "Yes" for images whose name contains "cat"."""
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.loaded = False
+        self.batches = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        self.loaded = True
+
+    def unload(self):
+        self.loaded = False
+
+    def call(self, images_list):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.load()
+        self.batches.append(list(images_list))
+        threading.Event().wait(self.delay)
+        with self.lock:
+            self.running -= 1
+
+    def generate(self, query, images_list, **options):
+        self.call(images_list)
+        if "fail" in query:
+            raise RuntimeError("model failure")
+        if "size" in query:
+            # In-memory images arrive decoded
+            return [f"{images.mode} {images.size} {images.getpixel((0, 0))}" for images in images_list]
+        return [("Yes" if "cat" in images else "No") + options.get("suffix", "") for images in images_list]
+
+    def score(self, query, images_list, candidates):
+        self.call(images_list)
+        return [{candidates[0]: 0.9 if "cat" in images else 0.1, candidates[1]: 0.1 if "cat" in images else 0.9}
+                for images in images_list]
+
+@contextlib.asynccontextmanager
+async def running_worker(tmp_path):
+    worker = VLMWorker(StubBackend(), str(tmp_path / "vlm.sock"), max_batch=4, max_wait_ms=20)
+    await worker.start()
+    client = VLMClient(worker.socket_path, timeout=5)
+    try:
+        yield worker, client
+    finally:
+        await client.close()
+        await worker.close()
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_batched(tmp_path):
+    async with running_worker(tmp_path) as (worker, client):
+        images = [f"{name}{i}.png" for i in range(4) for name in ("cat", "dog")]
+        answers = await asyncio.gather(*[client.generate("Is there a cat?", image) for image in images])
+        assert answers == ["Yes" if image.startswith("cat") else "No" for image in images]
+        assert sorted(len(batch) for batch in worker.backend.batches) == [4, 4]
+        assert worker.backend.max_running == 1
+        health = await client.health()
+        assert health["requests"] == 8 and health["batches"] == 2 and health["mean_batch"] == 4
+
+@pytest.mark.asyncio
+async def test_batches_are_split_by_query_and_options(tmp_path):
+    async with running_worker(tmp_path) as (worker, client):
+        answers = await asyncio.gather(
+            client.generate("q1", "cat.png"),
+            client.generate("q2", "cat.png"),
+            client.generate("q1", "cat.png", suffix="!"),
+            client.score("q1", "dog.png", candidates=("first", "second")),
+        )
+        assert answers[:3] == ["Yes", "Yes", "Yes!"]
+        assert answers[3] == {"first": 0.1, "second": 0.9}
+        assert len(worker.backend.batches) == 4
+
+@pytest.mark.asyncio
+async def test_errors_are_returned_per_request(tmp_path):
+    async with running_worker(tmp_path) as (worker, client):
+        with pytest.raises(VLMWorkerError, match="model failure"):
+            await client.generate("fail", "cat.png")
+        with pytest.raises(VLMWorkerError, match="Unknown op"):
+            await client.request("bogus")
+        assert await client.generate("ok", "cat.png") == "Yes"
+
+@pytest.mark.asyncio
+async def test_load_unload_and_health(tmp_path):
+    async with running_worker(tmp_path) as (worker, client):
+        assert (await client.health())["loaded"] is False
+        assert (await client.load())["loaded"] is True
+        assert (await client.unload())["loaded"] is False
+        assert (await client.health())["pid"] == os.getpid()
+
+@pytest.mark.asyncio
+async def test_client_reconnects_after_worker_restart(tmp_path):
+    async with running_worker(tmp_path) as (worker, client):
+        assert await client.generate("q", "cat.png") == "Yes"
+        await worker.close()
+        with pytest.raises((VLMWorkerError, ConnectionError, OSError)):
+            await client.generate("q", "cat.png")
+        await worker.start()
+        assert await client.generate("q", "dog.png") == "No"
+
+@pytest.mark.asyncio
+async def test_in_memory_images_are_passed_through_shared_memory(tmp_path):
+    class Generated:
+        image = Image.new("RGB", (3, 2), (10, 20, 30))
+
+    async with running_worker(tmp_path) as (worker, client):
+        answers = await asyncio.gather(
+            client.generate("size?", Image.new("RGB", (5, 4), (1, 2, 3))),
+            client.generate("size?", Generated()),
+        )
+        assert answers == ["RGB (5, 4) (1, 2, 3)", "RGB (3, 2) (10, 20, 30)"]
+        assert len(worker.backend.batches) == 1
+
+@pytest.mark.asyncio
+async def test_worker_process(tmp_path):
+    socket_path = str(tmp_path / "vlm.sock")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(TESTS_DIR), TESTS_DIR]))
+    process = start_worker(socket_path, backend="test_vlm_worker:StubBackend", max_batch=4, load=True, timeout=30, env=env)
+    client = VLMClient(socket_path, timeout=10)
+    try:
+        health = await client.health()
+        assert health["pid"] == process.pid and health["loaded"] is True
+        answers = await asyncio.gather(*[client.generate("Is there a cat?", f"cat{i}.png") for i in range(4)])
+        assert answers == ["Yes"] * 4
+        assert (await client.health())["batches"] == 1
+        assert await client.generate("size?", Image.new("RGB", (2, 2), (7, 8, 9))) == "RGB (2, 2) (7, 8, 9)"
+    finally:
+        await client.close()
+        process.terminate()
+        process.wait(timeout=10)